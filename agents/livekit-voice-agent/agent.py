@@ -12,18 +12,28 @@ import os
 os.environ.setdefault('HF_HOME', '/opt/render/project/src/.venv/hf_home')
 
 import aiohttp
+import array
 import asyncio
+import collections
+import contextlib
+import dataclasses
 import datetime
 import hashlib
 import hmac
 import json
 import logging
+import math
+import operator
 import os
 import random
 import re
+import sqlite3
+import struct
 import sys
+import tempfile
 import threading
 import time as time_module
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated
 
 # Load environment variables from .env files
@@ -77,6 +87,12 @@ def _build_turn_detector():
     except Exception as e:
         print(f"⚠️ Turn detector failed to initialize ({e}) — falling back to silence-based endpointing", flush=True)
         return None
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    _NUMPY_AVAILABLE = False
 from openai import NOT_GIVEN
 
 from supabase import create_client, Client
@@ -125,21 +141,202 @@ supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# supabase-py is synchronous — every .execute() is a blocking HTTP round-trip.
+# Calling it directly from a coroutine stalls the event loop that is also pumping
+# call audio (VAD/STT/TTS), so all DB access goes through db_execute(), which runs
+# the request on a small bounded thread pool. The underlying PostgREST httpx client
+# is shared by all threads and keeps its pooled keep-alive connections.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="supabase-db")
+
+
+async def db_execute(query):
+    """Run a Supabase query/RPC builder off the event loop and return its response.
+
+    Usage: response = await db_execute(supabase.table("x").select("*").eq("id", x_id))
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, query.execute)
+
+
+# One pooled aiohttp session per event loop (i.e. per job) for all outbound HTTP —
+# edge functions, SignalWire, webhooks, Slack, Cal.com, custom functions. Keep-alive
+# connections and the DNS cache are reused across requests instead of paying a fresh
+# TCP+TLS handshake each time.
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_CLOSE_GRACE_SECONDS = 10.0
+_http_sessions = {}  # event loop -> aiohttp.ClientSession
+_http_inflight = {}  # event loop -> number of open shared_http_session() blocks
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _http_sessions[loop] = session
+    return session
+
+
+@contextlib.asynccontextmanager
+async def shared_http_session():
+    """Drop-in for `async with aiohttp.ClientSession() as session` that borrows the shared
+    session instead of opening (and tearing down) a new connection pool."""
+    loop = asyncio.get_running_loop()
+    _http_inflight[loop] = _http_inflight.get(loop, 0) + 1
+    try:
+        yield get_http_session()
+    finally:
+        _http_inflight[loop] = max(0, _http_inflight.get(loop, 1) - 1)
+
+
+async def close_http_session():
+    """Close the current event loop's shared session (job shutdown).
+
+    Post-call fan-out (billing, webhooks, skills) may still be mid-request when the job
+    shuts down, so wait briefly for open blocks to finish before closing.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + HTTP_CLOSE_GRACE_SECONDS
+    while _http_inflight.get(loop, 0) > 0 and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    _http_inflight.pop(loop, None)
+    session = _http_sessions.pop(loop, None)
+    if session and not session.closed:
+        await session.close()
+
+
 # Module-level OpenAI client (reused across all async functions)
 openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Call state logs are buffered in-process and bulk-inserted in the background so
+# debugging breadcrumbs never sit on the critical path to the greeting.
+CALL_STATE_LOG_FLUSH_INTERVAL = float(os.getenv("CALL_STATE_LOG_FLUSH_INTERVAL", "1.0"))
+CALL_STATE_LOG_BATCH_SIZE = int(os.getenv("CALL_STATE_LOG_BATCH_SIZE", "50"))
+CALL_STATE_LOG_MAX_BUFFER = int(os.getenv("CALL_STATE_LOG_MAX_BUFFER", "1000"))
+
+
+class CallStateLogWriter:
+    """Buffered, batched writer for call_state_logs.
+
+    Rows are queued by enqueue() (non-blocking) and written with one bulk insert per
+    batch, either every flush_interval seconds or as soon as batch_size rows are waiting.
+    Under backpressure, debug_* rows are shed once the buffer is half full and only
+    error rows are kept (evicting the oldest row) once it is full. Call flush() on shutdown.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_buffer: int):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self._buffer = []
+        self._flush_task = None
+        self._wake = None
+        self._flush_lock = None
+        self.dropped = 0
+        self._dropped_reported = 0
+        self.written = 0
+
+    def enqueue(self, row: dict):
+        """Queue a row for the next bulk insert."""
+        buffered = len(self._buffer)
+        if buffered >= self.max_buffer // 2:
+            is_error = bool(row.get("error_message"))
+            if buffered >= self.max_buffer:
+                if not is_error:
+                    self.dropped += 1
+                    return
+                self._buffer.pop(0)
+                self.dropped += 1
+            elif str(row.get("state", "")).startswith("debug_") and not is_error:
+                self.dropped += 1
+                return
+
+        self._buffer.append(row)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (module import / sync context) — write inline as before
+            self._flush_sync()
+            return
+
+        if self._flush_task is None or self._flush_task.done() or self._flush_task.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flush_task = loop.create_task(self._run())
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _take_batch(self) -> list:
+        batch = self._buffer[:self.batch_size]
+        del self._buffer[:self.batch_size]
+        return batch
+
+    async def flush(self):
+        """Write everything currently buffered (bulk inserts of up to batch_size rows)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._take_batch()
+                try:
+                    await db_execute(supabase.table('call_state_logs').insert(batch))
+                    self.written += len(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.error(f"Failed to log call state ({len(batch)} rows): {e}")
+            if self.dropped > self._dropped_reported:
+                logger.warning(f"📝 Call state log writer dropped {self.dropped - self._dropped_reported} rows (backpressure/errors)")
+                self._dropped_reported = self.dropped
+
+    def _flush_sync(self):
+        while self._buffer:
+            batch = self._take_batch()
+            try:
+                supabase.table('call_state_logs').insert(batch).execute()
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"Failed to log call state ({len(batch)} rows): {e}")
+
+
+call_state_log_writer = CallStateLogWriter(CALL_STATE_LOG_FLUSH_INTERVAL, CALL_STATE_LOG_BATCH_SIZE, CALL_STATE_LOG_MAX_BUFFER)
+
+
 # Helper function to log call state to database
 def log_call_state(room_name: str, state: str, component: str = 'agent', details: dict = None, error_message: str = None):
-    """Log call state to database for debugging"""
+    """Log call state to database for debugging (buffered; written in background batches)"""
     try:
-        supabase.table('call_state_logs').insert({
+        call_state_log_writer.enqueue({
             'call_id': None,  # Will be looked up by room_name if needed
             'room_name': room_name,
             'state': state,
             'component': component,
             'details': details,
             'error_message': error_message,
-        }).execute()
+            # Stamped here so batching doesn't collapse ordering to the flush time
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        })
     except Exception as e:
         logger.error(f"Failed to log call state: {e}")
         # Don't raise - logging should never break the call flow
@@ -178,6 +375,299 @@ livekit_api_key = os.getenv("LIVEKIT_API_KEY")
 livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
 
 
+# ============================================
+# Local SQLite Stores
+# ============================================
+
+def _create_private_file(path: str):
+    """Create `path` (and tighten an existing one and its SQLite -wal/-shm files) to mode 0600."""
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    for file_path in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(file_path):
+            os.chmod(file_path, 0o600)
+
+
+class SQLiteStore:
+    """Base for the host-local SQLite files shared by the worker and its job processes.
+
+    LiveKit runs each job in its own short-lived process, so anything meant to outlive a
+    call lives in a file on the host. Subclasses list their CREATE statements in _SCHEMA
+    and keep their blocking work in *_sync methods that open a connection with _connect()
+    per operation (WAL mode, so readers never block the writer). The file is private to
+    the owner (mode 0600) and deleted content is zeroed. _run() moves a *_sync call off
+    the event loop and treats any storage error as None.
+    """
+
+    _SCHEMA = ()
+    _TIMEOUT = 5.0  # seconds to wait on another process's write lock
+    _ROW_FACTORY = None
+    _LABEL = "SQLite store"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            _create_private_file(self.path)
+        conn = sqlite3.connect(self.path, timeout=self._TIMEOUT, isolation_level=None)
+        if self._ROW_FACTORY is not None:
+            conn.row_factory = self._ROW_FACTORY
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA secure_delete=ON")
+        if not self._schema_ready:
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            self._schema_ready = True
+        return conn
+
+    async def _run(self, fn, *args):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            logger.warning(f"{self._LABEL} unavailable ({self.path}): {e}")
+            return None
+
+
+# ============================================
+# Agent Config Cache
+# ============================================
+
+AGENT_CONFIG_CACHE_TTL = float(os.getenv("AGENT_CONFIG_CACHE_TTL", "600"))
+AGENT_CONFIG_REVALIDATE_SECONDS = float(os.getenv("AGENT_CONFIG_REVALIDATE_SECONDS", "5"))
+AGENT_CONFIG_CACHE_PATH = os.getenv("AGENT_CONFIG_CACHE_PATH", os.path.join(tempfile.gettempdir(), "magpipe-agent-config-cache.db"))
+
+
+class AgentConfigCache(SQLiteStore):
+    """Host-wide cache of rarely-changing per-agent configuration.
+
+    Everything loaded for an agent (agent_configs row, voice, dynamic variables, custom
+    functions, transfer numbers, SMS templates/number, Cal.com connection) is stored under
+    its agent_id and tagged with agent_configs.config_version. Database triggers bump that
+    version whenever the agent or any related row changes, so a repeat call only pays one
+    primary-key lookup to confirm the entry is still current. Entries older than the TTL
+    are dropped regardless of version.
+
+    Values are stored as JSON, which also keeps per-call mutations from leaking between
+    calls. Any storage error is treated as a miss.
+
+    Secrets never reach the file: custom function header values (typically
+    third-party API credentials) are dropped and re-read by get_custom_functions, and the
+    unused transfer_secret columns are left out.
+    """
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS agent_config_versions (
+            agent_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            loaded_at REAL NOT NULL,
+            checked_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS agent_config_items (
+            agent_id TEXT NOT NULL,
+            item TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (agent_id, item)
+        )
+        """,
+    )
+    _LABEL = "⚙️ Config cache"
+    _SECRET_COLUMNS = ("transfer_secret",)
+
+    def __init__(self, path: str, ttl: float, revalidate_seconds: float):
+        super().__init__(path)
+        self.ttl = ttl
+        self.revalidate_seconds = revalidate_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def _dumps(cls, item: str, value) -> str:
+        """JSON for the cache file, without secrets."""
+        def _public(row):
+            if not isinstance(row, dict):
+                return row
+            row = {k: v for k, v in row.items() if k not in cls._SECRET_COLUMNS}
+            if item == "custom_functions" and row.get("headers"):
+                row["headers"] = [{k: v for k, v in h.items() if k != "value"} for h in row["headers"] if isinstance(h, dict)]
+            return row
+        return json.dumps([_public(row) for row in value] if isinstance(value, list) else _public(value), default=str)
+
+    def _entry_sync(self, key: str):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT version, loaded_at, checked_at FROM agent_config_versions WHERE agent_id = ?", (key,)
+            ).fetchone()
+
+    def _drop_sync(self, key: str = None):
+        with contextlib.closing(self._connect()) as conn:
+            if key is None:
+                conn.execute("DELETE FROM agent_config_versions")
+                conn.execute("DELETE FROM agent_config_items")
+            else:
+                conn.execute("DELETE FROM agent_config_versions WHERE agent_id = ?", (key,))
+                conn.execute("DELETE FROM agent_config_items WHERE agent_id = ?", (key,))
+
+    def _touch_sync(self, key: str, checked_at: float):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("UPDATE agent_config_versions SET checked_at = ? WHERE agent_id = ?", (checked_at, key))
+
+    def _start_entry_sync(self, key: str, version, items: dict):
+        """Start a fresh entry for the agent (replacing any stale items) and store `items`."""
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM agent_config_items WHERE agent_id = ?", (key,))
+                # Expired entries of other agents are only dropped here
+                conn.execute(
+                    "DELETE FROM agent_config_items WHERE agent_id IN (SELECT agent_id FROM agent_config_versions WHERE loaded_at <= ?)",
+                    (now - self.ttl,),
+                )
+                conn.execute("DELETE FROM agent_config_versions WHERE loaded_at <= ?", (now - self.ttl,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO agent_config_versions (agent_id, version, loaded_at, checked_at) VALUES (?, ?, ?, ?)",
+                    (key, version, now, now),
+                )
+                for item, value in items.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO agent_config_items (agent_id, item, value) VALUES (?, ?, ?)",
+                        (key, item, self._dumps(item, value)),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _get_item_sync(self, key: str, item: str):
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT i.value FROM agent_config_items i JOIN agent_config_versions v ON v.agent_id = i.agent_id "
+                "WHERE i.agent_id = ? AND i.item = ? AND v.loaded_at > ?",
+                (key, item, time_module.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _put_item_sync(self, key: str, item: str, value) -> bool:
+        with contextlib.closing(self._connect()) as conn:
+            # Only attach items to a live entry (the agent row carries the version tag)
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO agent_config_items (agent_id, item, value) "
+                "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM agent_config_versions WHERE agent_id = ?)",
+                (key, item, self._dumps(item, value), key),
+            )
+            return cursor.rowcount > 0
+
+    def invalidate(self, agent_id: str = None):
+        """Drop one agent's cached config, or all of it when agent_id is None."""
+        try:
+            self._drop_sync(str(agent_id) if agent_id is not None else None)
+        except Exception as e:
+            logger.warning(f"⚙️ Config cache invalidation failed: {e}")
+
+    async def validate(self, agent_id: str, known_version: int = None):
+        """Drop the agent's entry if it expired or its config_version changed.
+
+        Pass known_version when the caller already has the current version (saves the lookup).
+        """
+        key = str(agent_id)
+        entry = await self._run(self._entry_sync, key)
+        if not entry:
+            return
+        version, loaded_at, checked_at = entry
+
+        now = time_module.time()
+        if now - loaded_at > self.ttl:
+            await self._run(self._drop_sync, key)
+            logger.info(f"⚙️ Config cache expired for agent {key}")
+            return
+
+        if known_version is None:
+            if now - checked_at < self.revalidate_seconds:
+                return
+            try:
+                response = await db_execute(
+                    supabase.table("agent_configs")
+                    .select("config_version")
+                    .eq("id", key)
+                    .limit(1)
+                )
+                known_version = response.data[0].get("config_version") if response.data else None
+            except Exception as e:
+                logger.warning(f"⚙️ Config version check failed for agent {key}: {e}")
+
+        if known_version is None or known_version != version:
+            await self._run(self._drop_sync, key)
+            logger.info(f"⚙️ Config changed for agent {key} (v{version} -> v{known_version}) - cache invalidated")
+        else:
+            await self._run(self._touch_sync, key, now)
+
+    async def prime(self, agent_row: dict):
+        """Seed the agent's entry from an agent_configs row fetched elsewhere (e.g. the inbound call bundle).
+
+        Also revalidates an existing entry against the row's config_version, so the next
+        get_user_config() is served from cache without a version lookup.
+        """
+        agent_id = agent_row.get("id") if agent_row else None
+        version = agent_row.get("config_version") if agent_row else None
+        if not agent_id or version is None:
+            return
+
+        key = str(agent_id)
+        await self.validate(key, known_version=version)
+        if not await self._run(self._entry_sync, key):
+            await self._run(self._start_entry_sync, key, version, {"agent": agent_row})
+
+    async def peek(self, agent_id: str, item: str):
+        """The cached item for the agent, or None (no loader; doesn't count as a hit or miss)."""
+        if not agent_id:
+            return None
+        cached = await self._run(self._get_item_sync, str(agent_id), item)
+        return json.loads(cached) if cached is not None else None
+
+    async def put(self, agent_id: str, item: str, value):
+        """Store an item under the agent's live entry (ignored if the agent row isn't cached)."""
+        if agent_id and value is not None:
+            await self._run(self._put_item_sync, str(agent_id), item, value)
+
+    async def get(self, agent_id: str, item: str, loader):
+        """Return a cached config item for the agent, calling `await loader()` on a miss.
+
+        None results and loader exceptions are not cached.
+        """
+        if not agent_id:
+            return await loader()
+
+        key = str(agent_id)
+        cached = await self._run(self._get_item_sync, key, item)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+
+        self.misses += 1
+        value = await loader()
+        if value is None:
+            return value
+
+        if item == "agent":
+            version = value.get("config_version") if isinstance(value, dict) else None
+            if version is None:
+                # agent_configs.config_version not available; we couldn't invalidate, so don't cache
+                return value
+            await self._run(self._start_entry_sync, key, version, {"agent": value})
+        else:
+            # Attached only if the agent's entry exists — nothing is cached before the version tag
+            await self._run(self._put_item_sync, key, item, value)
+        return value
+
+
+agent_config_cache = AgentConfigCache(AGENT_CONFIG_CACHE_PATH, AGENT_CONFIG_CACHE_TTL, AGENT_CONFIG_REVALIDATE_SECONDS)
+
+
 async def get_user_config(room_metadata: dict) -> dict:
     """Fetch user's agent configuration from Supabase.
 
@@ -197,17 +687,24 @@ async def get_user_config(room_metadata: dict) -> dict:
         return None
 
     try:
-        # Fetch agent by ID only - agent_id is already unique
-        # This allows system agent (owned by admin) to work for any user's numbers
-        response = supabase.table("agent_configs") \
-            .select("*") \
-            .eq("id", agent_id) \
-            .limit(1) \
-            .execute()
+        # Drop the cached config first if the agent (or anything it depends on) changed
+        await agent_config_cache.validate(agent_id)
+
+        async def _load_agent():
+            # Fetch agent by ID only - agent_id is already unique
+            # This allows system agent (owned by admin) to work for any user's numbers
+            response = await db_execute(
+                supabase.table("agent_configs")
+                .select("*")
+                .eq("id", agent_id)
+                .limit(1)
+            )
+            return response.data[0] if response.data else None
 
-        if response.data and len(response.data) > 0:
-            logger.info(f"Using agent: {response.data[0].get('name')} (id: {agent_id})")
-            return response.data[0]
+        agent_row = await agent_config_cache.get(agent_id, "agent", _load_agent)
+        if agent_row:
+            logger.info(f"Using agent: {agent_row.get('name')} (id: {agent_id})")
+            return agent_row
 
         logger.warning(f"Agent {agent_id} not found")
         return None
@@ -216,6 +713,274 @@ async def get_user_config(room_metadata: dict) -> dict:
         return None
 
 
+def get_sip_caller_phone(room) -> str:
+    """Extract the caller's phone number (E.164) from the first remote SIP participant, or None."""
+    for participant in room.remote_participants.values():
+        attrs = participant.attributes
+        # Try various SIP attribute names for caller number
+        sip_phone = (
+            attrs.get("sip.remoteUri") or
+            attrs.get("sip.from") or
+            attrs.get("sip.caller") or
+            participant.identity
+        )
+        if sip_phone:
+            # Clean up SIP URI/identity format to get phone number
+            # Formats: "sip:+16041234567@...", "sip_+16041234567", "+16041234567"
+            if sip_phone.startswith("sip:"):
+                sip_phone = sip_phone[4:]
+            if sip_phone.startswith("sip_"):
+                sip_phone = sip_phone[4:]
+            if "@" in sip_phone:
+                sip_phone = sip_phone.split("@")[0]
+            # Ensure it starts with + for E.164 format
+            if sip_phone and not sip_phone.startswith("+"):
+                sip_phone = "+" + sip_phone
+            return sip_phone
+    return None
+
+
+async def get_inbound_call_context(service_number: str, call_sid: str, room_name: str, caller_number: str = None) -> dict:
+    """Resolve the whole inbound call context in one round-trip (get_inbound_call_context RPC).
+
+    Covers the service_numbers/external_sip_numbers lookup with default/any-active agent
+    fallbacks, the Twilio call_record insert, early call_record_id, the recent-call direction
+    lookup with agent correction, and the final agent_configs row (which primes the config cache).
+    Returns None if the RPC is unavailable or fails — the caller falls back to the step-by-step lookups.
+    """
+    try:
+        response = await db_execute(
+            supabase.rpc("get_inbound_call_context", {
+                "p_trunk_number": service_number,
+                "p_call_sid": call_sid,
+                "p_room_name": room_name,
+                "p_caller_number": caller_number,
+            })
+        )
+        bundle = response.data
+        if isinstance(bundle, list):
+            bundle = bundle[0] if bundle else None
+        if not isinstance(bundle, dict):
+            logger.warning(f"📦 Inbound call context RPC returned no data for {service_number}")
+            return None
+
+        agent_row = bundle.get("agent_config")
+        if agent_row:
+            await agent_config_cache.prime(agent_row)
+
+        logger.info(f"📦 Inbound call context resolved in one round-trip: user_id={bundle.get('user_id')}, "
+                    f"agent_id={(agent_row or {}).get('id')}, source={bundle.get('number_source')}, "
+                    f"call_record_id={bundle.get('call_record_id')}")
+        return bundle
+    except Exception as e:
+        logger.warning(f"📦 Inbound call context RPC failed, using step-by-step lookups: {e}")
+        return None
+
+
+# ============================================
+# TTS Audio Cache
+# ============================================
+
+TTS_AUDIO_CACHE_DIR = os.getenv("TTS_AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "magpipe-tts-cache"))
+TTS_AUDIO_CACHE_MEMORY_MB = float(os.getenv("TTS_AUDIO_CACHE_MEMORY_MB", "32"))
+TTS_AUDIO_CACHE_DISK_MB = float(os.getenv("TTS_AUDIO_CACHE_DISK_MB", "512"))
+
+# Fixed phrases spoken verbatim by the agent (cached on first use, not second)
+ADMIN_LOCKED_MESSAGE = "Your admin access is currently locked due to too many failed attempts. Please reset your access code via the web application."
+ADMIN_ACCESS_CODE_PROMPT = "Please say your access code, one digit at a time."
+ADMIN_ACCESS_GRANTED_MESSAGE = "Access granted. You are now in admin mode. How can I help you configure your assistant?"
+ADMIN_NOW_LOCKED_MESSAGE = "Too many failed attempts. Your admin access has been locked. Please reset your access code via the web application."
+ADMIN_INCORRECT_CODE_MESSAGE = "Incorrect access code. Proceeding as a regular call."
+ADMIN_NO_CODE_MESSAGE = "No access code provided. Proceeding as a regular call."
+NUMBER_NOT_ASSIGNED_MESSAGE = "This number is not currently assigned. Go to Magpipe.ai to assign your number."
+
+# Voice used for system messages on unassigned numbers (speak_error_and_disconnect)
+SYSTEM_MESSAGE_TTS_PROFILE = {"voice_id": "EXAVITQu4vr4xnSDxMaL", "model": "eleven_flash_v2_5", "voice_settings": None}
+
+
+class TTSAudioCache:
+    """Pre-synthesized audio for phrases the agent speaks verbatim (greetings, fillers, system messages).
+
+    Entries are keyed by (voice_id, model, voice settings, text) and hold rendered 16-bit PCM.
+    They live in a per-process in-memory LRU and on local disk, where every worker process on
+    the host shares them (LRU by access time). Cached audio is handed to session.say(audio=...)
+    so no TTS request is made. Misses are synthesized in the background for next time; ordinary
+    text only once it has been requested twice, so one-off personalised greetings cost nothing extra.
+    """
+
+    _HEADER = struct.Struct("<II")  # sample_rate, num_channels
+
+    def __init__(self, cache_dir: str, memory_bytes: int, disk_bytes: int):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = collections.OrderedDict()  # key -> (sample_rate, num_channels, pcm)
+        self._memory_size = 0
+        self._pending = set()  # keys being synthesized in the background
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(tts_profile: dict, text: str) -> str:
+        settings = tts_profile.get("voice_settings")
+        if dataclasses.is_dataclass(settings):
+            settings = dataclasses.asdict(settings)
+        raw = json.dumps([tts_profile.get("voice_id"), tts_profile.get("model"), settings, text], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key: str, suffix: str = ".pcm") -> str:
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def _remember(self, key: str, entry: tuple):
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key)[2])
+        self._memory[key] = entry
+        self._memory_size += len(entry[2])
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted[2])
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                sample_rate, num_channels = self._HEADER.unpack(f.read(self._HEADER.size))
+                pcm = f.read()
+            os.utime(path)  # LRU by access time
+            return sample_rate, num_channels, pcm
+        except (OSError, struct.error):
+            return None
+
+    def _write_disk(self, key: str, entry: tuple):
+        if self.disk_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(key, f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(self._HEADER.pack(entry[0], entry[1]))
+                f.write(entry[2])
+            os.replace(tmp_path, self._path(key))
+
+            files = []
+            stale_marker_cutoff = time_module.time() - 7 * 86400
+            for name in os.listdir(self.cache_dir):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                if name.endswith(".pcm"):
+                    files.append((stat.st_mtime, stat.st_size, name))
+                elif name.endswith(".seen") and stat.st_mtime < stale_marker_cutoff:
+                    os.remove(os.path.join(self.cache_dir, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.disk_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+        except OSError as e:
+            logger.warning(f"🔊 TTS audio cache disk write failed: {e}")
+
+    def _seen_before(self, key: str) -> bool:
+        """Record a request for this text; True if it was requested before."""
+        marker = self._path(key, ".seen")
+        if os.path.exists(marker):
+            return True
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            open(marker, "a").close()
+        except OSError:
+            pass
+        return False
+
+    def cached_audio(self, tts_profile: dict, text: str):
+        """Async iterator of audio frames if the phrase is in memory, else None (no I/O)."""
+        key = self.key_for(tts_profile, text)
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        self.hits += 1
+        return self._iter_frames(*entry)
+
+    async def prepare(self, tts, tts_profile: dict, text: str, always: bool = False) -> bool:
+        """Load the phrase from disk into memory; on a miss, schedule background synthesis.
+
+        always=True caches fixed phrases on first use. Returns True if audio is ready to play.
+        """
+        if not text:
+            return False
+        key = self.key_for(tts_profile, text)
+        if key in self._memory:
+            return True
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is not None:
+            self._remember(key, entry)
+            return True
+
+        self.misses += 1
+        if key not in self._pending and (always or await asyncio.to_thread(self._seen_before, key)):
+            self._pending.add(key)
+            asyncio.create_task(self._synthesize(tts, key, text))
+        return False
+
+    async def warm(self, tts, tts_profile: dict, texts: list):
+        """Make fixed phrases (e.g. THINKING_FILLERS) available for cached_audio()."""
+        for text in texts:
+            await self.prepare(tts, tts_profile, text, always=True)
+
+    async def _synthesize(self, tts, key: str, text: str):
+        try:
+            frames = []
+            stream = tts.synthesize(text)
+            try:
+                async for event in stream:
+                    frames.append(event.frame)
+            finally:
+                await stream.aclose()
+            if not frames:
+                return
+            combined = rtc.combine_audio_frames(frames)
+            entry = (combined.sample_rate, combined.num_channels, combined.data.tobytes())
+            self._remember(key, entry)
+            await asyncio.to_thread(self._write_disk, key, entry)
+            logger.info(f"🔊 Cached TTS audio for '{text[:40]}' ({len(entry[2]) // 1024}KB)")
+        except Exception as e:
+            logger.warning(f"🔊 TTS audio cache synthesis failed for '{text[:40]}': {e}")
+        finally:
+            self._pending.discard(key)
+
+    @staticmethod
+    async def _iter_frames(sample_rate: int, num_channels: int, pcm: bytes):
+        chunk_bytes = (sample_rate // 10) * num_channels * 2  # 100ms of 16-bit PCM
+        for offset in range(0, len(pcm), chunk_bytes):
+            data = pcm[offset:offset + chunk_bytes]
+            yield rtc.AudioFrame(
+                data=data,
+                sample_rate=sample_rate,
+                num_channels=num_channels,
+                samples_per_channel=len(data) // (2 * num_channels),
+            )
+
+
+tts_audio_cache = TTSAudioCache(
+    TTS_AUDIO_CACHE_DIR,
+    int(TTS_AUDIO_CACHE_MEMORY_MB * 1024 * 1024),
+    int(TTS_AUDIO_CACHE_DISK_MB * 1024 * 1024),
+)
+
+
+def say_with_cache(session, text: str, tts_profile: dict, **say_kwargs):
+    """session.say() that plays pre-synthesized audio when the phrase is cached in memory.
+
+    Synchronous like session.say() (returns its SpeechHandle); call tts_audio_cache.prepare()
+    first to pull the phrase in from disk.
+    """
+    audio = tts_audio_cache.cached_audio(tts_profile, text) if text else None
+    if audio is not None:
+        logger.info(f"🔊 Playing cached audio: '{text[:40]}'")
+        return session.say(text, audio=audio, **say_kwargs)
+    return session.say(text, **say_kwargs)
+
+
 async def speak_error_and_disconnect(ctx: JobContext, message: str):
     """Create a minimal session to speak an error message and disconnect."""
     try:
@@ -234,7 +999,7 @@ async def speak_error_and_disconnect(ctx: JobContext, message: str):
 
         # Create minimal TTS-only session
         error_session = AgentSession(
-            vad=silero.VAD.load(),
+            vad=get_shared_vad(getattr(ctx, "proc", None)),
             stt=deepgram.STT(model="nova-2-phonecall", language="en-US"),
             llm=lkopenai.LLM(model="gpt-4o-mini"),
             tts=elevenlabs.TTS(
@@ -254,8 +1019,9 @@ async def speak_error_and_disconnect(ctx: JobContext, message: str):
         # Wait for participant to be subscribed
         await asyncio.sleep(1)
 
-        # Speak the error message
-        await error_session.say(message, allow_interruptions=False)
+        # Speak the error message (pre-synthesized audio when cached)
+        await tts_audio_cache.prepare(error_session.tts, SYSTEM_MESSAGE_TTS_PROFILE, message, always=True)
+        await say_with_cache(error_session, message, SYSTEM_MESSAGE_TTS_PROFILE, allow_interruptions=False)
         logger.info(f"📢 Spoke error message")
 
         # Wait for message to complete before disconnecting
@@ -283,22 +1049,27 @@ async def speak_error_and_disconnect(ctx: JobContext, message: str):
             pass
 
 
-async def get_voice_config(voice_id: str, user_id: str) -> dict:
-    """Fetch voice configuration from database"""
+async def get_voice_config(voice_id: str, user_id: str, agent_id: str = None) -> dict:
+    """Fetch voice configuration from database (cached per agent when agent_id is given)"""
     try:
         # Remove '11labs-' prefix if present
         clean_voice_id = voice_id.replace("11labs-", "")
 
         # Try to get custom voice config
-        response = supabase.table("voices") \
-            .select("*") \
-            .eq("voice_id", clean_voice_id) \
-            .eq("user_id", user_id) \
-            .limit(1) \
-            .execute()
+        async def _load_voice():
+            response = await db_execute(
+                supabase.table("voices")
+                .select("*")
+                .eq("voice_id", clean_voice_id)
+                .eq("user_id", user_id)
+                .limit(1)
+            )
+            return response.data or []
 
-        if response.data and len(response.data) > 0:
-            voice_data = response.data[0]
+        voice_rows = await agent_config_cache.get(agent_id, f"voice:{clean_voice_id}", _load_voice)
+
+        if voice_rows:
+            voice_data = voice_rows[0]
             return {
                 "voice_id": clean_voice_id,
                 "is_cloned": bool(voice_data.get("is_cloned", False)),
@@ -331,12 +1102,15 @@ async def get_voice_config(voice_id: str, user_id: str) -> dict:
 async def get_dynamic_variables(agent_id: str, user_id: str) -> list:
     """Fetch dynamic variable definitions for extraction"""
     try:
-        response = supabase.table("dynamic_variables") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .execute()
+        async def _load_variables():
+            response = await db_execute(
+                supabase.table("dynamic_variables")
+                .select("*")
+                .eq("user_id", user_id)
+            )
+            return response.data or []
 
-        variables = response.data or []
+        variables = await agent_config_cache.get(agent_id, "dynamic_variables", _load_variables)
         # Filter by agent_id if set, or include variables with no agent_id (global)
         if agent_id:
             variables = [v for v in variables if v.get("agent_id") is None or v.get("agent_id") == agent_id]
@@ -348,6 +1122,27 @@ async def get_dynamic_variables(agent_id: str, user_id: str) -> list:
         return []
 
 
+SPOKEN_VALUE_NORMALIZATION_RULES = """IMPORTANT: This transcript comes from speech-to-text, so values may be spoken out loud rather than formatted properly. You MUST normalize them:
+- Email addresses: "john at gmail dot com" → "john@gmail.com", "jane dot doe at company dot co" → "jane.doe@company.co"
+- URLs: "w w w dot example dot com" → "www.example.com"
+- Phone numbers: "six zero four five five five one two three four" → "6045551234"
+- Spelled-out words: "dash" → "-", "underscore" → "_", "at sign" or "at" (in email context) → "@", "dot" (in email/URL context) → "."
+- Names: Capitalize properly ("john smith" → "John Smith")
+Always return the properly formatted version, never the spoken-out version."""
+
+# General-purpose fields extracted when no dynamic variables are configured
+DEFAULT_EXTRACTION_FIELDS = {
+    "caller_name": "The caller's full name",
+    "email": "Email address mentioned",
+    "phone": "Phone number mentioned (other than the one they called from)",
+    "company": "Company or organization name",
+    "reason": "Brief reason for the call (1 sentence)",
+    "action_items": "List of follow-up actions discussed",
+    "appointment_date": "Any date/time mentioned for a meeting or callback",
+    "sentiment": "Overall caller sentiment (positive, neutral, negative)",
+}
+
+
 async def extract_data_from_transcript(transcript_text: str, dynamic_variables: list) -> dict:
     """Use OpenAI to extract structured data from transcript based on variable definitions.
     Falls back to general-purpose extraction when no dynamic variables are configured."""
@@ -372,13 +1167,7 @@ async def extract_data_from_transcript(transcript_text: str, dynamic_variables:
 For each variable, provide a value based on what was discussed in the call.
 If a value cannot be determined from the transcript, use null.
 
-IMPORTANT: This transcript comes from speech-to-text, so values may be spoken out loud rather than formatted properly. You MUST normalize them:
-- Email addresses: "john at gmail dot com" → "john@gmail.com", "jane dot doe at company dot co" → "jane.doe@company.co"
-- URLs: "w w w dot example dot com" → "www.example.com"
-- Phone numbers: "six zero four five five five one two three four" → "6045551234"
-- Spelled-out words: "dash" → "-", "underscore" → "_", "at sign" or "at" (in email context) → "@", "dot" (in email/URL context) → "."
-- Names: Capitalize properly ("john smith" → "John Smith")
-Always return the properly formatted version, never the spoken-out version.
+{SPOKEN_VALUE_NORMALIZATION_RULES}
 
 Variables to extract:
 {json.dumps(variables_schema, indent=2)}
@@ -398,23 +1187,10 @@ For text variables, use a string value."""
             prompt = f"""Analyze this phone call transcript and extract any relevant structured data.
 Extract ONLY fields that are clearly mentioned or discussed in the call. Omit fields with no information.
 
-IMPORTANT: This transcript comes from speech-to-text, so values may be spoken out loud rather than formatted properly. You MUST normalize them:
-- Email addresses: "john at gmail dot com" → "john@gmail.com", "jane dot doe at company dot co" → "jane.doe@company.co"
-- URLs: "w w w dot example dot com" → "www.example.com"
-- Phone numbers: "six zero four five five five one two three four" → "6045551234"
-- Spelled-out words: "dash" → "-", "underscore" → "_", "at sign" or "at" (in email context) → "@", "dot" (in email/URL context) → "."
-- Names: Capitalize properly ("john smith" → "John Smith")
-Always return the properly formatted version, never the spoken-out version.
+{SPOKEN_VALUE_NORMALIZATION_RULES}
 
 Common fields to look for (include only if present):
-- caller_name: The caller's full name
-- email: Email address mentioned
-- phone: Phone number mentioned (other than the one they called from)
-- company: Company or organization name
-- reason: Brief reason for the call (1 sentence)
-- action_items: List of follow-up actions discussed
-- appointment_date: Any date/time mentioned for a meeting or callback
-- sentiment: Overall caller sentiment (positive, neutral, negative)
+{chr(10).join(f"- {name}: {description}" for name, description in DEFAULT_EXTRACTION_FIELDS.items())}
 
 Transcript:
 {transcript_text}
@@ -472,19 +1248,164 @@ Provide only the 3-sentence summary, no additional text."""
         return ""
 
 
-async def redact_pii(text: str) -> str:
-    """Redact PII from text using OpenAI. Fails open (returns original on error)."""
-    if not text or not text.strip():
-        return text
+# ============================================
+# Local PII Redaction
+# ============================================
 
-    try:
-        client = openai_client
+# Spoken forms of digits as they come out of speech-to-text
+SPOKEN_DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "o": "0",
+    "one": "1", "won": "1",
+    "two": "2", "to": "2", "too": "2",
+    "three": "3", "tree": "3",
+    "four": "4", "for": "4", "fore": "4",
+    "five": "5",
+    "six": "6", "sicks": "6",
+    "seven": "7",
+    "eight": "8", "ate": "8",
+    "nine": "9", "niner": "9",
+}
+
+PII_PLACEHOLDER = "[REDACTED]"
+# collect_caller_data types whose value is PII in its entirety
+PII_WHOLE_VALUE_DATA_TYPES = {
+    "name", "first_name", "last_name", "full_name", "caller_name", "contact_name",
+    "address", "street_address", "home_address", "mailing_address", "caller_address",
+}
+
+_SPOKEN_DIGIT = r"(?:" + "|".join(sorted(SPOKEN_DIGIT_WORDS, key=len, reverse=True)) + r"|\d+)"
+_MONTH = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DATE_WITH_YEAR = (
+    r"(?:\d{1,2}[/.-]\d{1,2}[/.-](?P<y1>(?:19|20)?\d{2})"
+    r"|(?P<y2>(?:19|20)\d{2})-\d{1,2}-\d{1,2}"
+    r"|" + _MONTH + r"\s+\d{1,2}(?:st|nd|rd|th)?,?\s+(?P<y3>(?:19|20)\d{2})"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r",?\s+(?P<y4>(?:19|20)\d{2}))"
+)
+_DATE_ANY = (
+    r"(?:\d{1,2}[/.-]\d{1,2}(?:[/.-](?:19|20)?\d{2})?"
+    r"|" + _MONTH + r"\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+(?:19|20)\d{2})?"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"(?:,?\s+(?:19|20)\d{2})?)"
+)
 
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "system",
-                "content": """You are a PII redaction tool. Replace all personally identifiable information in the text with [REDACTED].
+_PII_EMAIL_RE = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+_PII_SPOKEN_EMAIL_RE = re.compile(r"\b[\w.-]+(?:\s+dot\s+[\w-]+)*\s+at\s+[\w-]+(?:\s+dot\s+[\w-]+)+\b", re.IGNORECASE)
+_PII_SSN_RE = re.compile(r"\b\d{3}[- .]\d{2}[- .]\d{4}\b")
+_PII_BIRTH_DATE_RE = re.compile(r"(?i:\b(?:born(?:\s+on)?|birth\s*day(?:\s+is)?|date\s+of\s+birth(?:\s+is)?|d\.?o\.?b\.?(?:\s+is)?)\s*:?\s*)(" + _DATE_ANY + r")\b", re.IGNORECASE)
+_PII_DATE_RE = re.compile(r"\b" + _DATE_WITH_YEAR + r"\b", re.IGNORECASE)
+_PII_SPOKEN_DIGITS_RE = re.compile(r"\b" + _SPOKEN_DIGIT + r"(?:[\s,.-]+" + _SPOKEN_DIGIT + r"\b){5,}", re.IGNORECASE)
+_PII_DIGIT_RUN_RE = re.compile(r"(?<![\w])\+?\(?\d(?:[\s().-]{0,2}\d){6,}(?![\w])")
+_PII_POSTAL_CODE_RE = re.compile(r"\b[A-Z]\d[A-Z]\s?\d[A-Z]\d\b")
+# Names and addresses can't be found by pattern; these decide whether text provably has none.
+# Text is only treated as name/address-free when it is properly cased (so a capitalized word
+# after the first of a sentence stands out), has no name or address cue and no house number.
+_PII_SPEAKER_LABEL_RE = re.compile(r"^[^\S\n]*[^:\n]{1,40}:[^\S\n]*", re.MULTILINE)
+_PII_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_PII_CASE_SAFE_WORDS = {"I", "I'm", "I'll", "I've", "I'd", "OK", "Okay"}
+_PII_NAME_CUE_RE = re.compile(
+    r"\b(?:my\s+name\s+is|my\s+name's|name\s+is|this\s+is|i\s+am|i'm|call\s+me|speaking\s+with|ask\s+for|it's)\s+\w"
+    r"|\bspell(?:ed|ing)?\b",
+    re.IGNORECASE,
+)
+_PII_ADDRESS_CUE_RE = re.compile(
+    r"\b(?:address|apartment|apt|suite|unit|zip|postal|live[sd]?|living|located|street|avenue|road|boulevard|drive|lane|court|crescent|highway)\b"
+    r"|\b\d+\s+[A-Za-z]",
+    re.IGNORECASE,
+)
+
+
+def _may_contain_names_or_addresses(text: str) -> bool:
+    """False only when the text provably has no person names or street addresses."""
+    if _PII_NAME_CUE_RE.search(text) or _PII_ADDRESS_CUE_RE.search(text):
+        return True
+    body = _PII_SPEAKER_LABEL_RE.sub("", text.replace(PII_PLACEHOLDER, ""))
+    for sentence in _PII_SENTENCE_SPLIT_RE.split(body):
+        words = re.findall(r"[A-Za-z][\w'-]*", sentence)
+        if not words:
+            continue
+        if not any(c.isupper() for c in sentence):
+            return True  # lower-cased transcription: capitalization says nothing about names
+        if any(w[0].isupper() and w not in _PII_CASE_SAFE_WORDS for w in words[1:]):
+            return True
+    return False
+
+
+def luhn_valid(digits: str) -> bool:
+    """Luhn checksum (credit/debit card numbers)"""
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        n = int(ch)
+        if i % 2 == 1:
+            n *= 2
+            if n > 9:
+                n -= 9
+        total += n
+    return total % 10 == 0
+
+
+def _classify_number(digits: str) -> str:
+    """'redact' for phone/SSN/account/card-shaped digit strings, 'unknown' for other long numbers."""
+    if 7 <= len(digits) <= 15:
+        return "redact"  # phone numbers (local, NANP, E.164), SSN/SIN, account numbers
+    if len(digits) <= 19 and luhn_valid(digits):
+        return "redact"  # card number
+    return "unknown"
+
+
+def redact_pii_local(text: str) -> tuple:
+    """Deterministically redact structured PII; returns (redacted_text, residual_risk).
+
+    Covers emails (written and spoken), SSNs, Luhn-valid card numbers, phone numbers,
+    dates of birth, Canadian postal codes and spoken digit sequences. This is a pre-mask
+    only: residual_risk is True unless the text provably holds no PII these patterns can't
+    find (names, street addresses, long numbers of unknown kind), in which case it still
+    needs the LLM pass.
+    """
+    if not text:
+        return text, False
+
+    residual = False
+
+    def _spoken_digits(match):
+        nonlocal residual
+        digits = normalize_voice_to_digits(match.group(0))
+        if len(digits) < 7:
+            return match.group(0)
+        if _classify_number(digits) == "unknown":
+            residual = True
+        return PII_PLACEHOLDER
+
+    def _digit_run(match):
+        nonlocal residual
+        if _PII_DATE_RE.fullmatch(match.group(0).strip()):
+            return match.group(0)  # a date _date chose to keep (recent or upcoming)
+        if _classify_number(re.sub(r"\D", "", match.group(0))) == "unknown":
+            residual = True
+            return match.group(0)
+        return PII_PLACEHOLDER
+
+    def _date(match):
+        this_year = datetime.date.today().year
+        year = int(next(y for y in match.group("y1", "y2", "y3", "y4") if y))
+        if year < 100:
+            year += 2000 if year <= this_year % 100 else 1900
+        # Dates well in the past are most likely birth dates; upcoming ones are appointments
+        return PII_PLACEHOLDER if year <= this_year - 10 else match.group(0)
+
+    text = _PII_EMAIL_RE.sub(PII_PLACEHOLDER, text)
+    text = _PII_SPOKEN_EMAIL_RE.sub(PII_PLACEHOLDER, text)
+    text = _PII_BIRTH_DATE_RE.sub(lambda m: m.group(0)[:m.start(1) - m.start(0)] + PII_PLACEHOLDER, text)
+    text = _PII_DATE_RE.sub(_date, text)
+    text = _PII_SSN_RE.sub(PII_PLACEHOLDER, text)
+    text = _PII_SPOKEN_DIGITS_RE.sub(_spoken_digits, text)
+    text = _PII_DIGIT_RUN_RE.sub(_digit_run, text)
+    text = _PII_POSTAL_CODE_RE.sub(PII_PLACEHOLDER, text)
+
+    if _may_contain_names_or_addresses(text):
+        residual = True
+    return text, residual
+
+
+PII_REDACTION_RULES = """Replace all personally identifiable information in the text with [REDACTED].
 
 PII to redact:
 - Personal names (first, last, full names)
@@ -499,72 +1420,343 @@ PII to redact:
 Rules:
 - Keep speaker labels intact (e.g. "Caller:", "Agent:", "Maggie:", etc.)
 - Keep the conversation structure and formatting exactly the same
-- Only replace the PII values, not surrounding text
+- Only replace the PII values, not surrounding text"""
+
+
+PII_REDACTION_CHUNK_TOKENS = int(os.getenv("PII_REDACTION_CHUNK_TOKENS", "1500"))
+PII_REDACTION_CONCURRENCY = int(os.getenv("PII_REDACTION_CONCURRENCY", "4"))
+_CHARS_PER_TOKEN = 4  # rough estimate for English transcripts
+
+
+def chunk_transcript(text: str, max_tokens: int = PII_REDACTION_CHUNK_TOKENS) -> list:
+    """Split a transcript into windows of whole turns, each roughly max_tokens long.
+
+    Turns are never split, so speaker labels stay attached to their text; a single turn
+    longer than the window becomes a window of its own.
+    """
+    max_chars = max_tokens * _CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_len = 0
+    for turn in text.split(TranscriptBuffer.SEPARATOR):
+        if current and current_len + len(turn) > max_chars:
+            chunks.append(TranscriptBuffer.SEPARATOR.join(current))
+            current, current_len = [], 0
+        current.append(turn)
+        current_len += len(turn) + len(TranscriptBuffer.SEPARATOR)
+    if current:
+        chunks.append(TranscriptBuffer.SEPARATOR.join(current))
+    return chunks
+
+
+async def _redact_pii_llm(text: str) -> str:
+    """One OpenAI redaction request; returns text unchanged if the response is unusable."""
+    response = await openai_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{
+            "role": "system",
+            "content": f"""You are a PII redaction tool. {PII_REDACTION_RULES}
 - Do NOT add any explanation or commentary
 - Return ONLY the redacted text"""
+        }, {
+            "role": "user",
+            "content": text
+        }],
+        temperature=0,
+        # Redacted output is never longer than the input (plus some slack for placeholders)
+        max_tokens=len(text) // _CHARS_PER_TOKEN * 3 // 2 + 64,
+    )
+
+    redacted = response.choices[0].message.content.strip()
+    if not redacted:
+        logger.warning("Empty PII redaction response, returning locally redacted text")
+        return text
+    if response.choices[0].finish_reason == "length":
+        logger.warning("Truncated PII redaction response, returning locally redacted text")
+        return text
+    return redacted
+
+
+async def redact_pii(text: str) -> str:
+    """Redact PII from text.
+
+    Structured PII is masked locally first (redact_pii_local); OpenAI is asked unless the
+    text provably has no names, addresses or unclassified numbers left. Long transcripts are split into
+    turn-aligned chunks (chunk_transcript) that are all sent, concurrently, so latency is
+    bounded by the largest chunk rather than the call length. Every chunk goes to the LLM
+    because a name flagged by a cue in one chunk can reappear uncued in another.
+    Chunks whose LLM pass fails keep their locally redacted text.
+    """
+    if not text or not text.strip():
+        return text
+
+    local_text, residual = redact_pii_local(text)
+    if not residual:
+        logger.info(f"🔒 PII redacted locally ({len(text)} -> {len(local_text)} chars)")
+        return local_text
+
+    chunks = chunk_transcript(local_text)
+    semaphore = asyncio.Semaphore(PII_REDACTION_CONCURRENCY)
+
+    async def _redact_chunk(chunk: str) -> str:
+        async with semaphore:
+            try:
+                return await _redact_pii_llm(chunk)
+            except Exception as e:
+                logger.error(f"PII redaction failed (returning locally redacted text): {e}")
+                return chunk
+
+    redacted = TranscriptBuffer.SEPARATOR.join(await asyncio.gather(*(_redact_chunk(c) for c in chunks)))
+    logger.info(f"🔒 PII redacted from text ({len(text)} -> {len(redacted)} chars, {len(chunks)} chunk(s))")
+    return redacted
+
+
+# ============================================
+# Combined Post-Call Analysis
+# ============================================
+
+POST_CALL_ANALYSIS_MODE = os.getenv("POST_CALL_ANALYSIS_MODE", "combined")  # "combined" or "separate"
+
+_VAR_TYPE_JSON_TYPES = {"number": "number", "boolean": "boolean"}
+
+
+def _extraction_json_schema(dynamic_variables: list) -> dict:
+    """Strict JSON schema for extracted_data: one nullable property per variable."""
+    properties = {}
+    if dynamic_variables:
+        for var in dynamic_variables:
+            prop = {"type": [_VAR_TYPE_JSON_TYPES.get(var.get("var_type"), "string"), "null"]}
+            if var.get("description"):
+                prop["description"] = var["description"]
+            if var.get("var_type") == "enum" and var.get("enum_options"):
+                prop["enum"] = list(var["enum_options"]) + [None]
+            properties[var["name"]] = prop
+    else:
+        for name, description in DEFAULT_EXTRACTION_FIELDS.items():
+            if name == "action_items":
+                properties[name] = {"type": ["array", "null"], "items": {"type": "string"}, "description": description}
+            else:
+                properties[name] = {"type": ["string", "null"], "description": description}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+async def analyze_call(transcript_text: str, dynamic_variables: list, extract: bool) -> dict:
+    """Summarize, extract data and key topics from a transcript in one request.
+
+    In redacted mode the caller must pass the already redacted transcript, so no value the
+    model sees can leak into the summary or extracted data. Returns {"transcript", "summary",
+    "extracted_data", "key_topics"}, or None if the request or its output fails validation;
+    callers then fall back to generate_call_summary / extract_data_from_transcript.
+    """
+    if not transcript_text:
+        return None
+
+    properties = {}
+    instructions = []
+    properties["summary"] = {"type": "string"}
+    instructions.append("summary: exactly 3 short sentences. Focus on: who called, what they needed, and the outcome/next steps.")
+    if extract:
+        properties["extracted_data"] = _extraction_json_schema(dynamic_variables)
+        instructions.append(f"extracted_data: values discussed in the call, null if they cannot be determined.\n{SPOKEN_VALUE_NORMALIZATION_RULES}")
+    properties["key_topics"] = {"type": "array", "items": {"type": "string"}}
+    instructions.append("key_topics: 3-5 key topics of the call, short strings of 2-4 words each.")
+
+    schema = {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+    try:
+        response = await openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{
+                "role": "system",
+                "content": "You analyze phone call transcripts. Fill in every field:\n\n" + "\n\n".join(f"- {i}" for i in instructions),
             }, {
                 "role": "user",
-                "content": text
+                "content": transcript_text,
             }],
-            temperature=0,
+            temperature=0.1,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "call_analysis", "strict": True, "schema": schema},
+            },
         )
+        message = response.choices[0].message
+        if getattr(message, "refusal", None) or response.choices[0].finish_reason != "stop":
+            raise ValueError(f"incomplete analysis (finish_reason={response.choices[0].finish_reason})")
+        result = json.loads(message.content)
+
+        summary = (result.get("summary") or "").strip()
+        topics = result.get("key_topics")
+        if not summary or not isinstance(topics, list):
+            raise ValueError("missing summary or key_topics")
+
+        extracted = {}
+        if extract:
+            extracted = result.get("extracted_data") or {}
+            if not dynamic_variables:
+                # General extraction only keeps fields that came up in the call
+                extracted = {k: v for k, v in extracted.items() if v not in (None, "", [])}
+
+        logger.info(f"🧾 Combined call analysis done ({response.usage.total_tokens if response.usage else '?'} tokens)")
+        return {
+            "transcript": transcript_text,
+            "summary": summary,
+            "extracted_data": extracted,
+            "key_topics": [str(t) for t in topics][:5],
+        }
+
+    except Exception as e:
+        logger.warning(f"🧾 Combined call analysis failed, falling back to separate requests: {e}")
+        return None
+
+
+# ============================================
+# Caller Profile
+# ============================================
 
-        redacted = response.choices[0].message.content.strip()
-        if not redacted:
-            logger.warning("Empty PII redaction response, returning original")
-            return text
+# conversation_contexts columns the call needs (the embedding column is left out on purpose)
+CALLER_CONTEXT_COLUMNS = "id, summary, key_topics, preferences, interaction_count, sms_interaction_count, last_call_ids"
 
-        logger.info(f"🔒 PII redacted from text ({len(text)} -> {len(redacted)} chars)")
-        return redacted
 
+def normalize_caller_phone(phone: str) -> str:
+    """E.164-style form used for contacts.phone_number lookups."""
+    normalized_phone = re.sub(r'[^\d+]', '', phone or "")
+    if not normalized_phone.startswith('+'):
+        normalized_phone = '+' + normalized_phone
+    return normalized_phone
+
+
+class CallerProfile:
+    """The caller's contact row and their conversation_contexts row for this agent.
+
+    Loaded once per call (load_caller_profile) and shared by the memory prompt, semantic
+    search and the post-call memory update, which updates it in place. Travels in the
+    post-call job payload via to_dict()/from_dict(). `loaded` is False when the lookup
+    failed, in which case consumers fall back to querying for themselves.
+    """
+
+    def __init__(self, phone: str, user_id: str, agent_id: str, contact: dict = None, context: dict = None, loaded: bool = True):
+        self.phone = normalize_caller_phone(phone)
+        self.user_id = user_id
+        self.agent_id = agent_id
+        self.contact = contact
+        self.context = context
+        self.loaded = loaded
+
+    @property
+    def contact_id(self):
+        return self.contact["id"] if self.contact else None
+
+    @property
+    def contact_name(self) -> str:
+        return (self.contact or {}).get("name") or "Unknown"
+
+    @property
+    def has_history(self) -> bool:
+        """True when the caller has prior calls or texts with this agent (what memory injection needs)."""
+        if not (self.contact and self.context):
+            return False
+        return (self.context.get("interaction_count") or 0) + (self.context.get("sms_interaction_count") or 0) > 0
+
+    def matches(self, phone: str, user_id: str, agent_id: str) -> bool:
+        return (self.phone == normalize_caller_phone(phone)
+                and str(self.user_id) == str(user_id) and str(self.agent_id) == str(agent_id))
+
+    def to_dict(self) -> dict:
+        return {
+            "phone": self.phone,
+            "user_id": self.user_id,
+            "agent_id": self.agent_id,
+            "contact": self.contact,
+            "context": self.context,
+            "loaded": self.loaded,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CallerProfile":
+        return cls(data["phone"], data["user_id"], data["agent_id"], data.get("contact"), data.get("context"), data.get("loaded", True))
+
+
+async def load_caller_profile(caller_phone: str, user_id: str, agent_id: str) -> CallerProfile:
+    """Load the caller's contact and this agent's conversation context in one query.
+
+    conversation_contexts is embedded through its contact_id foreign key and filtered to
+    this agent; if the embedded select isn't available, the two tables are read separately.
+    """
+    profile = CallerProfile(caller_phone, user_id, agent_id)
+    try:
+        try:
+            contact_response = await db_execute(
+                supabase.table("contacts")
+                .select(f"id, name, conversation_contexts({CALLER_CONTEXT_COLUMNS})")
+                .eq("phone_number", profile.phone)
+                .eq("user_id", user_id)
+                .eq("conversation_contexts.agent_id", agent_id)
+                .limit(1)
+            )
+            if contact_response.data:
+                contact = dict(contact_response.data[0])
+                contexts = contact.pop("conversation_contexts", None) or []
+                profile.contact = contact
+                profile.context = contexts[0] if contexts else None
+        except Exception as embed_err:
+            logger.warning(f"⚠️ Caller profile join failed, loading contact and context separately: {embed_err}")
+            contact_response = await db_execute(
+                supabase.table("contacts")
+                .select("id, name")
+                .eq("phone_number", profile.phone)
+                .eq("user_id", user_id)
+                .limit(1)
+            )
+            if contact_response.data:
+                profile.contact = contact_response.data[0]
+                context_response = await db_execute(
+                    supabase.table("conversation_contexts")
+                    .select(CALLER_CONTEXT_COLUMNS)
+                    .eq("contact_id", profile.contact_id)
+                    .eq("agent_id", agent_id)
+                    .limit(1)
+                )
+                profile.context = context_response.data[0] if context_response.data else None
     except Exception as e:
-        logger.error(f"PII redaction failed (returning original): {e}")
-        return text
+        logger.error(f"🧠 Failed to load caller profile: {e}")
+        profile.loaded = False
+    return profile
 
 
-async def get_caller_memory(caller_phone: str, user_id: str, agent_id: str, memory_config: dict) -> str:
+async def get_caller_memory(caller_phone: str, user_id: str, agent_id: str, memory_config: dict, profile: CallerProfile = None) -> str:
     """Retrieve conversation memory for a caller to inject into system prompt"""
     if not caller_phone or not user_id or not agent_id:
         logger.info(f"🧠 Memory lookup skipped - missing: phone={bool(caller_phone)}, user_id={bool(user_id)}, agent_id={bool(agent_id)}")
         return ""
 
     try:
-        # Normalize phone number for lookup
-        normalized_phone = re.sub(r'[^\d+]', '', caller_phone)
-        if not normalized_phone.startswith('+'):
-            normalized_phone = '+' + normalized_phone
-
-        # Look up contact by phone number and user_id
-        contact_response = supabase.table("contacts") \
-            .select("id, name") \
-            .eq("phone_number", normalized_phone) \
-            .eq("user_id", user_id) \
-            .limit(1) \
-            .execute()
-
-        if not contact_response.data or len(contact_response.data) == 0:
-            logger.info(f"🧠 No contact found for {normalized_phone} - no memory to inject")
-            return ""
+        if profile is None:
+            profile = await load_caller_profile(caller_phone, user_id, agent_id)
 
-        contact = contact_response.data[0]
-        contact_id = contact["id"]
-        contact_name = contact.get("name", "Unknown")
+        if not profile.contact:
+            logger.info(f"🧠 No contact found for {profile.phone} - no memory to inject")
+            return ""
 
-        # Get conversation context for this contact and agent
-        context_response = supabase.table("conversation_contexts") \
-            .select("*") \
-            .eq("contact_id", contact_id) \
-            .eq("agent_id", agent_id) \
-            .limit(1) \
-            .execute()
+        contact_id = profile.contact_id
+        contact_name = profile.contact_name
 
-        if not context_response.data or len(context_response.data) == 0:
+        if not profile.context:
             logger.info(f"🧠 No conversation context found for contact {contact_id} with agent {agent_id}")
             return ""
 
-        ctx = context_response.data[0]
-        call_count = ctx.get("interaction_count", 0)
-        sms_count = ctx.get("sms_interaction_count", 0)
+        ctx = profile.context
+        call_count = ctx.get("interaction_count") or 0
+        sms_count = ctx.get("sms_interaction_count") or 0
         total_interactions = call_count + sms_count
 
         if total_interactions == 0:
@@ -612,23 +1804,307 @@ async def get_caller_memory(caller_phone: str, user_id: str, agent_id: str, memo
         return ""
 
 
+AGENT_NAME_CACHE_TTL = 600.0  # seconds
+_agent_name_cache = {}  # agent_id -> (name, cached_at)
+
+
+async def get_agent_names(agent_ids: list) -> dict:
+    """Display names for agents, from a process-level cache; misses are fetched in one query."""
+    now = time_module.monotonic()
+    names = {}
+    missing = []
+    for agent_id in agent_ids:
+        cached = _agent_name_cache.get(str(agent_id))
+        if cached and now - cached[1] < AGENT_NAME_CACHE_TTL:
+            names[str(agent_id)] = cached[0]
+        else:
+            missing.append(str(agent_id))
+    if missing:
+        response = await db_execute(supabase.table("agent_configs").select("id, name").in_("id", missing))
+        for row in response.data or []:
+            name = row.get("name") or "Unknown Agent"
+            _agent_name_cache[str(row["id"])] = (name, now)
+            names[str(row["id"])] = name
+    return names
+
+
+async def get_shared_memory_sections(contact_id: str, shared_agent_ids: list) -> list:
+    """Memory sections from other agents that share memory with this one, for the same contact.
+
+    Contexts and agent names come back from one query (agent_configs embedded through the
+    conversation_contexts.agent_id foreign key); names are also kept in the process-level
+    agent name cache, which serves them if the embedded select isn't available.
+    """
+    try:
+        try:
+            shared_response = await db_execute(supabase.table("conversation_contexts").select(
+                "summary, key_topics, agent_id, agent_configs(name)"
+            ).eq("contact_id", contact_id).in_("agent_id", shared_agent_ids))
+            rows = shared_response.data or []
+            now = time_module.monotonic()
+            agent_names = {}
+            for entry in rows:
+                embedded = entry.get("agent_configs") or {}
+                if entry.get("agent_id") and embedded.get("name"):
+                    agent_names[str(entry["agent_id"])] = embedded["name"]
+                    _agent_name_cache[str(entry["agent_id"])] = (embedded["name"], now)
+        except Exception as embed_err:
+            logger.warning(f"⚠️ Shared memory join failed, loading agent names separately: {embed_err}")
+            shared_response = await db_execute(supabase.table("conversation_contexts").select(
+                "summary, key_topics, agent_id"
+            ).eq("contact_id", contact_id).in_("agent_id", shared_agent_ids))
+            rows = shared_response.data or []
+            agent_names = await get_agent_names(list({entry["agent_id"] for entry in rows if entry.get("agent_id")}))
+
+        shared_sections = []
+        for entry in rows:
+            agent_name_label = agent_names.get(str(entry["agent_id"]), "Another Agent")
+            summary = entry.get("summary", "")
+            topics = entry.get("key_topics") or []
+            if summary:
+                section = f"## SHARED MEMORY (from {agent_name_label})\n{summary}"
+                if topics:
+                    section += f"\nTopics: {', '.join(topics)}"
+                shared_sections.append(section)
+        return shared_sections or None
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to load shared memory: {e}")
+        return None
+
+
+DEFAULT_SEMANTIC_MEMORY_CONFIG = {
+    "max_results": 3,
+    "similarity_threshold": 0.75,
+    "include_other_callers": True
+}
+
+
+async def get_caller_semantic_context(profile: CallerProfile, semantic_config: dict):
+    """Similar conversations with OTHER callers, searched by this caller's memory summary.
+
+    Returns (caller_summary, caller_topics, semantic_result), or None when the caller has no
+    summarized history with this agent.
+    """
+    if not (profile and profile.has_history and profile.context.get("summary")):
+        return None
+    caller_summary = profile.context["summary"]
+    caller_topics = profile.context.get("key_topics") or []
+    search_text = f"{caller_summary}\n\nTopics: {', '.join(caller_topics)}"
+    semantic_result = await get_semantic_context(
+        transcript_text=search_text,
+        agent_id=profile.agent_id,
+        user_id=profile.user_id,
+        current_contact_id=profile.contact_id,
+        config=semantic_config
+    )
+    return caller_summary, caller_topics, semantic_result
+
+
+class CallerPrefetch:
+    """Caller memory lookups started in the background as soon as the remote party is known.
+
+    Lookups are keyed by (name, E.164 number, user_id, agent_id). The bootstrap awaits the
+    in-flight lookup for its key, so work started while the agent config, voice and transfer
+    setup were still loading isn't repeated; a prefetch made for a different number or agent
+    (e.g. before an agent correction) is simply never used.
+    """
+
+    def __init__(self):
+        self._tasks = {}  # (name, e164, user_id, agent_id) -> asyncio.Task
+
+    def _key(self, name: str, phone: str, user_id, agent_id) -> tuple:
+        return (name, normalize_caller_phone(phone), str(user_id), str(agent_id))
+
+    def start(self, name: str, phone: str, user_id, agent_id, fn):
+        """Start `fn()` for this key unless it is already in flight; returns the task."""
+        key = self._key(name, phone, user_id, agent_id)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(fn())
+        return self._tasks[key]
+
+    def start_memory_lookups(self, phone: str, user_id, agent_config: dict):
+        """Start the profile, semantic and shared-memory lookups this agent's config calls for."""
+        agent_id = (agent_config or {}).get("id")
+        if not (phone and user_id and agent_id and agent_config.get("memory_enabled")):
+            return
+        profile_task = self.start("caller_profile", phone, user_id, agent_id,
+                                  lambda: load_caller_profile(phone, user_id, agent_id))
+
+        if agent_config.get("semantic_memory_enabled"):
+            semantic_config = agent_config.get("semantic_memory_config") or DEFAULT_SEMANTIC_MEMORY_CONFIG
+
+            async def _semantic():
+                return await get_caller_semantic_context(await profile_task, semantic_config)
+
+            self.start("semantic_context", phone, user_id, agent_id, _semantic)
+
+        shared_agent_ids = agent_config.get("shared_memory_agent_ids") or []
+        if shared_agent_ids:
+            async def _shared():
+                profile = await profile_task
+                if not (profile and profile.has_history):
+                    return None
+                return await get_shared_memory_sections(profile.contact_id, shared_agent_ids)
+
+            self.start("shared_memory", phone, user_id, agent_id, _shared)
+
+    async def result(self, name: str, phone: str, user_id, agent_id):
+        """Await the lookup for this key; None if it was never started."""
+        task = self._tasks.get(self._key(name, phone, user_id, agent_id))
+        return await task if task is not None else None
+
+    async def close(self):
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # retrieved so unused failed prefetches don't log as unhandled
+
+
+# ============================================
+# Embedding Cache
+# ============================================
+
+EMBEDDING_CACHE_MEMORY_MB = float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "16"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "magpipe-embedding-cache"))  # empty = memory only
+EMBEDDING_CACHE_DISK_MB = float(os.getenv("EMBEDDING_CACHE_DISK_MB", "256"))
+EMBEDDING_CACHE_DISK_DTYPE = os.getenv("EMBEDDING_CACHE_DISK_DTYPE", "float32")  # or "float16"
+
+
+class EmbeddingCache:
+    """Content-addressed cache of embedding vectors, keyed by (model, sha256(text)).
+
+    Vectors are kept as packed float32 arrays in a per-process in-memory LRU and, when a
+    cache directory is configured, on local disk as float32 or float16 (half the size, ample
+    precision for cosine similarity) with LRU eviction by access time. Concurrent requests
+    for the same text share one in-flight OpenAI request.
+    """
+
+    _DISK_FORMATS = {"float32": b"f", "float16": b"e"}
+    _HEADER = struct.Struct("<cI")  # struct format char, dimensions
+    _EVICT_EVERY = 64  # disk writes between size checks
+
+    def __init__(self, memory_bytes: int, cache_dir: str, disk_bytes: int, disk_dtype: str):
+        self.memory_bytes = memory_bytes
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self.disk_format = self._DISK_FORMATS.get(disk_dtype, b"f")
+        self._memory = collections.OrderedDict()  # key -> array("f")
+        self._memory_size = 0
+        self._inflight = {}  # key -> asyncio.Task
+        self._disk_writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(model: str, text: str) -> str:
+        return f"{model}-{hashlib.sha256(text.encode()).hexdigest()}"
+
+    def _path(self, key: str, suffix: str = ".emb") -> str:
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def _remember(self, key: str, vector: array.array):
+        if key in self._memory:
+            old = self._memory.pop(key)
+            self._memory_size -= len(old) * old.itemsize
+        self._memory[key] = vector
+        self._memory_size += len(vector) * vector.itemsize
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted) * evicted.itemsize
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                fmt, dims = self._HEADER.unpack(f.read(self._HEADER.size))
+                values = struct.unpack(f"<{dims}{fmt.decode()}", f.read())
+            os.utime(path)  # LRU by access time
+            return array.array("f", values)
+        except (OSError, struct.error, ValueError):
+            return None
+
+    def _write_disk(self, key: str, vector: array.array):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._path(key, f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(self._HEADER.pack(self.disk_format, len(vector)))
+                f.write(struct.pack(f"<{len(vector)}{self.disk_format.decode()}", *vector))
+            os.replace(tmp_path, self._path(key))
+
+            self._disk_writes += 1
+            if self._disk_writes % self._EVICT_EVERY != 1:
+                return
+            files = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".emb"):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.disk_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+        except OSError as e:
+            logger.warning(f"🔮 Embedding cache disk write failed: {e}")
+
+    async def get_or_create(self, model: str, text: str, create) -> list:
+        """Return the cached vector for (model, text), else `await create()` and cache it."""
+        key = self.key_for(model, text)
+        vector = self._memory.get(key)
+        if vector is None and self.cache_dir:
+            vector = await asyncio.to_thread(self._read_disk, key)
+            if vector is not None:
+                self._remember(key, vector)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(create())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        embedding = await asyncio.shield(task)
+        if embedding and key not in self._memory:
+            vector = array.array("f", embedding)
+            self._remember(key, vector)
+            if self.cache_dir and self.disk_bytes > 0:
+                asyncio.create_task(asyncio.to_thread(self._write_disk, key, vector))
+        return embedding
+
+
+embedding_cache = EmbeddingCache(
+    int(EMBEDDING_CACHE_MEMORY_MB * 1024 * 1024),
+    EMBEDDING_CACHE_DIR,
+    int(EMBEDDING_CACHE_DISK_MB * 1024 * 1024),
+    EMBEDDING_CACHE_DISK_DTYPE,
+)
+
+
 async def generate_embedding(text: str, model: str = "text-embedding-ada-002") -> list:
-    """Generate embedding vector for text using OpenAI"""
+    """Generate embedding vector for text using OpenAI (cached by model and text)"""
     if not text:
         return None
 
-    try:
-        client = openai_client
+    text = text[:8000]
 
-        response = await client.embeddings.create(
+    async def _create():
+        response = await openai_client.embeddings.create(
             model=model,
-            input=text[:8000],
+            input=text,
         )
-
         embedding = response.data[0].embedding
         logger.info(f"🔮 Generated embedding vector ({len(embedding)} dimensions)")
         return embedding
 
+    try:
+        return await embedding_cache.get_or_create(model, text, _create)
+
     except Exception as e:
         logger.error(f"Failed to generate embedding: {e}")
         return None
@@ -650,14 +2126,14 @@ async def search_similar_memories(query_text: str, agent_id: str, user_id: str,
             return []
 
         # Call the match_similar_memories function via RPC
-        response = supabase.rpc("match_similar_memories", {
+        response = await db_execute(supabase.rpc("match_similar_memories", {
             "query_embedding": query_embedding,
             "match_agent_id": agent_id,
             "match_user_id": user_id,
             "exclude_contact_id": exclude_contact_id,
             "match_threshold": threshold,
             "match_count": max_results,
-        }).execute()
+        }))
 
         if response.data:
             logger.info(f"🔮 Found {len(response.data)} similar memories")
@@ -681,16 +2157,20 @@ async def search_knowledge_base(knowledge_source_ids: list, query_text: str, lim
         if not query_embedding:
             return None
 
-        response = supabase.rpc("match_knowledge_chunks", {
-            "query_embedding": query_embedding,
-            "source_ids": knowledge_source_ids,
-            "match_count": limit,
-            "similarity_threshold": 0.25,
-        }).execute()
-
-        if response.data and len(response.data) > 0:
-            context = "\n\n---\n\n".join(chunk["content"] for chunk in response.data)
-            logger.info(f"📚 Found {len(response.data)} relevant KB chunks")
+        # In-process index when every source is loaded locally, else pgvector
+        chunks = await local_kb_index.search(knowledge_source_ids, query_embedding, limit, 0.25)
+        if chunks is None:
+            response = await db_execute(supabase.rpc("match_knowledge_chunks", {
+                "query_embedding": query_embedding,
+                "source_ids": knowledge_source_ids,
+                "match_count": limit,
+                "similarity_threshold": 0.25,
+            }))
+            chunks = [chunk["content"] for chunk in response.data or []]
+
+        if chunks:
+            context = "\n\n---\n\n".join(chunks)
+            logger.info(f"📚 Found {len(chunks)} relevant KB chunks")
             return context
 
         logger.info("📚 No relevant KB chunks found")
@@ -701,6 +2181,568 @@ async def search_knowledge_base(knowledge_source_ids: list, query_text: str, lim
         return None
 
 
+async def get_knowledge_source_versions(knowledge_source_ids: list) -> dict:
+    """Map source id -> fingerprint of its indexing state (changes when it is re-indexed).
+
+    Returns None if the sources can't be read.
+    """
+    try:
+        response = await db_execute(
+            supabase.table("knowledge_sources")
+            .select("id, sync_status, last_synced_at, chunk_count, updated_at")
+            .in_("id", knowledge_source_ids)
+        )
+        return {
+            str(row["id"]): hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()[:16]
+            for row in response.data or []
+        }
+    except Exception as e:
+        logger.warning(f"📚 Could not read knowledge source versions: {e}")
+        return None
+
+
+async def get_knowledge_version(knowledge_source_ids: list) -> str:
+    """Combined fingerprint of the sources' indexing state; None if it can't be determined."""
+    versions = await get_knowledge_source_versions(knowledge_source_ids)
+    if versions is None:
+        return None
+    return hashlib.sha256(json.dumps(sorted(versions.items())).encode()).hexdigest()[:16]
+
+
+async def preload_knowledge_context(agent_id: str, knowledge_source_ids: list, query_text: str) -> str:
+    """search_knowledge_base for the call-start KB context, cached per agent.
+
+    The query only depends on agent config, so the result is cached in agent_config_cache
+    under (knowledge source ids, query hash) together with the KB version it was built from:
+    config edits drop it with the rest of the agent's entry, and a cached result is only
+    used while the version still matches. Without a cached result the version is read
+    alongside the search, so it never adds a round-trip.
+    """
+    if not knowledge_source_ids or not query_text:
+        return None
+
+    query_key = hashlib.sha256(json.dumps([sorted(map(str, knowledge_source_ids)), query_text]).encode()).hexdigest()[:16]
+    item = f"kb_context:{query_key}"
+    cached = await agent_config_cache.peek(agent_id, item)
+    if cached:
+        kb_version = await get_knowledge_version(knowledge_source_ids)
+        if kb_version is not None and kb_version == cached.get("version"):
+            return cached.get("context")
+        context = await search_knowledge_base(knowledge_source_ids, query_text)
+    else:
+        context, kb_version = await asyncio.gather(
+            search_knowledge_base(knowledge_source_ids, query_text),
+            get_knowledge_version(knowledge_source_ids),
+        )
+
+    if context is not None and kb_version is not None:
+        await agent_config_cache.put(agent_id, item, {"version": kb_version, "context": context})
+    return context
+
+
+# ============================================
+# Local Knowledge Index
+# ============================================
+
+KB_LOCAL_INDEX_ENABLED = os.getenv("KB_LOCAL_INDEX", "false").lower() == "true"
+KB_LOCAL_INDEX_DIR = os.getenv("KB_LOCAL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "magpipe-kb-index"))
+KB_LOCAL_INDEX_MAX_CHUNKS = int(os.getenv("KB_LOCAL_INDEX_MAX_CHUNKS", "20000"))  # per source
+KB_LOCAL_INDEX_REFRESH_SECONDS = float(os.getenv("KB_LOCAL_INDEX_REFRESH_SECONDS", "60"))
+
+
+class LocalKnowledgeIndex:
+    """In-process top-k cosine search over an agent's knowledge chunks (requires numpy).
+
+    Each knowledge source is loaded once per indexing version into a row-normalized float32
+    matrix saved as .npy under KB_LOCAL_INDEX_DIR and memory-mapped, so every worker process
+    on the host shares one copy through the page cache. refresh() compares per-source
+    versions and reloads only sources that were re-indexed. search() returns None unless all
+    requested sources are loaded, in which case callers use match_knowledge_chunks instead.
+    """
+
+    _PAGE_SIZE = 500
+
+    def __init__(self, index_dir: str, max_chunks: int, refresh_seconds: float):
+        self.enabled = KB_LOCAL_INDEX_ENABLED and _NUMPY_AVAILABLE
+        self.index_dir = index_dir
+        self.max_chunks = max_chunks
+        self.refresh_seconds = refresh_seconds
+        self._sources = {}  # source_id -> {"version", "matrix", "contents"}
+        self._checked_at = {}  # source_id -> monotonic time of last version check
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task = None  # background refresh started by schedule_refresh()
+        if KB_LOCAL_INDEX_ENABLED and not _NUMPY_AVAILABLE:
+            logger.warning("📚 KB_LOCAL_INDEX is set but numpy is not installed - using pgvector search only")
+
+    def _paths(self, source_id: str, version: str) -> tuple:
+        base = os.path.join(self.index_dir, f"{source_id}-{version}")
+        return f"{base}.npy", f"{base}.json"
+
+    def _load_disk(self, source_id: str, version: str):
+        matrix_path, contents_path = self._paths(source_id, version)
+        try:
+            with open(contents_path) as f:
+                contents = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode="r")
+            if matrix.shape[0] != len(contents):
+                return None
+            return {"version": version, "matrix": matrix, "contents": contents}
+        except (OSError, ValueError):
+            return None
+
+    def _save_disk(self, source_id: str, version: str, matrix, contents: list):
+        os.makedirs(self.index_dir, exist_ok=True)
+        matrix_path, contents_path = self._paths(source_id, version)
+        # Write-then-rename; json last so a complete .json implies a complete .npy
+        tmp_matrix = f"{matrix_path}.{os.getpid()}.tmp"
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix, matrix_path)
+        tmp_contents = f"{contents_path}.{os.getpid()}.tmp"
+        with open(tmp_contents, "w") as f:
+            json.dump(contents, f)
+        os.replace(tmp_contents, contents_path)
+        # Drop files of older versions of this source
+        for name in os.listdir(self.index_dir):
+            if name.startswith(f"{source_id}-") and not name.startswith(f"{source_id}-{version}"):
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except OSError:
+                    pass
+
+    async def _fetch_source(self, source_id: str):
+        """Download a source's chunks and embeddings; returns (matrix, contents) or None."""
+        contents, vectors = [], []
+        start = 0
+        while True:
+            response = await db_execute(
+                supabase.table("knowledge_chunks")
+                .select("content, embedding")
+                .eq("knowledge_source_id", source_id)
+                .order("chunk_index")
+                .range(start, start + self._PAGE_SIZE - 1)
+            )
+            rows = response.data or []
+            for row in rows:
+                embedding = row.get("embedding")
+                if isinstance(embedding, str):
+                    embedding = json.loads(embedding)  # pgvector text form "[0.1,...]"
+                if embedding:
+                    contents.append(row["content"])
+                    vectors.append(embedding)
+            if len(rows) < self._PAGE_SIZE:
+                break
+            start += self._PAGE_SIZE
+            if start >= self.max_chunks:
+                logger.info(f"📚 Source {source_id} has more than {self.max_chunks} chunks - not indexing locally")
+                return None
+
+        def _build():
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            return matrix / np.maximum(norms, 1e-12)
+
+        return await asyncio.to_thread(_build), contents
+
+    async def _load_source(self, source_id: str, version: str):
+        entry = await asyncio.to_thread(self._load_disk, source_id, version)
+        if entry is None:
+            fetched = await self._fetch_source(source_id)
+            if fetched is None:
+                return
+            matrix, contents = fetched
+            try:
+                await asyncio.to_thread(self._save_disk, source_id, version, matrix, contents)
+                entry = await asyncio.to_thread(self._load_disk, source_id, version)
+            except OSError as e:
+                logger.warning(f"📚 Could not write local KB index for {source_id}: {e}")
+            if entry is None:
+                entry = {"version": version, "matrix": matrix, "contents": contents}
+            logger.info(f"📚 Indexed knowledge source {source_id} locally ({len(contents)} chunks)")
+        self._sources[source_id] = entry
+
+    async def refresh(self, knowledge_source_ids: list, force: bool = False):
+        """Load sources that aren't loaded yet or whose indexing version changed."""
+        if not self.enabled or not knowledge_source_ids:
+            return
+        ids = [str(i) for i in knowledge_source_ids]
+        now = time_module.monotonic()
+        if not force and not self._due(ids):
+            return
+        async with self._refresh_lock:
+            versions = await get_knowledge_source_versions(ids)
+            if versions is None:
+                return
+            for source_id in ids:
+                self._checked_at[source_id] = now
+                version = versions.get(source_id)
+                if version is None:
+                    self._sources.pop(source_id, None)  # source deleted
+                    continue
+                loaded = self._sources.get(source_id)
+                if loaded and loaded["version"] == version:
+                    continue
+                try:
+                    await self._load_source(source_id, version)
+                except Exception as e:
+                    logger.warning(f"📚 Local KB index load failed for {source_id}: {e}")
+
+    def _due(self, ids: list) -> bool:
+        now = time_module.monotonic()
+        return any(now - self._checked_at.get(i, float("-inf")) >= self.refresh_seconds for i in ids)
+
+    def schedule_refresh(self, knowledge_source_ids: list):
+        """refresh() in the background, unless one is running or the sources were just checked."""
+        if not self.enabled or not knowledge_source_ids:
+            return
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        ids = [str(i) for i in knowledge_source_ids]
+        if not self._due(ids):
+            return
+        self._refresh_task = asyncio.create_task(self.refresh(ids))
+        self._refresh_task.add_done_callback(self._refresh_done)
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.warning(f"📚 Local KB index refresh failed: {task.exception()}")
+
+    async def search(self, knowledge_source_ids: list, query_embedding: list, limit: int, threshold: float):
+        """Top-k chunk contents by cosine similarity, or None if not every source is loaded."""
+        if not self.enabled:
+            return None
+        ids = [str(i) for i in knowledge_source_ids]
+        entries = [self._sources.get(i) for i in ids]
+        # Re-check versions in the background so re-indexed sources are picked up
+        self.schedule_refresh(ids)
+        if not all(entries):
+            return None
+
+        def _top_k():
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            contents = []
+            scores = []
+            for entry in entries:
+                if entry["matrix"].shape[0] and entry["matrix"].shape[1] == query.shape[0]:
+                    scores.append(entry["matrix"] @ query)
+                    contents.extend(entry["contents"])
+            if not scores:
+                return []
+            scores = np.concatenate(scores)
+            k = min(limit, scores.shape[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [contents[i] for i in top if scores[i] > threshold]
+
+        return await asyncio.to_thread(_top_k)
+
+
+local_kb_index = LocalKnowledgeIndex(KB_LOCAL_INDEX_DIR, KB_LOCAL_INDEX_MAX_CHUNKS, KB_LOCAL_INDEX_REFRESH_SECONDS)
+
+
+# ============================================
+# Knowledge Base Answer Cache
+# ============================================
+
+KB_ANSWER_CACHE_THRESHOLD = float(os.getenv("KB_ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+KB_ANSWER_CACHE_TTL = float(os.getenv("KB_ANSWER_CACHE_TTL", "600"))
+KB_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("KB_ANSWER_CACHE_MAX_ENTRIES", "128"))  # per agent
+KB_ANSWER_CACHE_PATH = os.getenv("KB_ANSWER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "magpipe-kb-answer-cache.db"))
+
+
+class KBAnswerCache(SQLiteStore):
+    """Host-wide semantic cache of search_kb results per agent.
+
+    Maps query embeddings to the KB context returned for them, so a paraphrase of a
+    question the agent was already asked on any call ("what are your hours" / "when are you
+    open") is answered without a vector search or a filler phrase. Entries are scoped by
+    agent, knowledge sources and their KB version (a re-index starts a fresh scope), expire
+    after the TTL and are evicted LRU per agent. Query embeddings are stored as float32
+    unit vectors. Hit rate and the search latency saved (estimated from the average miss)
+    are tracked per agent across calls. Any storage error is treated as a miss.
+    """
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS kb_answer_entries (
+            agent_id TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            query TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            result TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            used_at REAL NOT NULL,
+            PRIMARY KEY (scope, query)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS kb_answer_entries_agent ON kb_answer_entries (agent_id, used_at)",
+        """
+        CREATE TABLE IF NOT EXISTS kb_answer_stats (
+            agent_id TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            miss_ms_total REAL NOT NULL DEFAULT 0,
+            saved_ms REAL NOT NULL DEFAULT 0
+        )
+        """,
+    )
+    _LABEL = "📚 KB answer cache"
+
+    def __init__(self, path: str, threshold: float, ttl: float, max_entries: int):
+        super().__init__(path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0  # this process (i.e. this call)
+        self.misses = 0
+
+    @staticmethod
+    async def scope_for(agent_id: str, knowledge_source_ids: list) -> tuple:
+        """(agent_id, scope key) for the sources at their current KB version; None if unknown."""
+        kb_version = await get_knowledge_version(knowledge_source_ids)
+        if kb_version is None:
+            return None
+        return str(agent_id), json.dumps([sorted(map(str, knowledge_source_ids)), kb_version])
+
+    @staticmethod
+    def _unit(vector: list) -> array.array:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return array.array("f", (x / norm for x in vector))
+
+    def _lookup_sync(self, scope: tuple, query: array.array):
+        agent_id, key = scope
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT query, embedding, result FROM kb_answer_entries WHERE scope = ? AND stored_at > ?",
+                (key, now - self.ttl),
+            ).fetchall()
+            best, best_score = None, self.threshold
+            for stored_query, blob, result in rows:
+                vector = array.array("f")
+                vector.frombytes(blob)
+                if len(vector) != len(query):
+                    continue
+                score = sum(map(operator.mul, vector, query))
+                if score >= best_score:
+                    best, best_score = (stored_query, result), score
+            if best is None:
+                return None
+            conn.execute("UPDATE kb_answer_entries SET used_at = ? WHERE scope = ? AND query = ?", (now, key, best[0]))
+            row = conn.execute("SELECT misses, miss_ms_total FROM kb_answer_stats WHERE agent_id = ?", (agent_id,)).fetchone()
+            avg_miss_ms = row[1] / row[0] if row and row[0] else 0.0
+            conn.execute(
+                "INSERT INTO kb_answer_stats (agent_id, hits, saved_ms) VALUES (?, 1, ?) "
+                "ON CONFLICT (agent_id) DO UPDATE SET hits = hits + 1, saved_ms = saved_ms + excluded.saved_ms",
+                (agent_id, avg_miss_ms),
+            )
+        return best[0], best[1], best_score
+
+    def _store_sync(self, scope: tuple, query: str, blob: bytes, result: str, search_ms: float):
+        agent_id, key = scope
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if search_ms is not None:
+                    conn.execute(
+                        "INSERT INTO kb_answer_stats (agent_id, misses, miss_ms_total) VALUES (?, 1, ?) "
+                        "ON CONFLICT (agent_id) DO UPDATE SET misses = misses + 1, miss_ms_total = miss_ms_total + excluded.miss_ms_total",
+                        (agent_id, search_ms),
+                    )
+                if blob and result:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO kb_answer_entries (agent_id, scope, query, embedding, result, stored_at, used_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (agent_id, key, query, blob, result, now, now),
+                    )
+                    conn.execute("DELETE FROM kb_answer_entries WHERE agent_id = ? AND stored_at <= ?", (agent_id, now - self.ttl))
+                    conn.execute(
+                        "DELETE FROM kb_answer_entries WHERE agent_id = ? AND rowid NOT IN "
+                        "(SELECT rowid FROM kb_answer_entries WHERE agent_id = ? ORDER BY used_at DESC LIMIT ?)",
+                        (agent_id, agent_id, self.max_entries),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _stats_sync(self, agent_id: str):
+        with contextlib.closing(self._connect()) as conn:
+            return conn.execute("SELECT hits, misses, saved_ms FROM kb_answer_stats WHERE agent_id = ?", (agent_id,)).fetchone()
+
+    async def lookup(self, scope: tuple, query_embedding: list):
+        """Cached result for the closest stored query above the threshold, else None."""
+        if not scope or not query_embedding:
+            return None
+        match = await self._run(self._lookup_sync, scope, self._unit(query_embedding))
+        if not match:
+            return None
+        stored_query, result, score = match
+        self.hits += 1
+        logger.info(f"📚 KB answer cache hit for '{stored_query[:60]}' (similarity {score:.3f})")
+        return result
+
+    async def store(self, scope: tuple, query: str, query_embedding: list, result: str, search_ms: float = None):
+        """Remember a search result; search_ms records the miss it cost (None for prefetches)."""
+        if not scope:
+            return
+        if search_ms is not None:
+            self.misses += 1
+        blob = self._unit(query_embedding).tobytes() if query_embedding else None
+        await self._run(self._store_sync, scope, query, blob, result, search_ms)
+
+    async def stats(self, agent_id: str) -> dict:
+        """This call's hits/misses plus the agent's totals across calls."""
+        hits, misses, saved_ms = await self._run(self._stats_sync, str(agent_id)) or (0, 0, 0.0)
+        lookups = hits + misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "agent_hits": hits,
+            "agent_misses": misses,
+            "agent_hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "agent_saved_ms": round(saved_ms),
+        }
+
+
+kb_answer_cache = KBAnswerCache(KB_ANSWER_CACHE_PATH, KB_ANSWER_CACHE_THRESHOLD, KB_ANSWER_CACHE_TTL, KB_ANSWER_CACHE_MAX_ENTRIES)
+
+
+# ============================================
+# Speculative KB Prefetch
+# ============================================
+
+KB_PREFETCH_ENABLED = os.getenv("KB_PREFETCH", "true").lower() != "false"
+KB_PREFETCH_MAX_PER_CALL = int(os.getenv("KB_PREFETCH_MAX_PER_CALL", "20"))  # speculative searches per call
+KB_PREFETCH_MIN_WORDS = 4  # interim transcripts shorter than this aren't worth a search
+KB_PREFETCH_DEBOUNCE_SECONDS = 0.3  # wait for interim transcripts to settle
+KB_PREFETCH_MAX_AGE_SECONDS = 30.0
+KB_PREFETCH_MATCH_THRESHOLD = 0.9  # similarity between the tool query and the prefetched utterance (near the answer cache's)
+
+
+class KBPrefetcher:
+    """Runs the KB search for what the caller is saying before the LLM asks for it.
+
+    observe() receives interim and final STT transcripts; settled interim text and every
+    final transcript are embedded and searched in the background, and the result is kept
+    (final transcripts are also added to kb_answer_cache; partial utterances are not).
+    When the LLM then calls search_kb, take() hands back the prefetched chunks only if its
+    query is close to what was searched, waiting on a prefetch that is still in flight
+    instead of starting another; otherwise the tool runs its own search. At most max_searches speculative searches
+    run per call.
+    """
+
+    def __init__(self, knowledge_source_ids: list, cache_scope: asyncio.Future, max_searches: int):
+        self.knowledge_source_ids = knowledge_source_ids
+        self.cache_scope = cache_scope
+        self.remaining = max_searches
+        self._pending = None  # debounced interim prefetch
+        self._running = None
+        self._latest = None  # (unit query vector, context, monotonic time)
+        self._seen = set()
+        self.used = 0
+
+    def observe(self, text: str, is_final: bool):
+        text = (text or "").strip()
+        if not text or self.remaining <= 0:
+            return
+        if not is_final and len(text.split()) < KB_PREFETCH_MIN_WORDS:
+            return
+        key = re.sub(r"[^\w\s]", "", text.lower())
+        if key in self._seen:
+            return
+        if self._pending and not self._pending.done():
+            self._pending.cancel()
+        delay = 0 if is_final else KB_PREFETCH_DEBOUNCE_SECONDS
+        self._pending = asyncio.create_task(self._schedule(text, key, delay, is_final))
+
+    async def _schedule(self, text: str, key: str, delay: float, is_final: bool):
+        if delay:
+            await asyncio.sleep(delay)
+        if self.remaining <= 0 or key in self._seen:
+            return
+        self._seen.add(key)
+        self.remaining -= 1
+        self._running = asyncio.create_task(self._prefetch(text, is_final))
+
+    async def _prefetch(self, text: str, is_final: bool):
+        try:
+            embedding = await generate_embedding(text, "text-embedding-3-small")
+            if not embedding:
+                return
+            cache_scope = await self.cache_scope if self.cache_scope else None
+            context = await kb_answer_cache.lookup(cache_scope, embedding)
+            if context is None:
+                context = await search_knowledge_base(self.knowledge_source_ids, text, limit=3)
+                if is_final:
+                    await kb_answer_cache.store(cache_scope, text, embedding, context)
+            self._latest = (KBAnswerCache._unit(embedding), context, time_module.monotonic())
+            logger.info(f"📚 Prefetched KB for '{text[:60]}' ({'found' if context else 'no'} chunks, {self.remaining} prefetches left)")
+        except Exception as e:
+            logger.warning(f"📚 KB prefetch failed: {e}")
+
+    async def take(self, query_embedding: list):
+        """Prefetched KB context relevant to the tool query, or None."""
+        if self._running and not self._running.done():
+            await asyncio.shield(self._running)
+        if not self._latest or not query_embedding:
+            return None
+        vector, context, fetched_at = self._latest
+        if not context or time_module.monotonic() - fetched_at > KB_PREFETCH_MAX_AGE_SECONDS:
+            return None
+        query = KBAnswerCache._unit(query_embedding)
+        if len(query) != len(vector) or sum(map(operator.mul, vector, query)) < KB_PREFETCH_MATCH_THRESHOLD:
+            return None
+        self.used += 1
+        return context
+
+
+# ============================================
+# Semantic Match Counter
+# ============================================
+
+SEMANTIC_MATCH_FLUSH_INTERVAL = 5.0  # seconds
+
+
+class SemanticMatchCounter:
+    """Batches conversation_contexts.semantic_match_count increments.
+
+    add() only queues ids; they are written together with one
+    increment_semantic_match_count_batch RPC a few seconds later (repeated ids are
+    counted once per occurrence). Call flush() on shutdown.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._flush_task = None
+
+    def add(self, memory_ids: list):
+        self._pending.extend(str(memory_id) for memory_id in memory_ids if memory_id)
+        if self._pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        memory_ids, self._pending = self._pending, []
+        if not memory_ids:
+            return
+        try:
+            await db_execute(supabase.rpc("increment_semantic_match_count_batch", {"memory_ids": memory_ids}))
+            logger.info(f"🔮 Incremented semantic match counts for {len(memory_ids)} memories")
+        except Exception as e:
+            logger.warning(f"Failed to increment semantic match counts: {e}")
+
+
+semantic_match_counter = SemanticMatchCounter(SEMANTIC_MATCH_FLUSH_INTERVAL)
+
+
 async def get_semantic_context(transcript_text: str, agent_id: str, user_id: str, current_contact_id: str = None, config: dict = None) -> tuple:
     """Get semantic context from similar past conversations.
     Returns (context_string, match_count, matched_topics_list, matched_memory_ids)."""
@@ -720,18 +2762,12 @@ async def get_semantic_context(transcript_text: str, agent_id: str, user_id: str
         if not similar:
             return "", 0, [], []
 
-        # Increment semantic_match_count for each matched memory
-        try:
-            for mem in similar:
-                mem_id = mem.get("id")
-                if mem_id:
-                    supabase.rpc("increment_semantic_match_count", {"memory_id": mem_id}).execute()
-        except Exception as inc_err:
-            logger.warning(f"Failed to increment semantic match counts: {inc_err}")
-
         # Collect matched memory IDs
         matched_memory_ids = [mem.get("id") for mem in similar if mem.get("id")]
 
+        # Increment semantic_match_count for each matched memory (batched, off the call path)
+        semantic_match_counter.add(matched_memory_ids)
+
         # Collect all matched topics
         all_matched_topics = []
         for mem in similar:
@@ -779,7 +2815,7 @@ async def _check_semantic_actions(agent_id: str, user_id: str, matched_topics: l
         if not supabase_url or not supabase_key:
             return
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_http_session() as session:
             async with session.post(
                 f"{supabase_url}/functions/v1/execute-semantic-action",
                 headers={
@@ -824,11 +2860,12 @@ async def deduct_call_credits(user_id: str, agent_id: str, duration_seconds: int
 
         if agent_id:
             try:
-                response = supabase.table("agent_configs") \
-                    .select("voice_id, llm_model") \
-                    .eq("id", agent_id) \
-                    .limit(1) \
-                    .execute()
+                response = await db_execute(
+                    supabase.table("agent_configs")
+                    .select("voice_id, llm_model")
+                    .eq("id", agent_id)
+                    .limit(1)
+                )
                 if response.data and len(response.data) > 0:
                     voice_id = response.data[0].get("voice_id")
                     ai_model = response.data[0].get("llm_model")
@@ -851,7 +2888,7 @@ async def deduct_call_credits(user_id: str, agent_id: str, duration_seconds: int
         if branded_call:
             payload["brandedCall"] = True
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_http_session() as session:
             async with session.post(
                 f"{supabase_url}/functions/v1/deduct-credits",
                 headers={
@@ -873,52 +2910,59 @@ async def deduct_call_credits(user_id: str, agent_id: str, duration_seconds: int
         return False
 
 
-async def update_caller_memory(caller_phone: str, user_id: str, agent_id: str, call_summary: str, call_record_id: str, transcript_text: str, generate_embedding_flag: bool = True, direction: str = None, service_number: str = None) -> bool:
-    """Update conversation memory for a caller after a call ends"""
+async def update_caller_memory(caller_phone: str, user_id: str, agent_id: str, call_summary: str, call_record_id: str, transcript_text: str, generate_embedding_flag: bool = True, direction: str = None, service_number: str = None, key_topics: list = None, caller_profile=None) -> bool:
+    """Update conversation memory for a caller after a call ends.
+
+    key_topics may be passed in when already extracted (combined post-call analysis);
+    otherwise they are extracted from transcript_text here. caller_profile (a CallerProfile
+    or its to_dict() form) is the profile loaded at call start; its contact is reused instead
+    of looked up again, and it is updated in place with what was written. The context row is
+    re-read before merging, since SMS webhooks or another call may have updated it since the
+    profile was loaded, and the merge is written together with the interaction count in one
+    statement (record_caller_interaction), which ignores a call it has already applied.
+    """
     if not caller_phone or not user_id or not agent_id or not call_summary:
         logger.info(f"🧠 Skipping memory update - missing required data (phone={bool(caller_phone)}, user={bool(user_id)}, agent={bool(agent_id)}, summary={bool(call_summary)})")
         return False
 
     try:
-        # Normalize phone number for lookup
-        normalized_phone = re.sub(r'[^\d+]', '', caller_phone)
-        if not normalized_phone.startswith('+'):
-            normalized_phone = '+' + normalized_phone
-
-        # Look up or create contact by phone number
-        contact_response = supabase.table("contacts") \
-            .select("id, name") \
-            .eq("phone_number", normalized_phone) \
-            .eq("user_id", user_id) \
-            .limit(1) \
-            .execute()
-
-        if not contact_response.data or len(contact_response.data) == 0:
+        if isinstance(caller_profile, dict):
+            caller_profile = CallerProfile.from_dict(caller_profile)
+        if caller_profile is None or not caller_profile.loaded or not caller_profile.matches(caller_phone, user_id, agent_id):
+            caller_profile = await load_caller_profile(caller_phone, user_id, agent_id)
+            if not caller_profile.loaded:
+                return False
+        normalized_phone = caller_profile.phone
+
+        if not caller_profile.contact:
             # Create new contact for this caller
             logger.info(f"🧠 Creating new contact for {normalized_phone}")
-            create_response = supabase.table("contacts") \
+            create_response = await db_execute(
+                supabase.table("contacts")
                 .insert({
                     "user_id": user_id,
                     "phone_number": normalized_phone,
                     "name": f"Caller {normalized_phone[-4:]}",  # Use last 4 digits as placeholder name
                     "is_whitelisted": False,
-                }) \
-                .select() \
-                .execute()
+                })
+                .select()
+            )
 
             if not create_response.data:
                 logger.error(f"🧠 Failed to create contact for {normalized_phone}")
                 return False
-            contact = create_response.data[0]
-        else:
-            contact = contact_response.data[0]
+            caller_profile.contact = {"id": create_response.data[0]["id"], "name": create_response.data[0].get("name")}
+        contact = caller_profile.contact
 
         contact_id = contact["id"]
         contact_name = contact.get("name", "Unknown")
 
-        # Extract key topics from transcript using OpenAI
-        key_topics = []
-        if transcript_text:
+        # Extract key topics from transcript using OpenAI (unless already provided)
+        if key_topics:
+            logger.info(f"🧠 Using pre-extracted topics: {key_topics}")
+        else:
+            key_topics = []
+        if not key_topics and transcript_text:
             try:
                 client = openai_client
                 topics_response = await client.chat.completions.create(
@@ -941,26 +2985,41 @@ Example output: ["pricing inquiry", "product demo request", "technical support"]
             except Exception as e:
                 logger.warning(f"🧠 Failed to extract topics: {e}")
 
-        # Get existing conversation context or create new one
-        context_response = supabase.table("conversation_contexts") \
-            .select("*") \
-            .eq("contact_id", contact_id) \
-            .eq("agent_id", agent_id) \
-            .limit(1) \
-            .execute()
+        # Re-read the conversation context right before merging: the profile was loaded at call
+        # start and this job may run much later. A profile without one is re-checked by contact,
+        # since another call from this number may have created it in the meantime.
+        existing_ctx = caller_profile.context
+        if existing_ctx and existing_ctx.get("id"):
+            context_response = await db_execute(
+                supabase.table("conversation_contexts")
+                .select(CALLER_CONTEXT_COLUMNS)
+                .eq("id", existing_ctx["id"])
+                .limit(1)
+            )
+            existing_ctx = context_response.data[0] if context_response.data else None
+        if existing_ctx is None:
+            context_response = await db_execute(
+                supabase.table("conversation_contexts")
+                .select(CALLER_CONTEXT_COLUMNS)
+                .eq("contact_id", contact_id)
+                .eq("agent_id", agent_id)
+                .limit(1)
+            )
+            existing_ctx = context_response.data[0] if context_response.data else None
+
+        if existing_ctx and call_record_id and str(call_record_id) in map(str, existing_ctx.get("last_call_ids") or []):
+            # A retried post-call job: this call is already merged and counted
+            logger.info(f"🧠 Memory for {contact_name} already includes call {call_record_id} - skipping")
+            caller_profile.context = existing_ctx
+            return True
 
-        if context_response.data and len(context_response.data) > 0:
+        if existing_ctx:
             # Update existing context
-            existing_ctx = context_response.data[0]
             existing_topics = existing_ctx.get("key_topics") or []
-            existing_call_ids = existing_ctx.get("last_call_ids") or []
 
             # Merge topics (keep unique, limit to 10 most recent)
             merged_topics = list(dict.fromkeys(key_topics + existing_topics))[:10]
 
-            # Keep last 5 call IDs
-            updated_call_ids = ([call_record_id] + existing_call_ids)[:5] if call_record_id else existing_call_ids
-
             # Update summary by appending new info
             existing_summary = existing_ctx.get("summary") or ""
             if existing_summary:
@@ -995,23 +3054,24 @@ Keep the most important information. Focus on the overall relationship and key n
                 embedding_text = f"{updated_summary}\n\nTopics: {', '.join(merged_topics)}"
                 embedding = await generate_embedding(embedding_text)
 
-            update_data = {
-                "summary": updated_summary,
-                "key_topics": merged_topics,
-                "interaction_count": (existing_ctx.get("interaction_count") or 0) + 1,
-                "last_call_ids": updated_call_ids,
-                "last_updated": datetime.datetime.now().isoformat(),
-            }
-
-            if embedding:
-                update_data["embedding"] = embedding
-
-            supabase.table("conversation_contexts") \
-                .update(update_data) \
-                .eq("id", existing_ctx["id"]) \
-                .execute()
+            # Merge and count in one statement: a retry after a partial write can't apply the
+            # call twice, and concurrent updates to the row aren't lost
+            count_response = await db_execute(supabase.rpc("record_caller_interaction", {
+                "p_context_id": existing_ctx["id"],
+                "p_call_record_id": call_record_id,
+                "p_summary": updated_summary,
+                "p_key_topics": merged_topics,
+                "p_embedding": embedding,
+            }))
+            interaction_count = count_response.data
+            update_data = {"summary": updated_summary, "key_topics": merged_topics}
+            if isinstance(interaction_count, int):
+                update_data["interaction_count"] = interaction_count
+            if call_record_id:
+                update_data["last_call_ids"] = list(dict.fromkeys([call_record_id] + (existing_ctx.get("last_call_ids") or [])))[:5]
+            caller_profile.context = {**existing_ctx, **update_data}
 
-            logger.info(f"🧠 Updated memory for {contact_name} ({normalized_phone}): now {(existing_ctx.get('interaction_count') or 0) + 1} interactions{' (with embedding)' if embedding else ''}")
+            logger.info(f"🧠 Updated memory for {contact_name} ({normalized_phone}): now {interaction_count} interactions{' (with embedding)' if embedding else ''}")
         else:
             # Generate embedding for new context
             embedding = None
@@ -1038,9 +3098,12 @@ Keep the most important information. Focus on the overall relationship and key n
                 insert_data["embedding"] = embedding
 
             # Create new conversation context
-            supabase.table("conversation_contexts") \
-                .insert(insert_data) \
-                .execute()
+            insert_response = await db_execute(
+                supabase.table("conversation_contexts")
+                .insert(insert_data)
+            )
+            caller_profile.context = dict(insert_response.data[0] if insert_response.data else insert_data)
+            caller_profile.context.pop("embedding", None)
 
             logger.info(f"🧠 Created new memory for {contact_name} ({normalized_phone}){' (with embedding)' if embedding else ''}")
 
@@ -1051,93 +3114,133 @@ Keep the most important information. Focus on the overall relationship and key n
         return False
 
 
-async def send_webhooks(user_id: str, event_type: str, payload: dict):
-    """Send webhook notifications to all active API keys with webhook URLs configured."""
+async def send_webhooks(user_id: str, event_type: str, payload: dict, event_id: str, timestamp: str) -> bool:
+    """Fan a webhook event out to all active API keys with webhook URLs configured.
+
+    Each endpoint gets its own post-call job (send_webhook), so a failing endpoint is
+    retried on its own without re-posting to the ones that accepted the event. Returns
+    False if the keys couldn't be looked up.
+    """
     try:
         # Find all active API keys for this user that have a webhook_url
-        response = supabase.table("api_keys") \
-            .select("id, webhook_url, webhook_secret") \
-            .eq("user_id", user_id) \
-            .eq("is_active", True) \
-            .not_.is_("webhook_url", "null") \
-            .execute()
-
-        if not response.data:
-            return
+        response = await db_execute(
+            supabase.table("api_keys")
+            .select("id")
+            .eq("user_id", user_id)
+            .eq("is_active", True)
+            .not_.is_("webhook_url", "null")
+        )
+    except Exception as e:
+        logger.error(f"🔔 send_webhooks error: {e}", exc_info=True)
+        return False
+
+    for key_row in response.data or []:
+        await submit_post_call_job("send_webhook", f"{event_id}:{key_row['id']}", {
+            "api_key_id": key_row["id"],
+            "event_id": event_id,
+            "event_type": event_type,
+            "timestamp": timestamp,
+            "payload": payload,
+        })
+    return True
+
+
+async def send_webhook(api_key_id: str, event_id: str, event_type: str, timestamp: str, payload: dict) -> bool:
+    """Deliver one webhook event to one API key's webhook URL.
+
+    The body (and so its signature) is identical on every attempt; `id` is stable per
+    event so receivers can drop repeats. Returns False on a network error or 5xx so the
+    post-call job is retried.
+    """
+    try:
+        response = await db_execute(
+            supabase.table("api_keys")
+            .select("webhook_url, webhook_secret")
+            .eq("id", api_key_id)
+            .eq("is_active", True)
+            .limit(1)
+        )
+        if not response.data or not response.data[0].get("webhook_url"):
+            return True
+        url = response.data[0]["webhook_url"]
+        secret = response.data[0].get("webhook_secret")
 
         webhook_body = json.dumps({
+            "id": event_id,
             "event": event_type,
-            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "timestamp": timestamp,
             "data": payload,
         })
+        start_ms = int(time_module.time() * 1000)
+        status_code = None
+        response_body = None
+        error_message = None
+
+        # Build headers with HMAC signature if secret exists
+        headers = {"Content-Type": "application/json"}
+        if secret:
+            signature = hmac.new(
+                secret.encode("utf-8"),
+                webhook_body.encode("utf-8"),
+                hashlib.sha256,
+            ).hexdigest()
+            headers["x-magpipe-signature"] = f"sha256={signature}"
 
-        async with aiohttp.ClientSession() as session:
-            for key_row in response.data:
-                api_key_id = key_row["id"]
-                url = key_row["webhook_url"]
-                secret = key_row.get("webhook_secret")
-                start_ms = int(time_module.time() * 1000)
-                status_code = None
-                response_body = None
-                error_message = None
-
-                # Build headers with HMAC signature if secret exists
-                headers = {"Content-Type": "application/json"}
-                if secret:
-                    signature = hmac.new(
-                        secret.encode("utf-8"),
-                        webhook_body.encode("utf-8"),
-                        hashlib.sha256,
-                    ).hexdigest()
-                    headers["x-magpipe-signature"] = f"sha256={signature}"
-
-                try:
-                    async with session.post(
-                        url,
-                        data=webhook_body,
-                        headers=headers,
-                        timeout=aiohttp.ClientTimeout(total=10),
-                    ) as resp:
-                        status_code = resp.status
-                        response_body = (await resp.text())[:2000]
-                        logger.info(f"🔔 Webhook delivered to {url} — status {status_code}")
-                except Exception as e:
-                    error_message = str(e)[:500]
-                    logger.warning(f"🔔 Webhook delivery failed for {url}: {e}")
+        try:
+            async with shared_http_session() as session:
+                async with session.post(
+                    url,
+                    data=webhook_body,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=10),
+                ) as resp:
+                    status_code = resp.status
+                    response_body = (await resp.text())[:2000]
+                    logger.info(f"🔔 Webhook delivered to {url} — status {status_code}")
+        except Exception as e:
+            error_message = str(e)[:500]
+            logger.warning(f"🔔 Webhook delivery failed for {url}: {e}")
 
-                duration_ms = int(time_module.time() * 1000) - start_ms
+        duration_ms = int(time_module.time() * 1000) - start_ms
 
-                # Log delivery attempt
-                try:
-                    supabase.table("webhook_deliveries").insert({
-                        "api_key_id": api_key_id,
-                        "event_type": event_type,
-                        "payload": json.loads(webhook_body),
-                        "status_code": status_code,
-                        "response_body": response_body,
-                        "error_message": error_message,
-                        "duration_ms": duration_ms,
-                    }).execute()
-                except Exception as log_err:
-                    logger.warning(f"🔔 Failed to log webhook delivery: {log_err}")
+        # Log delivery attempt
+        try:
+            await db_execute(supabase.table("webhook_deliveries").insert({
+                "api_key_id": api_key_id,
+                "event_type": event_type,
+                "payload": json.loads(webhook_body),
+                "status_code": status_code,
+                "response_body": response_body,
+                "error_message": error_message,
+                "duration_ms": duration_ms,
+            }))
+        except Exception as log_err:
+            logger.warning(f"🔔 Failed to log webhook delivery: {log_err}")
+
+        return status_code is not None and status_code < 500
 
     except Exception as e:
-        logger.error(f"🔔 send_webhooks error: {e}", exc_info=True)
+        logger.error(f"🔔 send_webhook error: {e}", exc_info=True)
+        return False
 
 
-async def trigger_event_skills(call_context: dict):
+async def trigger_event_skills(call_context: dict) -> bool:
     """Trigger event-based skills for this agent after a call ends.
-    Fire-and-forget — never crashes the call flow."""
+
+    Never raises. execute-skill doesn't dedupe by call, so this returns False (post-call job
+    retried) only when the request never reached it; once sent, a failure or timeout is
+    logged and not retried, since the skills may already have run.
+    """
     try:
         supabase_url = os.environ.get("SUPABASE_URL")
         service_role_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
         if not supabase_url or not service_role_key:
             logger.warning("⚡ Skills: Missing SUPABASE_URL or SERVICE_ROLE_KEY")
-            return
+            return False
 
         agent_id = call_context.get("agent_id")
         if not agent_id:
-            return
+            return True
 
         payload = {
             "event_type": "call_ends",
@@ -1152,7 +3255,7 @@ async def trigger_event_skills(call_context: dict):
             }
         }
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_http_session() as session:
             async with session.post(
                 f"{supabase_url}/functions/v1/execute-skill",
                 headers={
@@ -1167,8 +3270,12 @@ async def trigger_event_skills(call_context: dict):
                     text = await response.text()
                     logger.warning(f"⚡ Skills trigger error: {text}")
 
+    except aiohttp.ClientConnectorError as e:
+        logger.warning(f"⚡ Skills trigger could not connect, will retry: {e}")
+        return False
     except Exception as e:
         logger.error(f"⚡ Skills trigger failed (non-fatal): {e}")
+    return True
 
 
 async def send_extracted_data_slack(
@@ -1219,7 +3326,7 @@ async def send_extracted_data_slack(
             "Authorization": f"Bearer {supabase_key}",
         }
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_http_session() as session:
             async with session.post(url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as resp:
                 if resp.status == 200:
                     logger.info(f"📊 Extracted data Slack notifications sent ({len(variables)} variables)")
@@ -1233,19 +3340,7 @@ async def send_extracted_data_slack(
 
 def normalize_voice_to_digits(text: str) -> str:
     """Convert spoken numbers to digit string (e.g., 'one two three' -> '123')"""
-    # Map of spoken numbers to digits
-    word_to_digit = {
-        "zero": "0", "oh": "0", "o": "0",
-        "one": "1", "won": "1",
-        "two": "2", "to": "2", "too": "2",
-        "three": "3", "tree": "3",
-        "four": "4", "for": "4", "fore": "4",
-        "five": "5",
-        "six": "6", "sicks": "6",
-        "seven": "7",
-        "eight": "8", "ate": "8",
-        "nine": "9", "niner": "9",
-    }
+    word_to_digit = SPOKEN_DIGIT_WORDS
 
     # Split text into words and convert to digits
     words = text.lower().split()
@@ -1271,11 +3366,12 @@ async def check_phone_admin_access(caller_number: str) -> dict:
         normalized = re.sub(r'[^\d]', '', caller_number)
 
         # Query users table for matching phone number
-        response = supabase.table("users") \
-            .select("id, name, phone_number, phone_admin_access_code, phone_admin_locked") \
-            .eq("phone_number", f"+{normalized}") \
-            .limit(1) \
-            .execute()
+        response = await db_execute(
+            supabase.table("users")
+            .select("id, name, phone_number, phone_admin_access_code, phone_admin_locked")
+            .eq("phone_number", f"+{normalized}")
+            .limit(1)
+        )
 
         if response.data and len(response.data) > 0:
             user_data = response.data[0]
@@ -1313,12 +3409,12 @@ async def verify_access_code(user_id: str, spoken_code: str, access_code_hash: s
 async def log_access_attempt(user_id: str, success: bool, caller_number: str):
     """Log access code attempt to database"""
     try:
-        supabase.table("access_code_attempts").insert({
+        await db_execute(supabase.table("access_code_attempts").insert({
             "user_id": user_id,
             "success": success,
             "attempted_at": datetime.datetime.now().isoformat(),
             "caller_phone": caller_number,
-        }).execute()
+        }))
     except Exception as e:
         logger.error(f"Failed to log access attempt: {e}")
 
@@ -1329,12 +3425,13 @@ async def check_and_lock_account(user_id: str) -> bool:
         # Get failed attempts in last 15 minutes
         time_window = datetime.datetime.now() - datetime.timedelta(minutes=15)
 
-        response = supabase.table("access_code_attempts") \
-            .select("*", count="exact") \
-            .eq("user_id", user_id) \
-            .eq("success", False) \
-            .gte("attempted_at", time_window.isoformat()) \
-            .execute()
+        response = await db_execute(
+            supabase.table("access_code_attempts")
+            .select("*", count="exact")
+            .eq("user_id", user_id)
+            .eq("success", False)
+            .gte("attempted_at", time_window.isoformat())
+        )
 
         failed_count = response.count or 0
 
@@ -1342,10 +3439,10 @@ async def check_and_lock_account(user_id: str) -> bool:
 
         if failed_count >= 5:
             # Lock the account
-            supabase.table("users").update({
+            await db_execute(supabase.table("users").update({
                 "phone_admin_locked": True,
                 "phone_admin_locked_at": datetime.datetime.now().isoformat(),
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
 
             logger.warning(f"Account locked for user {user_id} due to {failed_count} failed attempts")
             return True
@@ -1388,7 +3485,7 @@ def create_transfer_tool(user_id: str, transfer_numbers: list, room_name: str):
             signalwire_token = os.getenv("SIGNALWIRE_API_TOKEN")
 
             # Call SignalWire API to transfer the active call
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 auth = aiohttp.BasicAuth(signalwire_project, signalwire_token)
 
                 # Get current call SID from room metadata
@@ -1536,7 +3633,7 @@ def create_warm_transfer_tools(user_id: str, transfer_numbers: list, room_name:
             # Call the warm-transfer edge function to:
             # 1. Put caller on hold (silent - just music, agent already spoke)
             # 2. Dial transferee and connect them to LiveKit room
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 async with session.post(
                     f"{supabase_url}/functions/v1/warm-transfer",
                     headers={
@@ -1581,7 +3678,7 @@ def create_warm_transfer_tools(user_id: str, transfer_numbers: list, room_name:
             return "There's no active transfer to complete."
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 async with session.post(
                     f"{supabase_url}/functions/v1/warm-transfer",
                     headers={
@@ -1621,7 +3718,7 @@ def create_warm_transfer_tools(user_id: str, transfer_numbers: list, room_name:
             return "There's no active transfer to cancel."
 
         try:
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 async with session.post(
                     f"{supabase_url}/functions/v1/warm-transfer",
                     headers={
@@ -1670,18 +3767,22 @@ def create_collect_data_tool(user_id: str, pii_mode: str = "enabled"):
         # PII redacted mode: redact the value before storing
         store_value = data_value
         if pii_mode == "redacted":
-            store_value = await redact_pii(data_value)
+            # A collected name or address is PII in its entirety - no need to ask the LLM
+            if data_type.strip().lower() in PII_WHOLE_VALUE_DATA_TYPES:
+                store_value = PII_PLACEHOLDER
+            else:
+                store_value = await redact_pii(data_value)
             logger.info(f"🔒 PII redacted for {data_type}: {data_value} -> {store_value}")
 
         # Store in database
         try:
-            supabase.table("collected_call_data").insert({
+            await db_execute(supabase.table("collected_call_data").insert({
                 "user_id": user_id,
                 "data_type": data_type,
                 "data_value": store_value,
                 "context": context,
                 "collected_at": "now()",
-            }).execute()
+            }))
 
             return f"I've noted that information. Thank you!"
         except Exception as e:
@@ -1691,8 +3792,50 @@ def create_collect_data_tool(user_id: str, pii_mode: str = "enabled"):
     return collect_caller_data
 
 
+async def terminate_outbound_pstn_leg(room_name: str):
+    """Hang up the PSTN leg of an outbound conference bridge call via SignalWire.
+
+    The agent CXML uses endConferenceOnExit=false, so the callee would otherwise stay
+    in a silent empty conference after the LiveKit room is gone.
+    """
+    if not room_name.startswith("outbound-"):
+        return
+    outbound_call_record_id = room_name[len("outbound-"):]
+    try:
+        resp = await db_execute(supabase.table("call_records").select("call_sid").eq("id", outbound_call_record_id).single())
+        pstn_call_sid = resp.data.get("call_sid") if resp.data else None
+        if pstn_call_sid:
+            sw_space = os.getenv("SIGNALWIRE_SPACE_URL") or os.getenv("SIGNALWIRE_SPACE")
+            sw_project = os.getenv("SIGNALWIRE_PROJECT_ID")
+            sw_token = os.getenv("SIGNALWIRE_API_TOKEN")
+            async with shared_http_session() as session:
+                url = f"https://{sw_space}/api/laml/2010-04-01/Accounts/{sw_project}/Calls/{pstn_call_sid}.json"
+                async with session.post(url, data={"Status": "completed"},
+                                        auth=aiohttp.BasicAuth(sw_project, sw_token)) as r:
+                    body = await r.text()
+                    logger.info(f"📞 PSTN leg terminate: call_sid={pstn_call_sid} status={r.status} body={body[:200]}")
+        else:
+            logger.warning(f"📞 No call_sid found for outbound call record {outbound_call_record_id}")
+    except Exception as sw_err:
+        logger.error(f"Failed to terminate PSTN leg: {sw_err}")
+
+
+async def delete_livekit_room(room_name: str):
+    """Delete the LiveKit room, disconnecting every participant."""
+    livekit_url = os.getenv("LIVEKIT_URL")
+    livekit_api_key = os.getenv("LIVEKIT_API_KEY")
+    livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
+    async with api.LiveKitAPI(livekit_url, livekit_api_key, livekit_api_secret) as livekit_api:
+        await livekit_api.room.delete_room(api.DeleteRoomRequest(room=room_name))
+    logger.info(f"✅ Call ended - room {room_name} deleted")
+
+
 def create_end_call_tool(room_name: str, description: str = None, pre_disconnect_callback=None):
-    """Create end call tool that allows the agent to hang up when appropriate"""
+    """Create end call tool that allows the agent to hang up when appropriate.
+
+    pre_disconnect_callback is called synchronously before hanging up; it should snapshot
+    whatever it needs and schedule post-call work in the background rather than block.
+    """
 
     tool_description = description or "End the phone call. Use this when the conversation is complete, the caller says goodbye, or there's nothing more to discuss."
 
@@ -1702,42 +3845,22 @@ def create_end_call_tool(room_name: str, description: str = None, pre_disconnect
         logger.info(f"📞 Agent ending call for room: {room_name}")
 
         try:
-            # Save transcript and memory BEFORE deleting the room
+            # Snapshot the transcript and hand post-call processing off before hanging up
             if pre_disconnect_callback:
                 try:
-                    await pre_disconnect_callback()
+                    pre_disconnect_callback()
                 except Exception as cb_err:
                     logger.error(f"Error in pre-disconnect callback: {cb_err}")
 
-            # For outbound conference bridge calls, hang up the PSTN leg via SignalWire
-            # BEFORE deleting the LiveKit room. The agent CXML uses endConferenceOnExit=false
-            # so the callee would otherwise stay in a silent empty conference.
-            if room_name.startswith("outbound-"):
-                outbound_call_record_id = room_name[len("outbound-"):]
-                try:
-                    resp = supabase.table("call_records").select("call_sid").eq("id", outbound_call_record_id).single().execute()
-                    pstn_call_sid = resp.data.get("call_sid") if resp.data else None
-                    if pstn_call_sid:
-                        sw_space = os.getenv("SIGNALWIRE_SPACE_URL") or os.getenv("SIGNALWIRE_SPACE")
-                        sw_project = os.getenv("SIGNALWIRE_PROJECT_ID")
-                        sw_token = os.getenv("SIGNALWIRE_API_TOKEN")
-                        async with aiohttp.ClientSession() as session:
-                            url = f"https://{sw_space}/api/laml/2010-04-01/Accounts/{sw_project}/Calls/{pstn_call_sid}.json"
-                            async with session.post(url, data={"Status": "completed"},
-                                                    auth=aiohttp.BasicAuth(sw_project, sw_token)) as r:
-                                body = await r.text()
-                                logger.info(f"📞 PSTN leg terminate: call_sid={pstn_call_sid} status={r.status} body={body[:200]}")
-                    else:
-                        logger.warning(f"📞 No call_sid found for outbound call record {outbound_call_record_id}")
-                except Exception as sw_err:
-                    logger.error(f"Failed to terminate PSTN leg: {sw_err}")
-
-            livekit_url = os.getenv("LIVEKIT_URL")
-            livekit_api_key = os.getenv("LIVEKIT_API_KEY")
-            livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
-            async with api.LiveKitAPI(livekit_url, livekit_api_key, livekit_api_secret) as livekit_api:
-                await livekit_api.room.delete_room(api.DeleteRoomRequest(room=room_name))
-            logger.info(f"✅ Call ended - room {room_name} deleted")
+            # Terminate the PSTN leg (outbound bridge calls) and delete the room concurrently.
+            # Shielded so room teardown cancelling this tool can't abort the hang-up halfway.
+            results = await asyncio.shield(asyncio.gather(
+                terminate_outbound_pstn_leg(room_name),
+                delete_livekit_room(room_name),
+                return_exceptions=True,
+            ))
+            if isinstance(results[1], BaseException):
+                raise results[1]
 
             return "Call ended successfully."
         except Exception as e:
@@ -1778,7 +3901,7 @@ def create_sms_tool(user_id: str, service_number: str, description: str = None,
             elif len(digits) == 11 and digits.startswith('1'):
                 to_number = f"+{digits}"
 
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 auth = aiohttp.BasicAuth(signalwire_project, signalwire_token)
                 sms_url = f"https://{signalwire_space}/api/laml/2010-04-01/Accounts/{signalwire_project}/Messages.json"
 
@@ -1815,7 +3938,7 @@ def create_sms_tool(user_id: str, service_number: str, description: str = None,
                             }
                             if agent_id:
                                 insert_data["agent_id"] = agent_id
-                            supabase.table("sms_messages").insert(insert_data).execute()
+                            await db_execute(supabase.table("sms_messages").insert(insert_data))
                         except Exception as db_err:
                             logger.error(f"Failed to save SMS to database: {db_err}")
 
@@ -1865,9 +3988,9 @@ def create_get_availability_tool(user_id: str, description: str = None):
             end_date = start_date + datetime.timedelta(days=1)
 
             # Call our Cal.com edge function
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 # Get user's access token from database
-                user_data = supabase.table("users").select("cal_com_access_token").eq("id", user_id).single().execute()
+                user_data = await db_execute(supabase.table("users").select("cal_com_access_token").eq("id", user_id).single())
 
                 if not user_data.data or not user_data.data.get("cal_com_access_token"):
                     return "I don't have access to the calendar right now. Would you like to leave your contact information instead?"
@@ -1961,7 +4084,7 @@ def create_book_appointment_tool(user_id: str, description: str = None):
                 else:
                     return "I couldn't understand that time. Could you please specify the time again, like '2 PM tomorrow'?"
 
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 async with session.post(
                     f"{supabase_url}/functions/v1/cal-com-create-booking",
                     headers={
@@ -2022,7 +4145,7 @@ def create_voice_clone_tool(user_id: str):
             elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 
             # Download audio sample
-            async with aiohttp.ClientSession() as session:
+            async with shared_http_session() as session:
                 async with session.get(audio_sample_url) as resp:
                     if resp.status != 200:
                         return "I couldn't download the audio sample. Please try again."
@@ -2044,13 +4167,13 @@ def create_voice_clone_tool(user_id: str):
                         voice_id = result.get("voice_id")
 
                         # Store in database
-                        supabase.table("voices").insert({
+                        await db_execute(supabase.table("voices").insert({
                             "user_id": user_id,
                             "voice_id": voice_id,
                             "voice_name": voice_name,
                             "is_cloned": True,
                             "created_at": "now()",
-                        }).execute()
+                        }))
 
                         logger.info(f"Voice cloned successfully: {voice_id}")
                         return f"I've successfully cloned your voice as '{voice_name}'. You can now use it for calls!"
@@ -2074,17 +4197,94 @@ def create_voice_clone_tool(user_id: str):
 async def get_custom_functions(agent_id: str) -> list:
     """Fetch active custom functions for an agent from database"""
     try:
-        response = supabase.table("custom_functions") \
-            .select("*") \
-            .eq("agent_id", agent_id) \
-            .eq("is_active", True) \
-            .execute()
-        return response.data or []
+        async def _load_functions():
+            response = await db_execute(
+                supabase.table("custom_functions")
+                .select("*")
+                .eq("agent_id", agent_id)
+                .eq("is_active", True)
+            )
+            return response.data or []
+
+        functions = await agent_config_cache.get(agent_id, "custom_functions", _load_functions)
+
+        # The config cache keeps header names but not values (credentials); read those back
+        with_headers = [f["id"] for f in functions if any("value" not in h for h in f.get("headers") or [])]
+        if with_headers:
+            response = await db_execute(
+                supabase.table("custom_functions")
+                .select("id, headers")
+                .in_("id", with_headers)
+            )
+            headers_by_id = {row["id"]: row.get("headers") for row in response.data or []}
+            functions = [{**f, "headers": headers_by_id[f["id"]]} if f["id"] in headers_by_id else f for f in functions]
+        return functions
     except Exception as e:
         logger.error(f"Error fetching custom functions: {e}")
         return []
 
 
+async def get_transfer_numbers(user_id: str, agent_id: str = None) -> list:
+    """Fetch the user's transfer numbers (legacy transfer_numbers table)"""
+    async def _load_transfer_numbers():
+        response = await db_execute(
+            supabase.table("transfer_numbers")
+            .select("*")
+            .eq("user_id", user_id)
+        )
+        return response.data or []
+
+    return await agent_config_cache.get(agent_id, "transfer_numbers", _load_transfer_numbers)
+
+
+async def get_sms_from_number(agent_id: str) -> str:
+    """Find an SMS-capable service number assigned to the agent (may differ from the voice number)"""
+    async def _load_sms_numbers():
+        response = await db_execute(
+            supabase.table("service_numbers")
+            .select("phone_number, capabilities")
+            .eq("agent_id", str(agent_id))
+            .eq("is_active", True)
+        )
+        return response.data or []
+
+    sms_numbers = await agent_config_cache.get(agent_id, "sms_numbers", _load_sms_numbers)
+    logger.info(f"📱 SMS lookup result: {len(sms_numbers)} rows, data={sms_numbers}")
+    for sn in sms_numbers:
+        caps = sn.get("capabilities") or {}
+        logger.info(f"📱 Checking number {sn.get('phone_number')}: caps={caps}, caps_type={type(caps).__name__}, sms={caps.get('sms')}")
+        if caps.get("sms"):
+            return sn["phone_number"]
+    return None
+
+
+async def get_sms_templates(user_id: str, agent_id: str = None) -> list:
+    """Fetch the user's pre-configured SMS templates"""
+    async def _load_templates():
+        response = await db_execute(
+            supabase.table("sms_templates")
+            .select("name, content")
+            .eq("user_id", user_id)
+        )
+        return response.data or []
+
+    return await agent_config_cache.get(agent_id, "sms_templates", _load_templates)
+
+
+async def has_cal_com_connection(user_id: str, agent_id: str = None) -> bool:
+    """Check whether the user has connected Cal.com"""
+    async def _load_cal_com():
+        response = await db_execute(
+            supabase.table("users")
+            .select("cal_com_access_token")
+            .eq("id", user_id)
+            .single()
+        )
+        return bool(response.data and response.data.get("cal_com_access_token"))
+
+    return await agent_config_cache.get(agent_id, "cal_com_connected", _load_cal_com)
+
+
 def extract_json_path(data: dict, path: str):
     """Simple JSON path extraction (supports $.key.subkey format)"""
     try:
@@ -2108,21 +4308,39 @@ def extract_json_path(data: dict, path: str):
         return None
 
 
-def create_kb_search_tool(kb_source_ids: list, say_filler_ref: list):
+def create_kb_search_tool(kb_source_ids: list, say_filler_ref: list, cache_scope: asyncio.Future = None, prefetcher: "KBPrefetcher" = None):
     """Create tool for mid-conversation knowledge base searches.
-    Lets the LLM look up answers the pre-loaded KB context doesn't cover."""
+    Lets the LLM look up answers the pre-loaded KB context doesn't cover.
+    Results are shared across the agent's calls through kb_answer_cache under `cache_scope`
+    (a future resolving to KBAnswerCache.scope_for); `prefetcher` supplies results already
+    fetched from the caller's speech."""
 
     @function_tool(description="Search the knowledge base for information to answer the caller's question. Use this whenever the caller asks something you don't already know the answer to.")
     async def search_kb(
         query: Annotated[str, "The caller's question or topic to search for"],
     ):
         """Search knowledge base and return relevant information"""
+        scope = await cache_scope if cache_scope else None
+        # Same model as search_knowledge_base, so its lookup below is an embedding cache hit
+        query_embedding = await generate_embedding(query, "text-embedding-3-small") if scope else None
+        if query_embedding:
+            cached = await kb_answer_cache.lookup(scope, query_embedding)
+            if cached:
+                return f"Here is what I found:\n{cached}"
+            prefetched = await prefetcher.take(query_embedding) if prefetcher else None
+            if prefetched:
+                logger.info(f"📚 KB search '{query}' answered from prefetch")
+                return f"Here is what I found:\n{prefetched}"
+
         if say_filler_ref and say_filler_ref[0]:
             phrase = random.choice(THINKING_FILLERS)
             logger.info(f"🔍 KB search: '{query}', saying filler: '{phrase}'")
             say_filler_ref[0](phrase)
 
+        search_start = time_module.monotonic()
         context = await search_knowledge_base(kb_source_ids, query, limit=3)
+        if scope:
+            await kb_answer_cache.store(scope, query, query_embedding, context, (time_module.monotonic() - search_start) * 1000)
         if context:
             return f"Here is what I found:\n{context}"
         return "I couldn't find specific information about that in our knowledge base."
@@ -2201,14 +4419,14 @@ def create_custom_function_tool(func_config: dict, webhook_secret: str = None, s
             timeout = aiohttp.ClientTimeout(total=timeout_ms / 1000)
             logger.info(f"🔧 Custom function '{func_name}' -> {http_method} {endpoint_url} (headers: {list(headers.keys())})")
 
-            async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with shared_http_session() as session:
                 for attempt in range(max_retries + 1):
                     try:
                         if http_method == 'GET':
-                            async with session.get(endpoint_url, params=params, headers=headers) as resp:
+                            async with session.get(endpoint_url, params=params, headers=headers, timeout=timeout) as resp:
                                 result = await resp.json()
                         else:
-                            async with session.request(http_method, endpoint_url, json=params, headers=headers) as resp:
+                            async with session.request(http_method, endpoint_url, json=params, headers=headers, timeout=timeout) as resp:
                                 result = await resp.json()
 
                         logger.info(f"🔧 Custom function '{func_name}' response (status {resp.status}): {str(result)[:500]}")
@@ -2280,112 +4498,867 @@ def create_custom_function_tool(func_config: dict, webhook_secret: str = None, s
             if param.get('required'):
                 required_params.append(param['name'])
 
-        raw_schema = {
-            "name": func_name,
-            "description": func_description,
-            "parameters": {
-                "type": "object",
-                "properties": properties,
-                "additionalProperties": False,
-            },
+        raw_schema = {
+            "name": func_name,
+            "description": func_description,
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "additionalProperties": False,
+            },
+        }
+        if required_params:
+            raw_schema["parameters"]["required"] = required_params
+
+        @function_tool(raw_schema=raw_schema)
+        async def custom_fn_raw(raw_arguments: dict[str, object]):
+            """Execute a custom webhook function"""
+            params = dict(raw_arguments)
+            logger.info(f"🔧 [raw_schema] Custom function '{func_name}' called with params: {params}")
+            return await _execute_custom_function(params)
+
+        logger.info(f"🔧 Created '{func_name}' as RawFunctionTool (typed params)")
+        return custom_fn_raw
+
+    except Exception as e:
+        logger.warning(f"🔧 raw_schema failed for '{func_name}': {e}, falling back to FunctionTool")
+
+    # --- Fallback: FunctionTool with name= parameter ---
+    try:
+        param_descriptions = []
+        for param in body_schema:
+            required_str = " (required)" if param.get('required') else ""
+            param_descriptions.append(f"- {param['name']}: {param.get('description', '')}{required_str}")
+        full_description = func_description
+        if param_descriptions:
+            full_description += "\n\nParameters:\n" + "\n".join(param_descriptions)
+
+        @function_tool(name=func_name, description=full_description)
+        async def custom_fn_named(
+            parameters: Annotated[str, "JSON string of parameters"]
+        ):
+            """Execute a custom webhook function"""
+            logger.info(f"🔧 [named] Custom function '{func_name}' called with: {parameters!r}")
+            params = {}
+            if parameters:
+                if isinstance(parameters, dict):
+                    params = parameters
+                elif isinstance(parameters, str):
+                    try:
+                        params = json.loads(parameters)
+                    except json.JSONDecodeError:
+                        if body_schema and len(body_schema) == 1:
+                            params = {body_schema[0]['name']: parameters}
+                        else:
+                            params = {"raw_input": parameters}
+            return await _execute_custom_function(params)
+
+        logger.info(f"🔧 Created '{func_name}' as FunctionTool with name= (fallback 1)")
+        return custom_fn_named
+
+    except Exception as e:
+        logger.warning(f"🔧 name= failed for '{func_name}': {e}, falling back to __name__ override")
+
+    # --- Last resort: set __name__ before decoration ---
+    param_descriptions = []
+    for param in body_schema:
+        required_str = " (required)" if param.get('required') else ""
+        param_descriptions.append(f"- {param['name']}: {param.get('description', '')}{required_str}")
+    full_description = func_description
+    if param_descriptions:
+        full_description += "\n\nParameters:\n" + "\n".join(param_descriptions)
+
+    async def custom_fn_legacy(
+        parameters: Annotated[str, "JSON string of parameters"]
+    ):
+        """Execute a custom webhook function"""
+        logger.info(f"🔧 [legacy] Custom function '{func_name}' called with: {parameters!r}")
+        params = {}
+        if parameters:
+            if isinstance(parameters, dict):
+                params = parameters
+            elif isinstance(parameters, str):
+                try:
+                    params = json.loads(parameters)
+                except json.JSONDecodeError:
+                    if body_schema and len(body_schema) == 1:
+                        params = {body_schema[0]['name']: parameters}
+                    else:
+                        params = {"raw_input": parameters}
+        return await _execute_custom_function(params)
+
+    # Set name BEFORE decoration so the decorator picks it up
+    custom_fn_legacy.__name__ = func_name
+    custom_fn_legacy.__qualname__ = func_name
+    tool = function_tool(description=full_description)(custom_fn_legacy)
+    logger.info(f"🔧 Created '{func_name}' as FunctionTool with __name__ override (fallback 2, tool.info.name={tool.info.name})")
+    return tool
+
+
+# ============================================
+# Transcript Buffer
+# ============================================
+
+class TranscriptBuffer:
+    """Append-only call transcript.
+
+    Each turn is rendered once ("Agent: ..." / "Caller: ...") and the joined text is extended
+    incrementally, so nothing is rebuilt from scratch per turn. Partial writes stream only the
+    turns not yet sent via the append_call_transcript RPC, so per-turn cost doesn't grow with
+    call length. `messages` keeps the raw [{"speaker", "text"}] list for billing/analysis.
+
+    With `redact` set (PII "redacted" mode) the turns of each flush go through redact_pii
+    together, so a flush costs at most one redaction request; `text` stays unredacted for
+    post-call processing.
+    """
+
+    SEPARATOR = "\n\n"
+
+    def __init__(self, redact: bool = False):
+        self.redact = redact
+        self.messages = []
+        self._lines = []
+        self._redacted_lines = []  # redacted copies of _lines, filled as turns are streamed
+        self._text = ""
+        self._text_lines = 0  # lines already folded into _text
+        self._flushed = 0  # lines already written to call_records.transcript
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, speaker: str, text: str):
+        self.messages.append({"speaker": speaker, "text": text})
+        self._lines.append(f"{'Agent' if speaker == 'agent' else 'Caller'}: {text}")
+
+    @property
+    def text(self) -> str:
+        if self._text_lines < len(self._lines):
+            new_text = self.SEPARATOR.join(self._lines[self._text_lines:])
+            self._text = f"{self._text}{self.SEPARATOR}{new_text}" if self._text else new_text
+            self._text_lines = len(self._lines)
+        return self._text
+
+    async def flush_partial(self, call_record_id: str):
+        """Append turns not yet written to call_records.transcript (delta only).
+
+        Falls back to a full rewrite if the stored transcript is out of step with what this
+        buffer has sent, or if the append RPC isn't available.
+        """
+        async with self._flush_lock:
+            total = len(self._lines)
+            if total <= self._flushed:
+                return
+            outgoing = self._lines
+            if self.redact:
+                new_lines = self._lines[len(self._redacted_lines):total]
+                if new_lines:
+                    redacted = (await redact_pii(self.SEPARATOR.join(new_lines))).split(self.SEPARATOR)
+                    if len(redacted) != len(new_lines):
+                        # Turn boundaries didn't survive redaction; redact turn by turn instead
+                        redacted = [await redact_pii(line) for line in new_lines]
+                    self._redacted_lines.extend(redacted)
+                outgoing = self._redacted_lines
+            pending = outgoing[self._flushed:total]
+            try:
+                response = await db_execute(supabase.rpc("append_call_transcript", {
+                    "p_call_record_id": call_record_id,
+                    "p_from_segment": self._flushed,
+                    "p_segments": pending,
+                }))
+                if response.data == total:
+                    self._flushed = total
+                    logger.info(f"📝 Partial transcript appended ({len(pending)} new, {total} msgs)")
+                    return
+                logger.warning(f"📝 Stored transcript out of step (has {response.data}, expected {self._flushed}) - rewriting")
+                rewrite = {"transcript": self.SEPARATOR.join(outgoing[:total]), "transcript_segment_count": total}
+            except Exception as e:
+                logger.warning(f"📝 Transcript append RPC failed, rewriting full transcript: {e}")
+                rewrite = {"transcript": self.SEPARATOR.join(outgoing[:total])}
+            try:
+                await db_execute(supabase.table("call_records").update(rewrite).eq("id", call_record_id))
+                self._flushed = total
+                logger.info(f"📝 Partial transcript written ({total} msgs)")
+            except Exception as e:
+                logger.warning(f"⚠️ Partial transcript write failed: {e}")
+
+
+# ============================================
+# Post-Call Job Queue
+# ============================================
+
+POST_CALL_QUEUE_ENABLED = os.getenv("POST_CALL_QUEUE_ENABLED", "true").lower() != "false"
+# Pending jobs only survive a redeploy if this path is on a persistent volume
+POST_CALL_QUEUE_PATH = os.getenv("POST_CALL_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "magpipe-post-call-queue.db"))
+POST_CALL_QUEUE_CONCURRENCY = int(os.getenv("POST_CALL_QUEUE_CONCURRENCY", "4"))
+POST_CALL_QUEUE_MAX_ATTEMPTS = int(os.getenv("POST_CALL_QUEUE_MAX_ATTEMPTS", "6"))
+POST_CALL_JOB_LEASE_SECONDS = 300.0  # A running job not finished by then is retried (consumer died)
+
+
+class PostCallQueue(SQLiteStore):
+    """Durable on-disk queue for post-call work.
+
+    Job processes enqueue and may exit as soon as the call ends; a consumer loop in the
+    long-lived worker process drains the queue with bounded concurrency. Every job has an
+    idempotency key (enqueueing the same key again is a no-op), failures are retried with
+    exponential backoff up to max_attempts, and jobs left running by a dead consumer are
+    picked up again once their lease expires. Payloads can hold raw transcripts, so a
+    payload is cleared as soon as its job is done or has failed for good; only the row is
+    kept, for idempotency. Storage errors propagate (a lost job must not look enqueued).
+    """
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS post_call_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_post_call_jobs_ready ON post_call_jobs(status, next_run_at)",
+    )
+    _TIMEOUT = 30.0
+    _ROW_FACTORY = sqlite3.Row
+
+    def __init__(self, path: str, concurrency: int, max_attempts: int, lease_seconds: float):
+        super().__init__(path)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self._handlers = {}
+
+    def handler(self, kind: str):
+        """Decorator registering `async fn(payload: dict)` for a job kind. Raise to retry."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def _enqueue_sync(self, kind: str, idempotency_key: str, payload: dict) -> bool:
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO post_call_jobs (idempotency_key, kind, payload, next_run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (idempotency_key, kind, json.dumps(payload, default=str), now, now, now),
+            )
+            return cursor.rowcount > 0
+
+    def _claim_sync(self, limit: int) -> list:
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, kind, payload, attempts, idempotency_key FROM post_call_jobs "
+                    "WHERE (status = 'pending' AND next_run_at <= ?) OR (status = 'running' AND locked_until < ?) "
+                    "ORDER BY next_run_at LIMIT ?",
+                    (now, now, limit),
+                ).fetchall()
+                for row in rows:
+                    conn.execute(
+                        "UPDATE post_call_jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ? WHERE id = ?",
+                        (now + self.lease_seconds, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def _finish_sync(self, job: dict, error: str = None):
+        now = time_module.time()
+        with contextlib.closing(self._connect()) as conn:
+            if error is None:
+                conn.execute("UPDATE post_call_jobs SET status = 'done', payload = '{}', last_error = NULL, updated_at = ? WHERE id = ?", (now, job["id"]))
+            elif job["attempts"] >= self.max_attempts:
+                conn.execute("UPDATE post_call_jobs SET status = 'failed', payload = '{}', last_error = ?, updated_at = ? WHERE id = ?", (error, now, job["id"]))
+            else:
+                backoff = min(5 * 2 ** (job["attempts"] - 1), 600) * random.uniform(0.8, 1.2)
+                conn.execute(
+                    "UPDATE post_call_jobs SET status = 'pending', next_run_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (now + backoff, error, now, job["id"]),
+                )
+            # Keep finished job rows (without payloads) a day for debugging / idempotency
+            conn.execute("DELETE FROM post_call_jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - 86400,))
+
+    async def enqueue(self, kind: str, idempotency_key: str, payload: dict) -> bool:
+        """Persist a job; returns False if a job with this idempotency key already exists."""
+        inserted = await asyncio.to_thread(self._enqueue_sync, kind, idempotency_key, payload)
+        logger.info(f"📬 Post-call job {'queued' if inserted else 'already queued'}: {idempotency_key}")
+        return inserted
+
+    async def run_inline(self, kind: str, payload: dict):
+        """Run a job's handler directly (queue disabled or unavailable). Errors are logged."""
+        try:
+            await self._handlers[kind](payload)
+        except Exception as e:
+            logger.error(f"📬 Post-call job {kind} failed: {e}", exc_info=True)
+
+    async def _run_job(self, job: dict):
+        handler = self._handlers.get(job["kind"])
+        error = None
+        if handler is None:
+            error = f"no handler for job kind '{job['kind']}'"
+            job["attempts"] = self.max_attempts
+        else:
+            try:
+                await handler(json.loads(job["payload"]))
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        if error:
+            logger.warning(f"📬 Post-call job {job['idempotency_key']} failed (attempt {job['attempts']}/{self.max_attempts}): {error}")
+        else:
+            logger.info(f"📬 Post-call job done: {job['idempotency_key']}")
+        try:
+            await asyncio.to_thread(self._finish_sync, job, error)
+        except Exception as e:
+            logger.error(f"📬 Could not record post-call job result for {job['idempotency_key']}: {e}")
+
+    async def consume(self, poll_interval: float = 0.5):
+        """Drain the queue forever with at most `concurrency` jobs in flight."""
+        logger.info(f"📬 Post-call consumer started ({self.path}, concurrency={self.concurrency})")
+        running = set()
+        while True:
+            claimed = []
+            free_slots = self.concurrency - len(running)
+            if free_slots > 0:
+                try:
+                    claimed = await asyncio.to_thread(self._claim_sync, free_slots)
+                except Exception as e:
+                    logger.error(f"📬 Post-call queue claim failed: {e}")
+            for job in claimed:
+                task = asyncio.create_task(self._run_job(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            if not claimed:
+                if running:
+                    await asyncio.wait(running, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(poll_interval)
+
+
+post_call_queue = PostCallQueue(POST_CALL_QUEUE_PATH, POST_CALL_QUEUE_CONCURRENCY, POST_CALL_QUEUE_MAX_ATTEMPTS, POST_CALL_JOB_LEASE_SECONDS)
+
+
+def start_post_call_consumer():
+    """Run the post-call consumer on a background thread of the (long-lived) worker process."""
+    def _run():
+        asyncio.run(post_call_queue.consume())
+
+    thread = threading.Thread(target=_run, name="post-call-consumer", daemon=True)
+    thread.start()
+    return thread
+
+
+async def submit_post_call_job(kind: str, idempotency_key: str, payload: dict):
+    """Queue a post-call job durably; runs it inline if the queue is disabled or unwritable."""
+    if POST_CALL_QUEUE_ENABLED:
+        try:
+            await post_call_queue.enqueue(kind, idempotency_key, payload)
+            return
+        except Exception as e:
+            logger.error(f"📬 Could not queue post-call job {idempotency_key}, running inline: {e}")
+    await post_call_queue.run_inline(kind, payload)
+
+
+@post_call_queue.handler("finalize_call")
+async def _finalize_call_job(job: dict):
+    """Save transcript, summary and extracted data to the call record, then fan out follow-ups."""
+    call_record_id = job["call_record_id"]
+    pii_mode = job["pii_mode"]
+    transcript_text = job.get("transcript") or ""
+    dynamic_variables = job.get("dynamic_variables") or []
+
+    update_data = {
+        "status": "completed",
+        "duration_seconds": job["call_duration"],
+        "ended_at": "now()"
+    }
+    store_transcript = ""
+    key_topics = None
+
+    if pii_mode == "disabled":
+        # Disabled mode: only update status, no transcript/summary/extracted data
+        await db_execute(
+            supabase.table("call_records")
+            .update(update_data)
+            .eq("id", call_record_id)
+        )
+        logger.info(f"✅ Call record updated (PII disabled - no transcript/summary stored)")
+    else:
+        # Enabled or Redacted mode
+        store_transcript = transcript_text
+
+        # Redact before any analysis so the summary, extracted data and topics are
+        # derived from text that no longer holds the PII
+        if pii_mode == "redacted" and transcript_text:
+            logger.info(f"🔒 Redacting PII from transcript...")
+            store_transcript = await redact_pii(transcript_text)
+
+        # One structured request for summary + extraction + topics
+        analysis = None
+        if store_transcript and POST_CALL_ANALYSIS_MODE == "combined":
+            analysis = await analyze_call(
+                store_transcript,
+                dynamic_variables,
+                extract=bool(job.get("extract_calls_enabled")),
+            )
+
+        if analysis:
+            key_topics = analysis["key_topics"]
+            if analysis["summary"]:
+                update_data["call_summary"] = analysis["summary"]
+                logger.info(f"📝 Call summary: {analysis['summary']}")
+            if analysis["extracted_data"]:
+                update_data["extracted_data"] = analysis["extracted_data"]
+                logger.info(f"📊 Extracted data: {analysis['extracted_data']}")
+
+        update_data["transcript"] = store_transcript
+
+        # Generate call summary and extract dynamic variables in parallel
+        # In redacted mode, use the redacted transcript so PII can't leak through
+        if store_transcript and not analysis:
+            logger.info(f"📝 Generating call summary and extracting data...")
+
+            summary_task = generate_call_summary(store_transcript)
+            extraction_task = extract_data_from_transcript(store_transcript, dynamic_variables) if job.get("extract_calls_enabled") else None
+
+            if extraction_task:
+                call_summary, extracted_data = await asyncio.gather(summary_task, extraction_task)
+            else:
+                call_summary = await summary_task
+                extracted_data = {}
+
+            if call_summary:
+                update_data["call_summary"] = call_summary
+                logger.info(f"📝 Call summary: {call_summary}")
+
+            if extracted_data:
+                update_data["extracted_data"] = extracted_data
+                logger.info(f"📊 Extracted data: {extracted_data}")
+
+        await db_execute(
+            supabase.table("call_records")
+            .update(update_data)
+            .eq("id", call_record_id)
+        )
+
+        logger.info(f"✅ Call transcript saved to database{' with summary' if update_data.get('call_summary') else ''}{' with extracted_data' if update_data.get('extracted_data') else ''}{' (redacted)' if pii_mode == 'redacted' else ''}")
+
+        # Send per-variable Slack notifications for extracted data
+        if update_data.get("extracted_data") and dynamic_variables:
+            await submit_post_call_job("extracted_data_slack", f"{call_record_id}:extracted_data_slack", {
+                "user_id": job["user_id"],
+                "agent_id": job.get("agent_id"),
+                "extracted_data": update_data["extracted_data"],
+                "dynamic_variables": dynamic_variables,
+                "caller_number": job.get("caller_phone"),
+            })
+
+    # Deduct credits for the call (always, regardless of PII mode)
+    if job.get("user_id") and job["call_duration"] > 0:
+        await submit_post_call_job("deduct_credits", f"{call_record_id}:deduct_credits", {
+            "user_id": job["user_id"],
+            "agent_id": job.get("agent_id"),
+            "duration_seconds": job["call_duration"],
+            "call_record_id": call_record_id,
+            "tts_characters": job.get("tts_characters", 0),
+            "addons": job.get("billing_addons") or None,
+            "branded_call": job.get("branded_call", False),
+        })
+    else:
+        logger.info(f"💰 Skipping billing - missing user_id or zero duration (user={bool(job.get('user_id'))}, duration={job['call_duration']})")
+
+    # Update caller memory if enabled (skip entirely in disabled mode)
+    if pii_mode != "disabled" and job.get("memory_enabled") and update_data.get("call_summary"):
+        memory_phone = job.get("caller_phone")
+        agent_id = job.get("agent_id")
+        if memory_phone and agent_id:
+            # In redacted mode, memory gets the redacted summary (already redacted above)
+            await submit_post_call_job("update_caller_memory", f"{call_record_id}:update_caller_memory", {
+                "caller_phone": memory_phone,
+                "user_id": job["user_id"],
+                "agent_id": agent_id,
+                "call_summary": update_data["call_summary"],
+                "call_record_id": call_record_id,
+                "transcript_text": store_transcript,
+                # Generate embeddings if semantic memory is enabled
+                "generate_embedding_flag": job.get("semantic_memory_enabled", False),
+                "direction": job.get("direction"),
+                "service_number": job.get("service_number"),
+                "key_topics": key_topics,
+                "caller_profile": job.get("caller_profile"),
+            })
+        else:
+            logger.info(f"🧠 Memory enabled but missing phone or agent_id (phone={memory_phone}, agent_id={agent_id})")
+
+    # Send webhooks
+    if job.get("user_id"):
+        await submit_post_call_job("send_webhooks", f"{call_record_id}:send_webhooks:call.completed", {
+            "user_id": job["user_id"],
+            "event_type": "call.completed",
+            "event_id": f"call.completed:{call_record_id}",
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "payload": {
+                "call_record_id": call_record_id,
+                "direction": job.get("direction"),
+                "caller_number": job.get("caller_phone"),
+                "service_number": job.get("service_number"),
+                "agent_id": job.get("agent_id"),
+                "agent_name": job.get("agent_name"),
+                "duration_seconds": job["call_duration"],
+                "transcript": update_data.get("transcript") if pii_mode != "disabled" else None,
+                "summary": update_data.get("call_summary"),
+                "extracted_data": update_data.get("extracted_data"),
+                "status": "completed",
+            },
+        })
+
+    # Trigger event-based skills (post-call follow-up, auto-CRM, etc.)
+    await submit_post_call_job("trigger_event_skills", f"{call_record_id}:trigger_event_skills", {
+        "agent_id": job.get("agent_id"),
+        "call_record_id": call_record_id,
+        "caller_phone": job.get("caller_phone"),
+        "caller_name": None,
+        "call_duration_seconds": job["call_duration"],
+        "call_summary": update_data.get("call_summary"),
+        "extracted_data": update_data.get("extracted_data") or {},
+    })
+
+    # If this call belongs to a test run, trigger evaluation now that record is fully saved
+    await submit_post_call_job("test_log_collector", f"{call_record_id}:test_log_collector", {
+        "call_record_id": call_record_id,
+    })
+
+
+@post_call_queue.handler("deduct_credits")
+async def _deduct_credits_job(job: dict):
+    # deduct-credits skips duplicate reference_ids, so retries can't double-bill
+    if not await deduct_call_credits(**job):
+        raise RuntimeError("credit deduction did not succeed")
+
+
+@post_call_queue.handler("update_caller_memory")
+async def _update_caller_memory_job(job: dict):
+    if not await update_caller_memory(**job):
+        raise RuntimeError("caller memory update did not succeed")
+
+
+@post_call_queue.handler("send_webhooks")
+async def _send_webhooks_job(job: dict):
+    if not await send_webhooks(**job):
+        raise RuntimeError("webhook endpoints could not be looked up")
+
+
+@post_call_queue.handler("send_webhook")
+async def _send_webhook_job(job: dict):
+    if not await send_webhook(**job):
+        raise RuntimeError("webhook delivery did not succeed")
+
+
+@post_call_queue.handler("trigger_event_skills")
+async def _trigger_event_skills_job(job: dict):
+    if not await trigger_event_skills(job):
+        raise RuntimeError("event skills trigger did not succeed")
+
+
+@post_call_queue.handler("extracted_data_slack")
+async def _extracted_data_slack_job(job: dict):
+    await send_extracted_data_slack(**job)
+
+
+@post_call_queue.handler("test_log_collector")
+async def _test_log_collector_job(job: dict):
+    call_record_id = job["call_record_id"]
+    cr_check = await db_execute(supabase.table("call_records").select("test_run_id").eq("id", call_record_id).single())
+    test_run_id = cr_check.data.get("test_run_id") if cr_check.data else None
+    if test_run_id:
+        supabase_url = os.environ.get("SUPABASE_URL", "")
+        supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
+        async with shared_http_session() as http_session:
+            async with http_session.post(
+                f"{supabase_url}/functions/v1/test-log-collector",
+                json={"test_run_id": test_run_id},
+                headers={"Authorization": f"Bearer {supabase_key}", "Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=15),
+            ) as resp:
+                resp.raise_for_status()
+        logger.info(f"🧪 Triggered test-log-collector for test run {test_run_id}")
+
+
+# ============================================
+# Bootstrap Graph
+# ============================================
+
+class BootstrapGraph:
+    """Runs per-call setup steps as a dependency graph with maximum concurrency.
+
+    Each step is an async function that receives the results of the steps it depends on
+    as keyword arguments. A step starts as soon as its dependencies finish, so bootstrap
+    latency tracks the longest dependency chain rather than the sum of all steps.
+    A failing step is logged and yields its default; dependents still run.
+    Dependencies must be registered before the steps that use them (which rules out cycles).
+    """
+
+    def __init__(self, name: str = "bootstrap"):
+        self.name = name
+        self._steps = {}  # step name -> (fn, deps, default)
+        self.results = {}
+        self.timings = {}  # step name -> duration in ms
+        self.total_ms = 0
+
+    def step(self, name: str, fn, deps: tuple = (), default=None):
+        """Register an async step. `fn(**{dep: result})` is awaited once its deps are done."""
+        if name in self._steps:
+            raise ValueError(f"Bootstrap step '{name}' already registered")
+        for dep in deps:
+            if dep not in self._steps:
+                raise ValueError(f"Bootstrap step '{name}' depends on unknown step '{dep}'")
+        self._steps[name] = (fn, tuple(deps), default)
+
+    async def run(self) -> dict:
+        """Run all steps and return {step name: result}."""
+        tasks = {}
+
+        async def _run_step(name, fn, deps, default):
+            kwargs = {dep: await tasks[dep] for dep in deps}
+            started = time_module.perf_counter()
+            try:
+                result = await fn(**kwargs)
+            except Exception as e:
+                logger.warning(f"🚀 {self.name}: step '{name}' failed: {e}")
+                result = default
+            self.timings[name] = round((time_module.perf_counter() - started) * 1000)
+            self.results[name] = result
+            return result
+
+        started = time_module.perf_counter()
+        for name, (fn, deps, default) in self._steps.items():
+            tasks[name] = asyncio.ensure_future(_run_step(name, fn, deps, default))
+        await asyncio.gather(*tasks.values())
+        self.total_ms = round((time_module.perf_counter() - started) * 1000)
+        return self.results
+
+    def summary(self) -> str:
+        """One-line timing summary, slowest step first."""
+        steps = sorted(self.timings.items(), key=lambda kv: kv[1], reverse=True)
+        return f"{self.total_ms}ms total (sum of steps {sum(self.timings.values())}ms): " + ", ".join(
+            f"{name}={ms}ms" for name, ms in steps
+        )
+
+
+# ============================================
+# Prompt Layout
+# ============================================
+
+class PromptAssembler:
+    """System prompt built as a static prefix followed by a per-call suffix.
+
+    OpenAI caches the longest prompt prefix it has seen recently (from 1024 tokens), so the
+    sections that are the same for every call to an agent (language rule, role text, base
+    prompt, tool guidance, KB pre-load) go first and anything that varies per call (caller
+    number, reconnect and after-hours notes, outbound call context, caller memory) goes
+    last. Sections keep their insertion order within each part and carry their own
+    separators, as the prompt strings always have.
+    """
+
+    def __init__(self):
+        self.static_sections = []
+        self.dynamic_sections = []
+
+    def add_static(self, text: str):
+        if text:
+            self.static_sections.append(text)
+
+    def add_dynamic(self, text: str):
+        if text:
+            self.dynamic_sections.append(text)
+
+    def copy(self) -> "PromptAssembler":
+        other = PromptAssembler()
+        other.static_sections = list(self.static_sections)
+        other.dynamic_sections = list(self.dynamic_sections)
+        return other
+
+    @property
+    def static_prefix(self) -> str:
+        return "".join(self.static_sections)
+
+    def build(self) -> str:
+        return "".join(self.static_sections + self.dynamic_sections)
+
+    def layout(self) -> dict:
+        """Sizes and a fingerprint of the static prefix, to check it stays the same across calls."""
+        static_prefix = self.static_prefix
+        return {
+            "static_chars": len(static_prefix),
+            "dynamic_chars": sum(len(s) for s in self.dynamic_sections),
+            "static_hash": hashlib.sha256(static_prefix.encode("utf-8")).hexdigest()[:12],
         }
-        if required_params:
-            raw_schema["parameters"]["required"] = required_params
 
-        @function_tool(raw_schema=raw_schema)
-        async def custom_fn_raw(raw_arguments: dict[str, object]):
-            """Execute a custom webhook function"""
-            params = dict(raw_arguments)
-            logger.info(f"🔧 [raw_schema] Custom function '{func_name}' called with params: {params}")
-            return await _execute_custom_function(params)
 
-        logger.info(f"🔧 Created '{func_name}' as RawFunctionTool (typed params)")
-        return custom_fn_raw
+class PromptCacheStats:
+    """Provider prompt-cache hit ratio for a call, from the session's LLM metrics."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._ttft_total = 0.0
+        self._ttft_count = 0
+
+    def add(self, metrics):
+        self.requests += 1
+        self.prompt_tokens += getattr(metrics, "prompt_tokens", 0) or 0
+        self.cached_tokens += getattr(metrics, "prompt_cached_tokens", 0) or 0
+        ttft = getattr(metrics, "ttft", None)
+        if ttft is not None and ttft >= 0:
+            self._ttft_total += ttft
+            self._ttft_count += 1
+
+    def stats(self) -> dict:
+        return {
+            "llm_requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "avg_ttft_ms": round(self._ttft_total / self._ttft_count * 1000) if self._ttft_count else None,
+        }
 
-    except Exception as e:
-        logger.warning(f"🔧 raw_schema failed for '{func_name}': {e}, falling back to FunctionTool")
 
-    # --- Fallback: FunctionTool with name= parameter ---
-    try:
-        param_descriptions = []
-        for param in body_schema:
-            required_str = " (required)" if param.get('required') else ""
-            param_descriptions.append(f"- {param['name']}: {param.get('description', '')}{required_str}")
-        full_description = func_description
-        if param_descriptions:
-            full_description += "\n\nParameters:\n" + "\n".join(param_descriptions)
+# ============================================
+# Progressive Prompt Hydration
+# ============================================
 
-        @function_tool(name=func_name, description=full_description)
-        async def custom_fn_named(
-            parameters: Annotated[str, "JSON string of parameters"]
-        ):
-            """Execute a custom webhook function"""
-            logger.info(f"🔧 [named] Custom function '{func_name}' called with: {parameters!r}")
-            params = {}
-            if parameters:
-                if isinstance(parameters, dict):
-                    params = parameters
-                elif isinstance(parameters, str):
-                    try:
-                        params = json.loads(parameters)
-                    except json.JSONDecodeError:
-                        if body_schema and len(body_schema) == 1:
-                            params = {body_schema[0]['name']: parameters}
-                        else:
-                            params = {"raw_input": parameters}
-            return await _execute_custom_function(params)
+# Start the session and greet on the base prompt; caller memory, KB, semantic and shared
+# memory sections are added to the instructions as they load, before the first LLM turn.
+PROGRESSIVE_PROMPT_HYDRATION = os.getenv("PROGRESSIVE_PROMPT_HYDRATION", "false").lower() == "true"
+# How long the first LLM turn waits for context before answering on the base prompt
+PROMPT_HYDRATION_TIMEOUT = float(os.getenv("PROMPT_HYDRATION_TIMEOUT", "8"))
 
-        logger.info(f"🔧 Created '{func_name}' as FunctionTool with name= (fallback 1)")
-        return custom_fn_named
 
-    except Exception as e:
-        logger.warning(f"🔧 name= failed for '{func_name}': {e}, falling back to __name__ override")
+class HydratingAgent(Agent):
+    """Agent whose instructions are completed in the background after the session starts.
 
-    # --- Last resort: set __name__ before decoration ---
-    param_descriptions = []
-    for param in body_schema:
-        required_str = " (required)" if param.get('required') else ""
-        param_descriptions.append(f"- {param['name']}: {param.get('description', '')}{required_str}")
-    full_description = func_description
-    if param_descriptions:
-        full_description += "\n\nParameters:\n" + "\n".join(param_descriptions)
+    `start_hydration(build)` runs `build()` (async, returns the full instructions) and applies
+    the result with update_instructions(). Every LLM turn waits for that first, so no reply is
+    generated from the partial prompt; after PROMPT_HYDRATION_TIMEOUT turns go ahead on the
+    base prompt and the context is applied whenever it arrives.
+    """
 
-    async def custom_fn_legacy(
-        parameters: Annotated[str, "JSON string of parameters"]
-    ):
-        """Execute a custom webhook function"""
-        logger.info(f"🔧 [legacy] Custom function '{func_name}' called with: {parameters!r}")
-        params = {}
-        if parameters:
-            if isinstance(parameters, dict):
-                params = parameters
-            elif isinstance(parameters, str):
-                try:
-                    params = json.loads(parameters)
-                except json.JSONDecodeError:
-                    if body_schema and len(body_schema) == 1:
-                        params = {body_schema[0]['name']: parameters}
-                    else:
-                        params = {"raw_input": parameters}
-        return await _execute_custom_function(params)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._base_instructions = self.instructions
+        self._hydrated = asyncio.Event()
+        self._hydrate_task = None
+
+    def start_hydration(self, build):
+        self._hydrate_task = asyncio.ensure_future(self._hydrate(build))
+        return self._hydrate_task
+
+    async def _hydrate(self, build):
+        started = time_module.perf_counter()
+        build_task = asyncio.ensure_future(build())
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(build_task), timeout=PROMPT_HYDRATION_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"🪄 Prompt context not ready after {PROMPT_HYDRATION_TIMEOUT}s - answering on the base prompt until it is")
+                self._hydrated.set()
+            instructions = await build_task
+            # Leave instructions alone if something else (e.g. admin mode) replaced them meanwhile
+            if instructions and self.instructions == self._base_instructions and instructions != self._base_instructions:
+                await self.update_instructions(instructions)
+            logger.info(f"🪄 Prompt hydrated in {round((time_module.perf_counter() - started) * 1000)}ms")
+        except Exception as e:
+            logger.error(f"🪄 Prompt hydration failed, keeping the base prompt: {e}")
+        finally:
+            self._hydrated.set()
+
+    async def wait_hydrated(self):
+        await self._hydrated.wait()
+
+    async def on_user_turn_completed(self, turn_ctx, new_message):
+        if self._hydrated.is_set():
+            return
+        await self._hydrated.wait()
+        if self.instructions == self._base_instructions:
+            return
+        # This turn's context was copied before hydration finished; bring its instructions up to date
+        for item in turn_ctx.items:
+            if getattr(item, "role", None) == "system" and item.text_content == self._base_instructions:
+                item.content = [self.instructions]
 
-    # Set name BEFORE decoration so the decorator picks it up
-    custom_fn_legacy.__name__ = func_name
-    custom_fn_legacy.__qualname__ = func_name
-    tool = function_tool(description=full_description)(custom_fn_legacy)
-    logger.info(f"🔧 Created '{func_name}' as FunctionTool with __name__ override (fallback 2, tool.info.name={tool.info.name})")
-    return tool
 
+# ============================================
+# Prewarm (shared VAD / turn detector)
+# ============================================
 
-async def prewarm(proc: JobProcess):
+def prewarm(proc: JobProcess):
     """
-    Prewarm function - pre-loads the Silero VAD model so it's ready on first call.
-    Without this, the ML model is loaded on each call's first use (~200-500ms delay).
+    Prewarm function - runs once per worker process before it accepts a job.
+    Loads the Silero VAD so the first call on a process answers as fast as later ones
+    (otherwise ~200-500ms of model load lands on the first turn). The turn detector can't
+    be built here: MultilingualModel needs the job context's inference executor, so it is
+    built inside the job (get_shared_turn_detector).
+
+    Must stay synchronous and quick: LiveKit calls prewarm_fnc without awaiting it, and an
+    idle process that hasn't finished initializing within initialize_process_timeout is
+    killed (DuplexClosed in the worker logs).
     """
+    started = time_module.perf_counter()
     logger.info("🔥 PREWARM: Loading Silero VAD model...")
     proc.userdata["vad"] = silero.VAD.load()
-    logger.info("🔥 PREWARM: Silero VAD model ready")
-    await proc.wait_for_shutdown()
+    logger.info(f"🔥 PREWARM: VAD ready in {round((time_module.perf_counter() - started) * 1000)}ms")
+
+
+def get_shared_vad(proc: JobProcess, **vad_options):
+    """Return this process's prewarmed Silero VAD with per-agent options applied.
+
+    Options (min_silence_duration, min_speech_duration, activation_threshold) are applied
+    with update_options() instead of reloading the model. Safe because each job runs in its
+    own process; loads (and keeps) a VAD if prewarm didn't run.
+    """
+    userdata = proc.userdata if proc is not None else {}
+    vad = userdata.get("vad")
+    if vad is None:
+        logger.info("🔥 No pre-warmed VAD on this process - loading Silero VAD")
+        vad = silero.VAD.load()
+        userdata["vad"] = vad
+    else:
+        logger.info("🔥 Using pre-warmed Silero VAD model")
+    if vad_options:
+        if hasattr(vad, "update_options"):
+            # VAD.load derives deactivation from activation; update_options doesn't, so keep them paired
+            if "activation_threshold" in vad_options and "deactivation_threshold" not in vad_options:
+                vad_options["deactivation_threshold"] = max(vad_options["activation_threshold"] - 0.15, 0.01)
+            vad.update_options(**vad_options)
+        else:
+            return silero.VAD.load(**vad_options)
+    return vad
+
+
+def get_shared_turn_detector(proc: JobProcess):
+    """Return this process's turn detector, or None if unavailable.
+
+    Must be called from inside a job (MultilingualModel uses the job context's inference
+    executor). Only a successfully built detector is kept, so a failure is retried next time.
+    """
+    if not _TURN_DETECTOR_AVAILABLE:
+        return None
+    userdata = proc.userdata if proc is not None else {}
+    if userdata.get("turn_detector") is None:
+        userdata["turn_detector"] = _build_turn_detector()
+    return userdata["turn_detector"]
 
 
 async def entrypoint(ctx: JobContext):
@@ -2397,6 +5370,33 @@ async def entrypoint(ctx: JobContext):
     logger.info(f"   → Room: {ctx.room.name}")
     logger.info(f"   → Timestamp: {datetime.datetime.now().isoformat()}")
 
+    post_call_tasks = set()  # on_call_end tasks; drained at job shutdown
+
+    def track_post_call_task(coro):
+        task = asyncio.create_task(coro)
+        post_call_tasks.add(task)
+        task.add_done_callback(post_call_tasks.discard)
+        return task
+
+    async def _shutdown():
+        # Post-call tasks still log call state and may use the HTTP session (inline post-call
+        # fallback), so let them finish before flushing call_state_logs rows and releasing
+        # pooled HTTP connections
+        if post_call_tasks:
+            logger.info(f"⏳ Waiting for {len(post_call_tasks)} post-call task(s) before shutdown")
+            await asyncio.wait(set(post_call_tasks), timeout=30)
+        try:
+            await call_state_log_writer.flush()
+            await semantic_match_counter.flush()
+        finally:
+            await close_http_session()
+
+    ctx.add_shutdown_callback(_shutdown)
+
+    # Caller memory lookups, started as soon as the remote party's number and agent are known
+    caller_prefetch = CallerPrefetch()
+    ctx.add_shutdown_callback(caller_prefetch.close)
+
     # Log: Agent entrypoint called
     log_call_state(ctx.room.name, 'agent_entrypoint_called', 'agent', {
         'room_name': ctx.room.name,
@@ -2414,7 +5414,8 @@ async def entrypoint(ctx: JobContext):
     logger.info(f"🔌 Connecting to room: {ctx.room.name}")
 
     # Initialize transcript collection and call tracking
-    transcript_messages = []
+    transcript = TranscriptBuffer()
+    transcript_messages = transcript.messages  # Raw [{"speaker", "text"}] turns (read-only view)
     call_sid = None
     call_record_id = None  # Resolved early for real-time transcript streaming
     last_transcript_write = 0  # Timestamp of last partial transcript write
@@ -2423,6 +5424,7 @@ async def entrypoint(ctx: JobContext):
     caller_number = None
     remote_party_phone = None  # Phone of the person on the other end (for memory)
     fast_path_complete = False
+    inbound_context = None  # Single round-trip inbound bundle (get_inbound_call_context RPC)
     user_config = None
     voice_config = None
     transfer_numbers = []
@@ -2459,38 +5461,36 @@ async def entrypoint(ctx: JobContext):
         user_config = await user_config_task
         if not user_config:
             logger.warning(f"No agent assigned for this number")
-            await speak_error_and_disconnect(ctx, "This number is not currently assigned. Go to Magpipe.ai to assign your number.")
+            await speak_error_and_disconnect(ctx, NUMBER_NOT_ASSIGNED_MESSAGE)
             return
 
         # Get voice config, transfer numbers, dynamic variables, and call record in parallel
         voice_id = user_config.get("voice_id", "EXAVITQu4vr4xnSDxMaL")
         agent_id = user_config.get("id")
-        voice_config_task = get_voice_config(voice_id, user_id)
+        caller_prefetch.start_memory_lookups(contact_phone, user_id, user_config)
+        voice_config_task = get_voice_config(voice_id, user_id, agent_id)
         dynamic_vars_task = get_dynamic_variables(agent_id, user_id)
 
-        async def get_transfer_nums():
-            resp = supabase.table("transfer_numbers").select("*").eq("user_id", user_id).execute()
-            return resp.data or []
-
         async def get_outbound_call_record():
             """Fetch call_variables and call_record_id from the recently-created outbound call record."""
             try:
                 time_window = (datetime.datetime.utcnow() - datetime.timedelta(minutes=2)).isoformat()
-                resp = supabase.table("call_records") \
-                    .select("id, call_variables, metadata") \
-                    .eq("user_id", user_id) \
-                    .eq("direction", "outbound") \
-                    .gte("created_at", time_window) \
-                    .order("created_at", desc=True) \
-                    .limit(1) \
-                    .execute()
+                resp = await db_execute(
+                    supabase.table("call_records")
+                    .select("id, call_variables, metadata")
+                    .eq("user_id", user_id)
+                    .eq("direction", "outbound")
+                    .gte("created_at", time_window)
+                    .order("created_at", desc=True)
+                    .limit(1)
+                )
                 if resp.data:
                     return resp.data[0]
             except Exception as e:
                 logger.warning(f"Could not fetch outbound call record in fast path: {e}")
             return None
 
-        transfer_task = get_transfer_nums()
+        transfer_task = get_transfer_numbers(user_id, agent_id)
         call_record_task = get_outbound_call_record()
 
         voice_config, transfer_numbers, dynamic_variables, outbound_call_record = await asyncio.gather(
@@ -2584,13 +5584,38 @@ async def entrypoint(ctx: JobContext):
                 logger.error("Timeout waiting for SIP participant")
 
         if service_number:
+            inbound_context = await get_inbound_call_context(
+                service_number, call_sid, ctx.room.name, get_sip_caller_phone(ctx.room)
+            )
+
+        if inbound_context is not None and not inbound_context.get("user_id"):
+            # Number is in neither service_numbers nor external_sip_numbers: take the step-by-step
+            # path, which keeps a user_id from room metadata and runs the livekit_call_id update
+            inbound_context = None
+
+        if inbound_context is not None:
+            user_id = inbound_context["user_id"]
+            room_metadata["user_id"] = user_id
+            if inbound_context.get("outbound_agent_id"):
+                room_metadata["outbound_agent_id"] = inbound_context["outbound_agent_id"]
+            if inbound_context.get("agent_id"):
+                room_metadata["agent_id"] = inbound_context["agent_id"]
+            else:
+                logger.warning(f"No agents found for user {user_id}")
+            call_record_id = inbound_context.get("call_record_id")
+            # Inbound caller memory doesn't need to wait for direction detection and config loading
+            recent_direction = (inbound_context.get("recent_call") or {}).get("direction")
+            if recent_direction != "outbound" and room_metadata.get("direction") != "outbound":
+                caller_prefetch.start_memory_lookups(get_sip_caller_phone(ctx.room), user_id, inbound_context.get("agent_config"))
+        elif service_number:
             # Look up user and agent from service_numbers table (SignalWire numbers)
-            response = supabase.table("service_numbers") \
-                .select("user_id, agent_id, outbound_agent_id") \
-                .eq("phone_number", service_number) \
-                .eq("is_active", True) \
-                .limit(1) \
-                .execute()
+            response = await db_execute(
+                supabase.table("service_numbers")
+                .select("user_id, agent_id, outbound_agent_id")
+                .eq("phone_number", service_number)
+                .eq("is_active", True)
+                .limit(1)
+            )
 
             if response.data and len(response.data) > 0:
                 user_id = response.data[0]["user_id"]
@@ -2605,25 +5630,27 @@ async def entrypoint(ctx: JobContext):
                 else:
                     # No agent assigned to number — fall back to user's default agent
                     logger.info(f"No agent assigned to number, looking up default agent for user: {user_id}")
-                    default_resp = supabase.table("agent_configs") \
-                        .select("id") \
-                        .eq("user_id", user_id) \
-                        .eq("is_default", True) \
-                        .limit(1) \
-                        .execute()
+                    default_resp = await db_execute(
+                        supabase.table("agent_configs")
+                        .select("id")
+                        .eq("user_id", user_id)
+                        .eq("is_default", True)
+                        .limit(1)
+                    )
                     if default_resp.data and len(default_resp.data) > 0:
                         fallback_agent_id = default_resp.data[0]["id"]
                         room_metadata["agent_id"] = fallback_agent_id
                         logger.info(f"Using user's default agent: {fallback_agent_id}")
                     else:
                         # Last resort: get any active agent for this user
-                        any_resp = supabase.table("agent_configs") \
-                            .select("id") \
-                            .eq("user_id", user_id) \
-                            .eq("is_active", True) \
-                            .order("created_at", desc=False) \
-                            .limit(1) \
-                            .execute()
+                        any_resp = await db_execute(
+                            supabase.table("agent_configs")
+                            .select("id")
+                            .eq("user_id", user_id)
+                            .eq("is_active", True)
+                            .order("created_at", desc=False)
+                            .limit(1)
+                        )
                         if any_resp.data and len(any_resp.data) > 0:
                             fallback_agent_id = any_resp.data[0]["id"]
                             room_metadata["agent_id"] = fallback_agent_id
@@ -2633,12 +5660,13 @@ async def entrypoint(ctx: JobContext):
             else:
                 # Not found in service_numbers - check external_sip_numbers (Twilio, etc.)
                 logger.info(f"Number not in service_numbers, checking external_sip_numbers: {service_number}")
-                ext_response = supabase.table("external_sip_numbers") \
-                    .select("user_id") \
-                    .eq("phone_number", service_number) \
-                    .eq("is_active", True) \
-                    .limit(1) \
-                    .execute()
+                ext_response = await db_execute(
+                    supabase.table("external_sip_numbers")
+                    .select("user_id")
+                    .eq("phone_number", service_number)
+                    .eq("is_active", True)
+                    .limit(1)
+                )
 
                 if ext_response.data and len(ext_response.data) > 0:
                     user_id = ext_response.data[0]["user_id"]
@@ -2648,36 +5676,14 @@ async def entrypoint(ctx: JobContext):
                     # For Twilio external trunk inbound calls, create call_record from LiveKit data
                     if call_sid and service_number and user_id:
                         # Get caller phone number from SIP participant attributes
-                        sip_caller_number = None
-                        for participant in ctx.room.remote_participants.values():
-                            attrs = participant.attributes
-                            logger.info(f"📞 SIP participant attributes: {attrs}")
-                            # Try various SIP attribute names for caller number
-                            sip_caller_number = (
-                                attrs.get("sip.remoteUri") or
-                                attrs.get("sip.from") or
-                                attrs.get("sip.caller") or
-                                participant.identity
-                            )
-                            if sip_caller_number:
-                                # Clean up SIP URI/identity format to get phone number
-                                # Formats: "sip:+16041234567@...", "sip_+16041234567", "+16041234567"
-                                if sip_caller_number.startswith("sip:"):
-                                    sip_caller_number = sip_caller_number[4:]
-                                if sip_caller_number.startswith("sip_"):
-                                    sip_caller_number = sip_caller_number[4:]
-                                if "@" in sip_caller_number:
-                                    sip_caller_number = sip_caller_number.split("@")[0]
-                                # Ensure it starts with + for E.164 format
-                                if sip_caller_number and not sip_caller_number.startswith("+"):
-                                    sip_caller_number = "+" + sip_caller_number
-                                logger.info(f"📞 Extracted caller number from SIP: {sip_caller_number}")
-                                break
+                        sip_caller_number = get_sip_caller_phone(ctx.room)
+                        logger.info(f"📞 Extracted caller number from SIP: {sip_caller_number}")
 
                         logger.info(f"Creating call_record for Twilio inbound call: {call_sid}")
 
                         # Insert call record for Twilio inbound
-                        insert_response = supabase.table("call_records") \
+                        insert_response = await db_execute(
+                            supabase.table("call_records")
                             .insert({
                                 "user_id": user_id,
                                 "caller_number": sip_caller_number or "unknown",
@@ -2691,8 +5697,8 @@ async def entrypoint(ctx: JobContext):
                                 "telephony_vendor": "twilio",
                                 "call_source": "external_trunk",
                                 "started_at": datetime.datetime.utcnow().isoformat(),
-                            }) \
-                            .execute()
+                            })
+                        )
 
                         if insert_response.data and len(insert_response.data) > 0:
                             logger.info(f"✅ Created call_record for Twilio inbound call")
@@ -2704,13 +5710,14 @@ async def entrypoint(ctx: JobContext):
                         logger.info(f"Updating call_record with LiveKit call ID: {call_sid}")
                         time_window = datetime.datetime.now() - datetime.timedelta(minutes=5)
 
-                        update_response = supabase.table("call_records") \
-                            .update({"livekit_call_id": call_sid}) \
-                            .eq("service_number", service_number) \
-                            .eq("user_id", user_id) \
-                            .eq("status", "in-progress") \
-                            .gte("started_at", time_window.isoformat()) \
-                            .execute()
+                        update_response = await db_execute(
+                            supabase.table("call_records")
+                            .update({"livekit_call_id": call_sid})
+                            .eq("service_number", service_number)
+                            .eq("user_id", user_id)
+                            .eq("status", "in-progress")
+                            .gte("started_at", time_window.isoformat())
+                        )
 
                         if update_response.data and len(update_response.data) > 0:
                             logger.info(f"✅ Updated call_record with livekit_call_id")
@@ -2719,22 +5726,23 @@ async def entrypoint(ctx: JobContext):
 
     if not user_id:
         logger.warning("Could not determine user_id - number not found or inactive")
-        await speak_error_and_disconnect(ctx, "This number is not currently assigned. Go to Magpipe.ai to assign your number.")
+        await speak_error_and_disconnect(ctx, NUMBER_NOT_ASSIGNED_MESSAGE)
         return
 
     # Resolve call_record_id early for real-time transcript streaming
+    # (already done by the inbound bundle when it was available)
     try:
-        if call_sid:
-            cr_resp = supabase.table("call_records").select("id").eq("livekit_call_id", call_sid).limit(1).execute()
+        if call_sid and inbound_context is None:
+            cr_resp = await db_execute(supabase.table("call_records").select("id").eq("livekit_call_id", call_sid).limit(1))
             if cr_resp.data:
                 call_record_id = cr_resp.data[0]["id"]
                 logger.info(f"📝 Early call_record_id resolved by livekit_call_id: {call_record_id}")
-        if not call_record_id and user_id:
+        if not call_record_id and user_id and inbound_context is None:
             time_window = datetime.datetime.utcnow() - datetime.timedelta(minutes=2)
             cr_query = supabase.table("call_records").select("id").eq("user_id", user_id).gte("created_at", time_window.isoformat()).order("created_at", desc=True).limit(1)
             if service_number:
                 cr_query = supabase.table("call_records").select("id").eq("user_id", user_id).eq("service_number", service_number).gte("created_at", time_window.isoformat()).order("created_at", desc=True).limit(1)
-            cr_resp = cr_query.execute()
+            cr_resp = await db_execute(cr_query)
             if cr_resp.data:
                 call_record_id = cr_resp.data[0]["id"]
                 logger.info(f"📝 Early call_record_id resolved by user_id lookup: {call_record_id}")
@@ -2753,8 +5761,31 @@ async def entrypoint(ctx: JobContext):
         "service_number": service_number,
     })
 
+    # Direction and template context from the recent call record returned by the inbound bundle
+    if not direction and inbound_context is not None:
+        recent_call = inbound_context.get("recent_call")
+        if recent_call:
+            direction = recent_call.get("direction") or "inbound"
+            if not contact_phone:
+                contact_phone = recent_call.get("contact_phone")
+            call_purpose = recent_call.get("call_purpose")
+            call_goal = recent_call.get("call_goal")
+            call_variables = recent_call.get("call_variables") or {}
+            logger.info(f"📊 Found call direction from inbound bundle: {direction}, contact_phone: {contact_phone}, service_number: {recent_call.get('service_number')}")
+            if call_purpose or call_goal:
+                logger.info(f"📋 Call template context: purpose='{call_purpose}', goal='{call_goal}'")
+            if call_variables:
+                logger.info(f"📋 Call variables: {list(call_variables.keys())}")
+            correct_agent_id = inbound_context.get("corrected_agent_id")
+            if correct_agent_id:
+                logger.info(f"📊 Correcting agent_id from service_number lookup: {correct_agent_id}")
+                room_metadata["agent_id"] = correct_agent_id
+                room_metadata["service_number"] = recent_call.get("service_number")
+        else:
+            logger.warning(f"📊 No recent call found for user_id={user_id}")
+
     # If direction not in metadata, check database (for bridged outbound calls)
-    if not direction and user_id:
+    if not direction and user_id and inbound_context is None:
         try:
             # Look up the most recent call for this user (within last 60 seconds)
             # Use time-based filter instead of status because SignalWire status callback may fire before agent
@@ -2765,14 +5796,15 @@ async def entrypoint(ctx: JobContext):
             call_lookup = None
             if service_number:
                 logger.info(f"📊 Trying lookup with service_number={service_number}")
-                call_lookup = supabase.table("call_records") \
-                    .select("direction, contact_phone, call_purpose, call_goal, call_variables") \
-                    .eq("service_number", service_number) \
-                    .eq("user_id", user_id) \
-                    .gte("created_at", one_minute_ago) \
-                    .order("created_at", desc=True) \
-                    .limit(1) \
-                    .execute()
+                call_lookup = await db_execute(
+                    supabase.table("call_records")
+                    .select("direction, contact_phone, call_purpose, call_goal, call_variables")
+                    .eq("service_number", service_number)
+                    .eq("user_id", user_id)
+                    .gte("created_at", one_minute_ago)
+                    .order("created_at", desc=True)
+                    .limit(1)
+                )
 
                 # Log the lookup result
                 log_call_state(ctx.room.name, "direction_lookup_with_service_number", "agent", {
@@ -2786,13 +5818,14 @@ async def entrypoint(ctx: JobContext):
             # If no match, try without service_number (for bridged outbound where LiveKit trunk number != caller_id)
             if not call_lookup or not call_lookup.data or len(call_lookup.data) == 0:
                 logger.info(f"📊 No match with service_number, trying without (for bridged outbound)")
-                call_lookup = supabase.table("call_records") \
-                    .select("direction, contact_phone, service_number, call_purpose, call_goal, call_variables") \
-                    .eq("user_id", user_id) \
-                    .gte("created_at", one_minute_ago) \
-                    .order("created_at", desc=True) \
-                    .limit(1) \
-                    .execute()
+                call_lookup = await db_execute(
+                    supabase.table("call_records")
+                    .select("direction, contact_phone, service_number, call_purpose, call_goal, call_variables")
+                    .eq("user_id", user_id)
+                    .gte("created_at", one_minute_ago)
+                    .order("created_at", desc=True)
+                    .limit(1)
+                )
 
                 # Log fallback lookup result
                 log_call_state(ctx.room.name, "direction_lookup_without_service_number", "agent", {
@@ -2821,12 +5854,13 @@ async def entrypoint(ctx: JobContext):
                 # This fixes dispatch rule overwriting metadata with wrong agent_id
                 if found_service_number and user_id:
                     try:
-                        sn_lookup = supabase.table("service_numbers") \
-                            .select("agent_id") \
-                            .eq("phone_number", found_service_number) \
-                            .eq("user_id", user_id) \
-                            .limit(1) \
-                            .execute()
+                        sn_lookup = await db_execute(
+                            supabase.table("service_numbers")
+                            .select("agent_id")
+                            .eq("phone_number", found_service_number)
+                            .eq("user_id", user_id)
+                            .limit(1)
+                        )
                         if sn_lookup.data and len(sn_lookup.data) > 0:
                             correct_agent_id = sn_lookup.data[0].get("agent_id")
                             if correct_agent_id:
@@ -2884,7 +5918,7 @@ async def entrypoint(ctx: JobContext):
         user_config = await get_user_config(room_metadata)
         if not user_config:
             logger.warning(f"No agent assigned for this number")
-            await speak_error_and_disconnect(ctx, "This number is not currently assigned. Go to Magpipe.ai to assign your number.")
+            await speak_error_and_disconnect(ctx, NUMBER_NOT_ASSIGNED_MESSAGE)
             return
 
         # Check if this is the system agent (for unassigned numbers)
@@ -2909,27 +5943,7 @@ async def entrypoint(ctx: JobContext):
             "agent_name": user_config.get("name"),
             "agent_id": str(user_config.get("id")),
         })
-
-        log_call_state(ctx.room.name, "debug_1_fetching_voice", "agent", {})
-
-        # Get voice configuration
-        voice_id = user_config.get("voice_id", "EXAVITQu4vr4xnSDxMaL")
-        voice_config = await get_voice_config(voice_id, user_id)
-        log_call_state(ctx.room.name, "debug_2_voice_fetched", "agent", {"voice_id": voice_id})
-
-        # Get transfer numbers
-        transfer_numbers_response = supabase.table("transfer_numbers") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .execute()
-
-        transfer_numbers = transfer_numbers_response.data or []
-        log_call_state(ctx.room.name, "debug_3_transfer_nums", "agent", {"count": len(transfer_numbers)})
-
-        # Get dynamic variables for extraction
-        agent_id = user_config.get("id")
-        dynamic_variables = await get_dynamic_variables(agent_id, user_id)
-        log_call_state(ctx.room.name, "debug_4_dynamic_vars", "agent", {"count": len(dynamic_variables)})
+        # Voice, transfer numbers and dynamic variables are fetched by the bootstrap graph below
     else:
         logger.info("⚡ Using pre-fetched configs from fast path")
 
@@ -2951,6 +5965,13 @@ async def entrypoint(ctx: JobContext):
         "de": "SPRACHE: Du musst AUSSCHLIESSLICH auf Deutsch antworten.\nLANGUAGE: You MUST respond ONLY in German.\n\n",
     }
 
+    # System prompt: agent-level sections first (stable across calls, so the provider can
+    # reuse its cached prefix), per-call sections last
+    prompt = PromptAssembler()
+    prompt.add_static(LANGUAGE_INSTRUCTIONS.get(agent_language, ""))
+    if prompt.static_sections:
+        logger.info(f"🌐 Language instruction prepended for: {agent_language}")
+
     # Different prompts and behavior based on call direction
     if direction == "outbound":
         # OUTBOUND: Agent is calling someone on behalf of the owner
@@ -2964,22 +5985,22 @@ async def entrypoint(ctx: JobContext):
         outbound_prompt = user_config.get("system_prompt") or user_config.get("outbound_system_prompt")
 
         if system_prompt_override:
-            system_prompt = system_prompt_override
+            prompt.add_static(system_prompt_override)
             logger.info("🔄 Outbound call - Using per-call system_prompt_override from request")
         elif outbound_prompt:
-            system_prompt = outbound_prompt
+            prompt.add_static(outbound_prompt)
             logger.info("🔄 Outbound call - Using configured system prompt")
         else:
             # Default outbound prompt when user hasn't configured one
             agent_name = user_config.get("name") or user_config.get("agent_name") or "Assistant"
-            system_prompt = f"""You are {agent_name}, an AI assistant making an outbound phone call on behalf of your owner.
+            prompt.add_static(f"""You are {agent_name}, an AI assistant making an outbound phone call on behalf of your owner.
 
 THIS IS AN OUTBOUND CALL:
 - You called them, they did not call you
 - They will answer with "Hello?" - then you introduce yourself and explain why you're calling
 - Do NOT ask "how can I help you" - you called them, not the other way around
 - Be conversational, professional, and respectful of their time
-- If they're busy or not interested, be gracious and end the call politely"""
+- If they're busy or not interested, be gracious and end the call politely""")
             logger.info("🔄 Outbound call - Using default outbound prompt")
 
         # Append call purpose and goal context if provided (from outbound template)
@@ -2992,7 +6013,7 @@ THIS IS AN OUTBOUND CALL:
             if call_goal:
                 template_context += f"\n- Goal: {call_goal}"
             template_context += "\n\nFocus on achieving the stated goal while being natural and conversational."
-            system_prompt = system_prompt + template_context
+            prompt.add_dynamic(template_context)
             logger.info(f"📋 Added template context to outbound prompt: contact='{contact_phone}', purpose='{call_purpose}', goal='{call_goal}'")
     else:
         # INBOUND: Agent handles the call for the user (traditional behavior)
@@ -3000,28 +6021,7 @@ THIS IS AN OUTBOUND CALL:
 
         # Get the actual caller phone number for the prompt
         # Try sip_caller_number first, then caller_number, then parse from participants
-        actual_caller_phone = None
-        for participant in ctx.room.remote_participants.values():
-            attrs = participant.attributes
-            # Extract from SIP attributes
-            sip_phone = (
-                attrs.get("sip.remoteUri") or
-                attrs.get("sip.from") or
-                attrs.get("sip.caller") or
-                participant.identity
-            )
-            if sip_phone:
-                # Clean up SIP URI format
-                if sip_phone.startswith("sip:"):
-                    sip_phone = sip_phone[4:]
-                if sip_phone.startswith("sip_"):
-                    sip_phone = sip_phone[4:]
-                if "@" in sip_phone:
-                    sip_phone = sip_phone.split("@")[0]
-                if sip_phone and not sip_phone.startswith("+"):
-                    sip_phone = "+" + sip_phone
-                actual_caller_phone = sip_phone
-                break
+        actual_caller_phone = get_sip_caller_phone(ctx.room)
 
         remote_party_phone = actual_caller_phone
 
@@ -3045,13 +6045,14 @@ THIS IS AN OUTBOUND CALL:
                 # Room names contain the caller phone, so we can match by that
                 # Also check for unconsumed declines (not yet used for a reconnect greeting)
                 caller_phone_clean = actual_caller_phone.replace("+", "")
-                recent_declined = supabase.table("call_state_logs") \
-                    .select("id, details, room_name") \
-                    .eq("state", "warm_transfer_declined") \
-                    .gte("created_at", (datetime.datetime.utcnow() - datetime.timedelta(seconds=30)).isoformat()) \
-                    .order("created_at", desc=True) \
-                    .limit(5) \
-                    .execute()
+                recent_declined = await db_execute(
+                    supabase.table("call_state_logs")
+                    .select("id, details, room_name")
+                    .eq("state", "warm_transfer_declined")
+                    .gte("created_at", (datetime.datetime.utcnow() - datetime.timedelta(seconds=30)).isoformat())
+                    .order("created_at", desc=True)
+                    .limit(5)
+                )
 
                 logger.info(f"🔄 Recent declined query result: {recent_declined.data}")
                 # Find one that matches this caller's phone
@@ -3073,10 +6074,11 @@ THIS IS AN OUTBOUND CALL:
 
                             # Mark as consumed so it won't trigger for future calls
                             details["consumed"] = True
-                            supabase.table("call_state_logs") \
-                                .update({"details": json.dumps(details)}) \
-                                .eq("id", declined_log["id"]) \
-                                .execute()
+                            await db_execute(
+                                supabase.table("call_state_logs")
+                                .update({"details": json.dumps(details)})
+                                .eq("id", declined_log["id"])
+                            )
                             logger.info(f"🔄 Marked declined transfer as consumed")
                         except json.JSONDecodeError as je:
                             logger.error(f"Failed to parse declined transfer details: {je}")
@@ -3107,7 +6109,7 @@ The person on this call is a CALLER/CUSTOMER calling in - they are NOT the busin
 - The CALLER is a customer/client reaching out to the business
 - Do NOT treat the caller as your boss or as if they set you up
 - Do NOT say "your assistant" or "your number" to them - you're not THEIR assistant
-- Treat every caller professionally as a potential customer{name_line}{caller_phone_info}{reconnect_context}
+- Treat every caller professionally as a potential customer{name_line}
 
 YOUR CONFIGURED PERSONALITY:
 """
@@ -3120,7 +6122,10 @@ CALL CONTEXT:
 - Be warm, friendly, and professional
 - You can transfer calls, take messages, or help customers directly"""
 
-        system_prompt = f"{INBOUND_ROLE_PREFIX}{base_prompt}{INBOUND_CONTEXT_SUFFIX}"
+        prompt.add_static(f"{INBOUND_ROLE_PREFIX}{base_prompt}{INBOUND_CONTEXT_SUFFIX}")
+        # Caller number and reconnect note differ per call, so they go after the agent-level text
+        if caller_phone_info or reconnect_context:
+            prompt.add_dynamic(f"\n\nTHIS CALLER:{caller_phone_info}{reconnect_context}")
         logger.info("📥 Inbound call - Agent handling customer service")
 
         # Check after-hours for inbound calls and inject context
@@ -3157,153 +6162,197 @@ AFTER-HOURS CONTEXT:
                         if user_config.get("functions") is None:
                             user_config["functions"] = functions_config_obj
                     logger.info(f"📞 After-hours: added forwarding number {forwarding_number} to transfer targets")
-                    system_prompt += after_hours_context
+                    prompt.add_dynamic(after_hours_context)
                     logger.info(f"🕐 After-hours context injected into system prompt (forwarding to {forwarding_number})")
 
-    # Prepend language instruction to system prompt
-    lang_instruction = LANGUAGE_INSTRUCTIONS.get(agent_language, "")
-    if lang_instruction:
-        system_prompt = lang_instruction + system_prompt
-        logger.info(f"🌐 Language instruction prepended for: {agent_language}")
-
     logger.info(f"Voice system prompt applied for {direction} call")
 
     log_call_state(ctx.room.name, "debug_5b_memory_check", "agent", {})
 
-    # Inject caller memory if memory is enabled for this agent
+    # Fetch everything else the call needs as one dependency graph: per-agent config
+    # (inbound path), caller memory, KB, semantic/shared memory and tool configs.
+    # Steps only wait on the steps they use, so independent lookups run concurrently.
     agent_id = user_config.get("id")
-    current_contact_id = None  # Will be set if we find the caller's contact
-
-    if user_config.get("memory_enabled"):
-        memory_config = user_config.get("memory_config") or {
-            "max_history_calls": 5,
-            "include_summaries": True,
-            "include_key_topics": True,
-            "include_preferences": True
-        }
+    functions_config = user_config.get("functions", {}) if user_config else {}
+    kb_source_ids = user_config.get("knowledge_source_ids") or []
+    memory_enabled = bool(user_config.get("memory_enabled"))
+    memory_caller_phone = remote_party_phone
+    memory_config = user_config.get("memory_config") or {
+        "max_history_calls": 5,
+        "include_summaries": True,
+        "include_key_topics": True,
+        "include_preferences": True
+    }
+    semantic_enabled = bool(user_config.get("semantic_memory_enabled")) and bool(agent_id)
+    shared_agent_ids = user_config.get("shared_memory_agent_ids") or []
+    sms_enabled = functions_config.get("sms", {}).get("enabled", False)
+    booking_enabled = functions_config.get("booking", {}).get("enabled", False)
 
-        memory_caller_phone = remote_party_phone
-
-        if memory_caller_phone and agent_id:
-            memory_context = await get_caller_memory(memory_caller_phone, user_id, agent_id, memory_config)
-            if memory_context:
-                system_prompt = f"{system_prompt}\n\n{memory_context}"
-                logger.info(f"🧠 Memory context injected into system prompt")
-
-                # Get contact_id for semantic search exclusion
-                normalized_phone = re.sub(r'[^\d+]', '', memory_caller_phone)
-                if not normalized_phone.startswith('+'):
-                    normalized_phone = '+' + normalized_phone
-                contact_lookup = supabase.table("contacts").select("id").eq("phone_number", normalized_phone).eq("user_id", user_id).limit(1).execute()
-                if contact_lookup.data:
-                    current_contact_id = contact_lookup.data[0]["id"]
-        else:
-            logger.info(f"🧠 Memory enabled but no caller phone available (phone={memory_caller_phone}, agent_id={agent_id})")
+    bootstrap = BootstrapGraph(f"bootstrap {ctx.room.name}")
+    # Prompt context (caller memory, KB, semantic and shared memory) gets its own graph in
+    # progressive mode, so the session can start and greet before it finishes
+    context_graph = BootstrapGraph(f"prompt context {ctx.room.name}") if PROGRESSIVE_PROMPT_HYDRATION else bootstrap
+
+    if not fast_path_complete:
+        voice_id = user_config.get("voice_id", "EXAVITQu4vr4xnSDxMaL")
+        bootstrap.step("voice_config", lambda: get_voice_config(voice_id, user_id, agent_id))
+        bootstrap.step("transfer_numbers", lambda: get_transfer_numbers(user_id, agent_id), default=[])
+        bootstrap.step("dynamic_variables", lambda: get_dynamic_variables(agent_id, user_id), default=[])
+
+    # Caller profile, semantic and shared memory come from the prefetch (already in flight
+    # when the number was known early; started here otherwise)
+    caller_prefetch.start_memory_lookups(memory_caller_phone, user_id, user_config)
+
+    async def _load_caller_profile():
+        # Contact and conversation context, loaded once and reused by memory, semantic search
+        # and the post-call memory update
+        if not (memory_enabled and memory_caller_phone and agent_id):
+            return None
+        return await caller_prefetch.result("caller_profile", memory_caller_phone, user_id, agent_id)
+
+    async def _load_caller_memory(caller_profile):
+        if not caller_profile:
+            return None
+        return await get_caller_memory(memory_caller_phone, user_id, agent_id, memory_config, profile=caller_profile)
+
+    async def _current_contact_id(caller_memory, caller_profile):
+        # Semantic search exclusion and shared memory only apply to callers with existing memory
+        return caller_profile.contact_id if caller_memory else None
+
+    context_graph.step("caller_profile", _load_caller_profile)
+    context_graph.step("caller_memory", _load_caller_memory, deps=("caller_profile",))
+    context_graph.step("contact_id", _current_contact_id, deps=("caller_memory", "caller_profile"))
 
-    # Inject knowledge base context if agent has KB sources
-    kb_source_ids = user_config.get("knowledge_source_ids") or []
     if kb_source_ids and agent_id:
         # Use agent_role or first 500 chars of system_prompt as the search query
         kb_query = user_config.get("agent_role") or base_prompt[:500]
-        kb_context = await search_knowledge_base(kb_source_ids, kb_query)
-        if kb_context:
-            kb_section = (
-                "\n\nKNOWLEDGE BASE CONTEXT (pre-loaded summary):\n"
-                f"{kb_context}\n\n"
-                "You also have a search_kb tool to look up specific questions the caller asks. "
-                "Use it when the caller asks something not covered above. "
-                "IMPORTANT: When using search_kb or any tool, always say a brief filler phrase first "
-                "like 'Great question, let me look that up' or 'One moment' so the caller knows you're working on it."
-            )
-            system_prompt = f"{system_prompt}{kb_section}"
-            logger.info(f"📚 Knowledge base context injected into system prompt")
-        else:
-            # No pre-loaded content, but tool is still available
-            kb_fallback = (
-                "\n\nYou have a search_kb tool to look up information from the knowledge base. "
-                "Use it whenever the caller asks a question you don't know the answer to. "
-                "Always say a brief filler phrase first like 'Let me look that up' so the caller knows you're working on it."
-            )
-            system_prompt = f"{system_prompt}{kb_fallback}"
-            logger.info(f"📚 No pre-loaded KB content, but search_kb tool hint added to prompt")
-
-    # Inject semantic memory context (similar past conversations) if enabled
-    if user_config.get("semantic_memory_enabled") and agent_id:
-        semantic_config = user_config.get("semantic_memory_config") or {
-            "max_results": 3,
-            "similarity_threshold": 0.75,
-            "include_other_callers": True
-        }
+        context_graph.step("kb_context", lambda: preload_knowledge_context(agent_id, kb_source_ids, kb_query))
+        # Load the local vector index for mid-call search_kb (no-op unless KB_LOCAL_INDEX=true)
+        local_kb_index.schedule_refresh(kb_source_ids)
+
+    async def _load_semantic_context(contact_id):
+        if not (semantic_enabled and contact_id):
+            return None
+        return await caller_prefetch.result("semantic_context", memory_caller_phone, user_id, agent_id)
 
-        # For semantic search at call start, we use the caller's existing memory summary
-        # to find similar conversations with OTHER callers
-        if current_contact_id:
-            # Get this caller's memory to use as search query
-            ctx_response = supabase.table("conversation_contexts").select("summary, key_topics").eq("contact_id", current_contact_id).eq("agent_id", agent_id).limit(1).execute()
-            if ctx_response.data and ctx_response.data[0].get("summary"):
-                caller_summary = ctx_response.data[0]["summary"]
-                caller_topics = ctx_response.data[0].get("key_topics") or []
-                search_text = f"{caller_summary}\n\nTopics: {', '.join(caller_topics)}"
-
-                semantic_context, semantic_match_count, semantic_matched_topics, semantic_memory_ids = await get_semantic_context(
-                    transcript_text=search_text,
-                    agent_id=agent_id,
-                    user_id=user_id,
-                    current_contact_id=current_contact_id,
-                    config=semantic_config
+    async def _load_shared_memory(contact_id):
+        if not (shared_agent_ids and contact_id):
+            return None
+        return await caller_prefetch.result("shared_memory", memory_caller_phone, user_id, agent_id)
+
+    context_graph.step("semantic_context", _load_semantic_context, deps=("contact_id",))
+    context_graph.step("shared_memory", _load_shared_memory, deps=("contact_id",))
+
+    if agent_id:
+        bootstrap.step("custom_functions", lambda: get_custom_functions(agent_id), default=[])
+
+    if sms_enabled:
+        async def _load_sms_from_number():
+            # Find an SMS-capable number for this agent (may differ from the voice service_number)
+            logger.info(f"📱 SMS lookup: agent_id={agent_id} (type={type(agent_id).__name__})")
+            return await get_sms_from_number(agent_id)
+
+        bootstrap.step("sms_from_number", _load_sms_from_number)
+        bootstrap.step("sms_templates", lambda: get_sms_templates(user_id, agent_id), default=[])
+
+    if booking_enabled:
+        bootstrap.step("cal_com_connected", lambda: has_cal_com_connection(user_id, agent_id), default=False)
+
+    context_run = asyncio.ensure_future(context_graph.run()) if context_graph is not bootstrap else None
+    bootstrap_results = await bootstrap.run()
+    logger.info(f"🚀 Bootstrap: {bootstrap.summary()}")
+    log_call_state(ctx.room.name, "bootstrap_complete", "agent", {
+        "total_ms": bootstrap.total_ms,
+        "timings_ms": bootstrap.timings,
+    })
+
+    if not fast_path_complete:
+        voice_config = bootstrap_results.get("voice_config")
+        transfer_numbers = bootstrap_results.get("transfer_numbers") or []
+        dynamic_variables = bootstrap_results.get("dynamic_variables") or []
+
+    caller_profile = None  # Set once prompt context has loaded; used by the post-call memory update
+
+    def _with_prompt_context(prompt, context_results):
+        """Copy of the prompt with caller memory, KB, semantic and shared memory sections added.
+
+        The KB pre-load is the same for every call to the agent and joins the static prefix;
+        the caller-specific sections go in the per-call suffix.
+        """
+        nonlocal caller_profile
+        prompt = prompt.copy()
+        # Inject caller memory if memory is enabled for this agent
+        caller_profile = context_results.get("caller_profile")
+        current_contact_id = context_results.get("contact_id")  # Set if we found the caller's contact
+
+        if memory_enabled:
+            if memory_caller_phone and agent_id:
+                memory_context = context_results.get("caller_memory")
+                if memory_context:
+                    prompt.add_dynamic(f"\n\n{memory_context}")
+                    logger.info(f"🧠 Memory context injected into system prompt")
+            else:
+                logger.info(f"🧠 Memory enabled but no caller phone available (phone={memory_caller_phone}, agent_id={agent_id})")
+
+        # Inject knowledge base context if agent has KB sources
+        if kb_source_ids and agent_id:
+            kb_context = context_results.get("kb_context")
+            if kb_context:
+                kb_section = (
+                    "\n\nKNOWLEDGE BASE CONTEXT (pre-loaded summary):\n"
+                    f"{kb_context}\n\n"
+                    "You also have a search_kb tool to look up specific questions the caller asks. "
+                    "Use it when the caller asks something not covered above. "
+                    "IMPORTANT: When using search_kb or any tool, always say a brief filler phrase first "
+                    "like 'Great question, let me look that up' or 'One moment' so the caller knows you're working on it."
+                )
+                prompt.add_static(kb_section)
+                logger.info(f"📚 Knowledge base context injected into system prompt")
+            else:
+                # No pre-loaded content, but tool is still available
+                kb_fallback = (
+                    "\n\nYou have a search_kb tool to look up information from the knowledge base. "
+                    "Use it whenever the caller asks a question you don't know the answer to. "
+                    "Always say a brief filler phrase first like 'Let me look that up' so the caller knows you're working on it."
                 )
+                prompt.add_static(kb_fallback)
+                logger.info(f"📚 No pre-loaded KB content, but search_kb tool hint added to prompt")
+
+        # Inject semantic memory context (similar past conversations) if enabled
+        if semantic_enabled:
+            if current_contact_id:
+                semantic_result = context_results.get("semantic_context")
+                if semantic_result:
+                    caller_summary, caller_topics, (semantic_context, semantic_match_count, semantic_matched_topics, semantic_memory_ids) = semantic_result
+
+                    if semantic_context:
+                        prompt.add_dynamic(f"\n\n{semantic_context}")
+                        logger.info(f"🔮 Semantic context injected into system prompt")
+
+                        # Fire-and-forget: check semantic match actions (alerts)
+                        asyncio.create_task(_check_semantic_actions(
+                            agent_id=agent_id,
+                            user_id=user_id,
+                            matched_topics=caller_topics + semantic_matched_topics,
+                            match_count=semantic_match_count,
+                            triggering_summary=caller_summary,
+                            agent_name=user_config.get("name") or user_config.get("agent_name") or "Assistant",
+                            matched_memory_ids=semantic_memory_ids
+                        ))
+            else:
+                logger.info(f"🔮 Semantic memory enabled but no existing caller context to search from")
 
-                if semantic_context:
-                    system_prompt = f"{system_prompt}\n\n{semantic_context}"
-                    logger.info(f"🔮 Semantic context injected into system prompt")
-
-                    # Fire-and-forget: check semantic match actions (alerts)
-                    asyncio.create_task(_check_semantic_actions(
-                        agent_id=agent_id,
-                        user_id=user_id,
-                        matched_topics=caller_topics + semantic_matched_topics,
-                        match_count=semantic_match_count,
-                        triggering_summary=caller_summary,
-                        agent_name=user_config.get("name") or user_config.get("agent_name") or "Assistant",
-                        matched_memory_ids=semantic_memory_ids
-                    ))
-        else:
-            logger.info(f"🔮 Semantic memory enabled but no existing caller context to search from")
+        # Inject shared memory from other agents if configured
+        shared_sections = context_results.get("shared_memory")
+        if shared_sections:
+            shared_context = "\n\n".join(shared_sections)
+            prompt.add_dynamic(f"\n\n{shared_context}")
+            logger.info(f"🔗 Shared memory injected from {len(shared_sections)} agent(s)")
 
-    # Inject shared memory from other agents if configured
-    shared_agent_ids = user_config.get("shared_memory_agent_ids") or []
-    if shared_agent_ids and current_contact_id:
-        try:
-            # Batch query: get memories from shared agents for the same contact
-            shared_response = supabase.table("conversation_contexts").select(
-                "summary, key_topics, agent_id"
-            ).eq("contact_id", current_contact_id).in_("agent_id", shared_agent_ids).execute()
-
-            if shared_response.data:
-                # Look up agent names for context
-                agent_names = {}
-                for shared_id in shared_agent_ids:
-                    agent_lookup = supabase.table("agent_configs").select("name").eq("id", shared_id).limit(1).execute()
-                    if agent_lookup.data:
-                        agent_names[shared_id] = agent_lookup.data[0].get("name", "Unknown Agent")
-
-                shared_sections = []
-                for entry in shared_response.data:
-                    agent_name_label = agent_names.get(entry["agent_id"], "Another Agent")
-                    summary = entry.get("summary", "")
-                    topics = entry.get("key_topics") or []
-                    if summary:
-                        section = f"## SHARED MEMORY (from {agent_name_label})\n{summary}"
-                        if topics:
-                            section += f"\nTopics: {', '.join(topics)}"
-                        shared_sections.append(section)
-
-                if shared_sections:
-                    shared_context = "\n\n".join(shared_sections)
-                    system_prompt = f"{system_prompt}\n\n{shared_context}"
-                    logger.info(f"🔗 Shared memory injected from {len(shared_sections)} agent(s)")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to load shared memory: {e}")
+        return prompt
+
+    if context_run is None:
+        prompt = _with_prompt_context(prompt, bootstrap_results)
 
     # Already connected earlier to get service number, don't connect again in session.start
 
@@ -3319,7 +6368,7 @@ AFTER-HOURS CONTEXT:
     # Load custom functions for this agent
     custom_tools = []
     if agent_id:
-        custom_function_configs = await get_custom_functions(agent_id)
+        custom_function_configs = bootstrap_results.get("custom_functions")
         if custom_function_configs:
             logger.info(f"🔧 Loading {len(custom_function_configs)} custom functions for agent {agent_id}")
             # Get webhook secret from environment (optional)
@@ -3337,19 +6386,20 @@ AFTER-HOURS CONTEXT:
         else:
             logger.info(f"🔧 No custom functions configured for agent {agent_id}")
 
-    # Add system function tools based on functions config
-    functions_config = user_config.get("functions", {}) if user_config else {}
+    # Add system function tools based on functions config (functions_config loaded above)
 
     # Mutable holder for on_call_end callback and cleanup flag (set later, used by end_call tool)
     call_end_callback = [None]
     cleanup_state = [False]  # shared flag to prevent duplicate cleanup
 
-    async def _pre_disconnect():
+    def _pre_disconnect():
+        # Runs synchronously inside end_call: snapshot the transcript as heard so far and
+        # let on_call_end finish in the background while the call is torn down.
         if cleanup_state[0]:
             return
         cleanup_state[0] = True
         if call_end_callback[0]:
-            await call_end_callback[0]()
+            track_post_call_task(call_end_callback[0](transcript.text))
 
     # End Call function (default: enabled)
     end_call_config = functions_config.get("end_call", {})
@@ -3393,28 +6443,9 @@ AFTER-HOURS CONTEXT:
 
     # SMS function
     sms_config = functions_config.get("sms", {})
-    sms_enabled = sms_config.get("enabled", False)
     if sms_enabled:
-        # Find an SMS-capable number for this agent (may differ from the voice service_number)
-        sms_from_number = None
-        try:
-            agent_id_for_sms = user_config.get("id")
-            logger.info(f"📱 SMS lookup: agent_id={agent_id_for_sms} (type={type(agent_id_for_sms).__name__})")
-            sms_numbers = supabase.table("service_numbers") \
-                .select("phone_number, capabilities") \
-                .eq("agent_id", str(agent_id_for_sms)) \
-                .eq("is_active", True) \
-                .execute()
-            logger.info(f"📱 SMS lookup result: {len(sms_numbers.data)} rows, data={sms_numbers.data}")
-            if sms_numbers.data:
-                for sn in sms_numbers.data:
-                    caps = sn.get("capabilities") or {}
-                    logger.info(f"📱 Checking number {sn.get('phone_number')}: caps={caps}, caps_type={type(caps).__name__}, sms={caps.get('sms')}")
-                    if caps.get("sms"):
-                        sms_from_number = sn["phone_number"]
-                        break
-        except Exception as e:
-            logger.warning(f"Could not look up SMS-capable number: {e}", exc_info=True)
+        # SMS-capable number for this agent (may differ from the voice service_number)
+        sms_from_number = bootstrap_results.get("sms_from_number")
 
         # Do NOT fall back to service_number — it may be voice-only
         if not sms_from_number:
@@ -3422,26 +6453,19 @@ AFTER-HOURS CONTEXT:
 
         if sms_from_number:
             sms_description = sms_config.get("description")
-            # Load SMS templates for this user
-            sms_templates = []
-            try:
-                templates_result = supabase.table("sms_templates").select("name, content").eq("user_id", user_id).execute()
-                if templates_result.data:
-                    sms_templates = templates_result.data
-                    logger.info(f"📱 Loaded {len(sms_templates)} SMS templates")
-            except Exception as e:
-                logger.warning(f"Could not load SMS templates: {e}")
+            # SMS templates for this user
+            sms_templates = bootstrap_results.get("sms_templates") or []
+            if sms_templates:
+                logger.info(f"📱 Loaded {len(sms_templates)} SMS templates")
             sms_tool = create_sms_tool(user_id, sms_from_number, sms_description, sms_templates, agent_id=agent_id)
             custom_tools.append(sms_tool)
             logger.info(f"📱 Registered SMS tool with SMS-capable number {sms_from_number}")
 
     # Booking function (get_availability + book_appointment)
     booking_config = functions_config.get("booking", {})
-    booking_enabled = booking_config.get("enabled", False)
     if booking_enabled:
         # Check if user has Cal.com connected
-        user_cal_check = supabase.table("users").select("cal_com_access_token").eq("id", user_id).single().execute()
-        if user_cal_check.data and user_cal_check.data.get("cal_com_access_token"):
+        if bootstrap_results.get("cal_com_connected"):
             # Get availability tool
             get_avail_config = booking_config.get("get_availability", {})
             if get_avail_config.get("enabled", True):  # Default enabled if booking is enabled
@@ -3462,31 +6486,61 @@ AFTER-HOURS CONTEXT:
     extract_enabled = extract_config.get("enabled", False)
     extract_calls_enabled = extract_config.get("channels", {}).get("calls", True)
     pii_mode = user_config.get("pii_storage", "enabled") if user_config else "enabled"
+    transcript.redact = pii_mode == "redacted"
     if extract_enabled and extract_calls_enabled:
         collect_data_tool = create_collect_data_tool(user_id, pii_mode=pii_mode)
         custom_tools.append(collect_data_tool)
         logger.info(f"📝 Registered extract_data/collect tool")
 
     # KB Search tool — auto-enabled when agent has knowledge bases
+    kb_prefetcher = None
     if kb_source_ids:
-        kb_tool = create_kb_search_tool(kb_source_ids, say_filler_ref)
+        # Answer cache scope includes the KB version; resolved in the background
+        kb_cache_scope = asyncio.ensure_future(KBAnswerCache.scope_for(agent_id, kb_source_ids)) if agent_id else None
+        if KB_PREFETCH_ENABLED and kb_cache_scope:
+            kb_prefetcher = KBPrefetcher(kb_source_ids, kb_cache_scope, KB_PREFETCH_MAX_PER_CALL)
+        kb_tool = create_kb_search_tool(kb_source_ids, say_filler_ref, cache_scope=kb_cache_scope, prefetcher=kb_prefetcher)
         custom_tools.append(kb_tool)
         logger.info(f"📚 Registered KB search tool with {len(kb_source_ids)} source(s)")
 
     # Substitute {{variable}} placeholders from call_variables (passed at call initiation time)
-    if call_variables:
+    def _substitute_call_variables(prompt):
+        if not call_variables:
+            return prompt
+
         def _replace_var(m):
             return str(call_variables.get(m.group(1), m.group(0)))
-        system_prompt = re.sub(r'\{\{(\w+)\}\}', _replace_var, system_prompt)
-        logger.info(f"🔀 Substituted call_variables into system prompt: {list(call_variables.keys())}")
+        return re.sub(r'\{\{(\w+)\}\}', _replace_var, prompt)
+
+    if call_variables:
+        logger.info(f"🔀 Substituting call_variables into system prompt: {list(call_variables.keys())}")
+
+    logger.info(f"⚙️ Agent config cache: {agent_config_cache.hits} hits / {agent_config_cache.misses} misses this call")
 
     # Create Agent instance with custom function tools
     log_call_state(ctx.room.name, "debug_7_creating_agent", "agent", {})
+    agent_class = HydratingAgent if context_run is not None else Agent
+    log_call_state(ctx.room.name, "prompt_layout", "agent", prompt.layout())
     if custom_tools:
-        assistant = Agent(instructions=system_prompt, tools=custom_tools)
+        assistant = agent_class(instructions=_substitute_call_variables(prompt.build()), tools=custom_tools)
         logger.info(f"🔧 Agent created with {len(custom_tools)} custom function tools")
     else:
-        assistant = Agent(instructions=system_prompt)
+        assistant = agent_class(instructions=_substitute_call_variables(prompt.build()))
+
+    if context_run is not None:
+        async def _build_hydrated_prompt():
+            context_results = await context_run
+            logger.info(f"🪄 Prompt context: {context_graph.summary()}")
+            log_call_state(ctx.room.name, "prompt_context_loaded", "agent", {
+                "total_ms": context_graph.total_ms,
+                "timings_ms": context_graph.timings,
+            })
+            hydrated_prompt = _with_prompt_context(prompt, context_results)
+            log_call_state(ctx.room.name, "prompt_layout", "agent", hydrated_prompt.layout())
+            return _substitute_call_variables(hydrated_prompt.build())
+
+        assistant.start_hydration(_build_hydrated_prompt)
+        logger.info("🪄 Progressive prompt hydration: session starts on the base prompt")
     log_call_state(ctx.room.name, "debug_8_agent_created", "agent", {})
 
     # Get LLM model from config (default to gpt-4.1-mini — best quality/latency/cost for voice)
@@ -3502,6 +6556,8 @@ AFTER-HOURS CONTEXT:
         style=float(voice_config.get("style", 0.0)) if voice_config else 0.0,
         use_speaker_boost=bool(voice_config.get("use_speaker_boost", True)) if voice_config else True,
     )
+    # Identifies rendered audio in the TTS audio cache
+    tts_profile = {"voice_id": tts_voice_id, "model": tts_model, "voice_settings": tts_voice_settings}
 
     # Pick STT model based on language (nova-2-phonecall is English-optimized)
     if agent_language == "multi":
@@ -3539,24 +6595,24 @@ AFTER-HOURS CONTEXT:
         min_interruption = round(0.7 - (interrupt_sensitivity * 0.6), 3)  # 0→0.7s, 1→0.1s
         logger.info(f"🎚️ Interrupt sensitivity={interrupt_sensitivity}: min_interruption={min_interruption}s")
 
-        # Use pre-warmed VAD model if available (avoids ML model load on first call)
-        prewarmed_vad = ctx.proc.userdata.get("vad") if hasattr(ctx, "proc") and ctx.proc else None
-        if prewarmed_vad:
-            logger.info("🔥 Using pre-warmed Silero VAD model")
+        # Pre-warmed VAD with this agent's thresholds (avoids ML model load per call)
+        job_proc = getattr(ctx, "proc", None)
+        session_vad = get_shared_vad(
+            job_proc,
+            min_silence_duration=vad_silence,
+            min_speech_duration=vad_speech,
+            activation_threshold=vad_threshold,
+        )
 
-        # Try to build turn detector; falls back to None if model files are missing
-        turn_detector_instance = _build_turn_detector() if _TURN_DETECTOR_AVAILABLE else None
+        # Pre-warmed turn detector; None if model files are missing
+        turn_detector_instance = get_shared_turn_detector(job_proc)
         if turn_detector_instance:
             logger.info("🌍 ML turn detection enabled (MultilingualModel)")
         else:
             logger.info("🔇 Using silence-based endpointing (turn detector unavailable)")
 
         session = AgentSession(
-            vad=silero.VAD.load(
-                min_silence_duration=vad_silence,
-                min_speech_duration=vad_speech,
-                activation_threshold=vad_threshold,
-            ),
+            vad=session_vad,
             stt=deepgram.STT(
                 model=stt_model,
                 language=stt_language,
@@ -3594,7 +6650,27 @@ AFTER-HOURS CONTEXT:
 
     # Wire up filler injection now that session exists.
     # Custom function tools call say_filler_ref[0](phrase) before their webhook.
-    say_filler_ref[0] = session.say
+    say_filler_ref[0] = lambda phrase: say_with_cache(session, phrase, tts_profile)
+
+    # Pre-synthesized audio: load this voice's fillers and greeting from the audio cache
+    if kb_source_ids or bootstrap_results.get("custom_functions"):
+        asyncio.create_task(tts_audio_cache.warm(session.tts, tts_profile, THINKING_FILLERS))
+    if greeting:
+        await tts_audio_cache.prepare(session.tts, tts_profile, greeting)
+
+    # Prompt-cache hit ratio of this call's LLM requests (reported at call end)
+    prompt_cache_stats = PromptCacheStats()
+
+    @session.on("metrics_collected")
+    def on_metrics_collected(event):
+        if getattr(event.metrics, "type", None) == "llm_metrics":
+            prompt_cache_stats.add(event.metrics)
+
+    # Speculative KB retrieval from the caller's speech (interim + final transcripts)
+    if kb_prefetcher:
+        @session.on("user_input_transcribed")
+        def on_user_input_transcribed(event):
+            kb_prefetcher.observe(event.transcript, event.is_final)
 
     # Latency tracking
     latency_start_time = None
@@ -3637,57 +6713,57 @@ AFTER-HOURS CONTEXT:
             if text_content:
                 role = event.item.role
                 speaker = "agent" if role == "assistant" else "user"
-                transcript_messages.append({"speaker": speaker, "text": text_content})
+                transcript.append(speaker, text_content)
                 logger.info(f"✅ {speaker.capitalize()} said: {text_content}")
                 logger.info(f"📝 Total messages in transcript: {len(transcript_messages)}")
 
                 # Stream partial transcript to DB for real-time inbox updates
-                # Only in "enabled" mode (disabled=no transcript, redacted=too slow for real-time)
-                if call_record_id and pii_mode == "enabled":
+                # Not in "disabled" mode; in "redacted" mode turns are redacted before streaming
+                if call_record_id and pii_mode in ("enabled", "redacted"):
                     now = asyncio.get_event_loop().time()
                     # Debounce: write on first message or after 3+ seconds since last write
                     if last_transcript_write == 0 or (now - last_transcript_write) >= 3:
                         last_transcript_write = now
-                        partial_transcript = "\n\n".join([
-                            f"{'Agent' if msg['speaker'] == 'agent' else 'Caller'}: {msg['text']}"
-                            for msg in transcript_messages
-                        ])
-
-                        async def write_partial_transcript(record_id, text):
-                            try:
-                                supabase.table("call_records").update({"transcript": text}).eq("id", record_id).execute()
-                                logger.info(f"📝 Partial transcript written ({len(transcript_messages)} msgs)")
-                            except Exception as e:
-                                logger.warning(f"⚠️ Partial transcript write failed: {e}")
-
-                        asyncio.create_task(write_partial_transcript(call_record_id, partial_transcript))
+                        # Only the turns since the last write are sent
+                        asyncio.create_task(transcript.flush_partial(call_record_id))
             else:
                 logger.warning("⚠️ conversation_item_added event had no text_content")
         except Exception as e:
             logger.error(f"❌ Error in conversation_item_added handler: {e}", exc_info=True)
 
     # Handle call completion
-    async def on_call_end():
+    async def on_call_end(transcript_snapshot: str = None):
         """Save transcript and recording when call ends"""
         nonlocal call_record_id
         try:
             logger.info("📞 Call ending - saving transcript...")
 
-            transcript_text = "\n\n".join([
-                f"{'Agent' if msg['speaker'] == 'agent' else 'Caller'}: {msg['text']}"
-                for msg in transcript_messages
-            ])
+            transcript_text = transcript_snapshot if transcript_snapshot is not None else transcript.text
 
             logger.info(f"Transcript ({len(transcript_messages)} messages):\n{transcript_text}")
 
+            if prompt_cache_stats.requests:
+                llm_cache_stats = prompt_cache_stats.stats()
+                logger.info(f"🗃️ Prompt cache: {llm_cache_stats['cached_tokens']}/{llm_cache_stats['prompt_tokens']} prompt tokens cached "
+                            f"({llm_cache_stats['cached_ratio']:.0%}) over {llm_cache_stats['llm_requests']} LLM requests")
+                log_call_state(ctx.room.name, "prompt_cache_stats", "agent", llm_cache_stats)
+
+            if kb_source_ids:
+                log_call_state(ctx.room.name, "kb_answer_cache_stats", "agent", {
+                    **(await kb_answer_cache.stats(agent_id)),
+                    "prefetches": KB_PREFETCH_MAX_PER_CALL - kb_prefetcher.remaining if kb_prefetcher else 0,
+                    "prefetches_used": kb_prefetcher.used if kb_prefetcher else 0,
+                })
+
             # If call_record_id wasn't resolved early, try now
             if not call_record_id and call_sid:
                 logger.info(f"Looking up call by livekit_call_id: {call_sid}")
-                response = supabase.table("call_records") \
-                    .select("id") \
-                    .eq("livekit_call_id", call_sid) \
-                    .limit(1) \
-                    .execute()
+                response = await db_execute(
+                    supabase.table("call_records")
+                    .select("id")
+                    .eq("livekit_call_id", call_sid)
+                    .limit(1)
+                )
 
                 if response.data and len(response.data) > 0:
                     call_record_id = response.data[0]["id"]
@@ -3705,14 +6781,15 @@ AFTER-HOURS CONTEXT:
                 # First try with service_number (for inbound calls where it matches)
                 if service_number:
                     logger.info(f"Looking up call by service_number: {service_number} and user_id: {user_id}")
-                    response = supabase.table("call_records") \
-                        .select("id") \
-                        .eq("service_number", service_number) \
-                        .eq("user_id", user_id) \
-                        .gte("created_at", time_window.isoformat()) \
-                        .order("created_at", desc=True) \
-                        .limit(1) \
-                        .execute()
+                    response = await db_execute(
+                        supabase.table("call_records")
+                        .select("id")
+                        .eq("service_number", service_number)
+                        .eq("user_id", user_id)
+                        .gte("created_at", time_window.isoformat())
+                        .order("created_at", desc=True)
+                        .limit(1)
+                    )
 
                     if response.data and len(response.data) > 0:
                         call_record_id = response.data[0]["id"]
@@ -3722,13 +6799,14 @@ AFTER-HOURS CONTEXT:
                 # If no match, try without service_number (for bridged outbound where LiveKit trunk != caller_id)
                 if not call_record_id:
                     logger.info(f"No match with service_number, trying user_id only (for bridged outbound)")
-                    response = supabase.table("call_records") \
-                        .select("id") \
-                        .eq("user_id", user_id) \
-                        .gte("created_at", time_window.isoformat()) \
-                        .order("created_at", desc=True) \
-                        .limit(1) \
-                        .execute()
+                    response = await db_execute(
+                        supabase.table("call_records")
+                        .select("id")
+                        .eq("user_id", user_id)
+                        .gte("created_at", time_window.isoformat())
+                        .order("created_at", desc=True)
+                        .limit(1)
+                    )
 
                     if response.data and len(response.data) > 0:
                         call_record_id = response.data[0]["id"]
@@ -3744,77 +6822,6 @@ AFTER-HOURS CONTEXT:
                 pii_mode = user_config.get("pii_storage", "enabled") if user_config else "enabled"
                 logger.info(f"🔒 PII storage mode: {pii_mode}")
 
-                if pii_mode == "disabled":
-                    # Disabled mode: only update status, no transcript/summary/extracted data
-                    update_data = {
-                        "status": "completed",
-                        "duration_seconds": call_duration,
-                        "ended_at": "now()"
-                    }
-                    supabase.table("call_records") \
-                        .update(update_data) \
-                        .eq("id", call_record_id) \
-                        .execute()
-                    logger.info(f"✅ Call record updated (PII disabled - no transcript/summary stored)")
-
-                else:
-                    # Enabled or Redacted mode
-                    store_transcript = transcript_text
-
-                    # Redact transcript if in redacted mode
-                    if pii_mode == "redacted" and transcript_text:
-                        logger.info(f"🔒 Redacting PII from transcript...")
-                        store_transcript = await redact_pii(transcript_text)
-
-                    update_data = {
-                        "transcript": store_transcript,
-                        "status": "completed",
-                        "duration_seconds": call_duration,
-                        "ended_at": "now()"
-                    }
-
-                    # Generate call summary and extract dynamic variables in parallel
-                    # In redacted mode, use the redacted transcript so PII can't leak through
-                    if store_transcript:
-                        logger.info(f"📝 Generating call summary and extracting data...")
-
-                        summary_task = generate_call_summary(store_transcript)
-                        extraction_task = extract_data_from_transcript(store_transcript, dynamic_variables) if extract_calls_enabled else None
-
-                        if extraction_task:
-                            call_summary, extracted_data = await asyncio.gather(summary_task, extraction_task)
-                        else:
-                            call_summary = await summary_task
-                            extracted_data = {}
-
-                        if call_summary:
-                            update_data["call_summary"] = call_summary
-                            logger.info(f"📝 Call summary: {call_summary}")
-
-                        if extracted_data:
-                            update_data["extracted_data"] = extracted_data
-                            logger.info(f"📊 Extracted data: {extracted_data}")
-
-                    supabase.table("call_records") \
-                        .update(update_data) \
-                        .eq("id", call_record_id) \
-                        .execute()
-
-                    logger.info(f"✅ Call transcript saved to database{' with summary' if update_data.get('call_summary') else ''}{' with extracted_data' if update_data.get('extracted_data') else ''}{' (redacted)' if pii_mode == 'redacted' else ''}")
-
-                    # Send per-variable Slack notifications for extracted data (fire-and-forget)
-                    if update_data.get("extracted_data") and dynamic_variables:
-                        asyncio.create_task(send_extracted_data_slack(
-                            user_id=user_id,
-                            agent_id=user_config.get("id") if user_config else None,
-                            extracted_data=update_data["extracted_data"],
-                            dynamic_variables=dynamic_variables,
-                            caller_number=remote_party_phone,
-                        ))
-
-                # Deduct credits for the call (always, regardless of PII mode)
-                # call_duration was already computed above and saved to DB
-                billing_agent_id = user_config.get("id") if user_config else None
                 # Count TTS characters (agent speech only) for accurate vendor cost tracking
                 tts_characters = sum(len(msg['text']) for msg in transcript_messages if msg['speaker'] == 'agent')
                 logger.info(f"💰 TTS characters for billing: {tts_characters} chars from {sum(1 for m in transcript_messages if m['speaker'] == 'agent')} agent messages")
@@ -3836,84 +6843,29 @@ AFTER-HOURS CONTEXT:
                 if has_branded_call:
                     logger.info(f"💰 Branded caller ID active: {room_metadata.get('cnam_name')}")
 
-                asyncio.create_task(deduct_call_credits(
-                    user_id=user_id,
-                    agent_id=billing_agent_id,
-                    duration_seconds=call_duration,
-                    call_record_id=call_record_id,
-                    tts_characters=tts_characters,
-                    addons=billing_addons if billing_addons else None,
-                    branded_call=has_branded_call
-                ))
-
-                # Update caller memory if enabled (skip entirely in disabled mode)
-                if pii_mode != "disabled" and user_config and user_config.get("memory_enabled") and update_data.get("call_summary"):
-                    agent_id = user_config.get("id")
-                    memory_phone = remote_party_phone
-
-                    if memory_phone and agent_id:
-                        # Generate embeddings if semantic memory is enabled
-                        should_generate_embedding = user_config.get("semantic_memory_enabled", False)
-                        # In redacted mode, memory gets the redacted summary (already redacted above)
-                        await update_caller_memory(
-                            caller_phone=memory_phone,
-                            user_id=user_id,
-                            agent_id=agent_id,
-                            call_summary=update_data["call_summary"],
-                            call_record_id=call_record_id,
-                            transcript_text=store_transcript if pii_mode != "disabled" else "",
-                            generate_embedding_flag=should_generate_embedding,
-                            direction=direction,
-                            service_number=service_number
-                        )
-                    else:
-                        logger.info(f"🧠 Memory enabled but missing phone or agent_id (phone={memory_phone}, agent_id={agent_id})")
-
-                # Send webhooks (fire-and-forget)
-                if user_id:
-                    webhook_payload = {
-                        "call_record_id": call_record_id,
-                        "direction": direction,
-                        "caller_number": remote_party_phone,
-                        "service_number": service_number,
-                        "agent_id": user_config.get("id") if user_config else None,
-                        "agent_name": user_config.get("name") if user_config else None,
-                        "duration_seconds": call_duration,
-                        "transcript": update_data.get("transcript") if pii_mode != "disabled" else None,
-                        "summary": update_data.get("call_summary"),
-                        "extracted_data": update_data.get("extracted_data"),
-                        "status": "completed",
-                    }
-                    asyncio.create_task(send_webhooks(user_id, "call.completed", webhook_payload))
-
-                # Trigger event-based skills (post-call follow-up, auto-CRM, etc.)
-                asyncio.create_task(trigger_event_skills({
+                # Redaction, summary/extraction, the call record update, billing, memory,
+                # webhooks and skills run from the durable post-call queue, so they complete
+                # even if this job process exits right after the call.
+                await submit_post_call_job("finalize_call", f"{call_record_id}:finalize_call", {
+                    "call_record_id": str(call_record_id),
+                    "user_id": user_id,
                     "agent_id": user_config.get("id") if user_config else None,
-                    "call_record_id": str(call_record_id) if call_record_id else None,
+                    "agent_name": user_config.get("name") if user_config else None,
+                    "pii_mode": pii_mode,
+                    "transcript": transcript_text if pii_mode != "disabled" else "",
+                    "call_duration": call_duration,
+                    "dynamic_variables": dynamic_variables,
+                    "extract_calls_enabled": extract_calls_enabled,
                     "caller_phone": remote_party_phone,
-                    "caller_name": None,
-                    "call_duration_seconds": call_duration,
-                    "call_summary": update_data.get("call_summary"),
-                    "extracted_data": update_data.get("extracted_data") or {},
-                }))
-
-                # If this call belongs to a test run, trigger evaluation now that record is fully saved
-                try:
-                    cr_check = supabase.table("call_records").select("test_run_id").eq("id", call_record_id).single().execute()
-                    test_run_id = cr_check.data.get("test_run_id") if cr_check.data else None
-                    if test_run_id:
-                        supabase_url = os.environ.get("SUPABASE_URL", "")
-                        supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
-                        async with aiohttp.ClientSession() as http_session:
-                            await http_session.post(
-                                f"{supabase_url}/functions/v1/test-log-collector",
-                                json={"test_run_id": test_run_id},
-                                headers={"Authorization": f"Bearer {supabase_key}", "Content-Type": "application/json"},
-                                timeout=aiohttp.ClientTimeout(total=15),
-                            )
-                        logger.info(f"🧪 Triggered test-log-collector for test run {test_run_id}")
-                except Exception as te:
-                    logger.warning(f"Could not trigger test-log-collector: {te}")
+                    "direction": direction,
+                    "service_number": service_number,
+                    "memory_enabled": bool(user_config and user_config.get("memory_enabled")),
+                    "semantic_memory_enabled": bool(user_config and user_config.get("semantic_memory_enabled")),
+                    "caller_profile": caller_profile.to_dict() if caller_profile else None,
+                    "tts_characters": tts_characters,
+                    "billing_addons": billing_addons,
+                    "branded_call": has_branded_call,
+                })
             else:
                 logger.warning("No call_record found - cannot save transcript")
 
@@ -3941,8 +6893,8 @@ AFTER-HOURS CONTEXT:
             logger.info(f"📝 Final transcript message count: {len(transcript_messages)}")
             await on_call_end()
 
-        # Run async cleanup - use create_task for proper tracking
-        asyncio.create_task(delayed_cleanup())
+        # Run async cleanup - tracked so job shutdown waits for it
+        track_post_call_task(delayed_cleanup())
 
     # Also handle room disconnection as fallback (fires when room closes)
     @ctx.room.on("disconnected")
@@ -3958,7 +6910,7 @@ AFTER-HOURS CONTEXT:
             logger.info("⏳ Room disconnected - saving transcript...")
             await on_call_end()
 
-        asyncio.create_task(room_cleanup())
+        track_post_call_task(room_cleanup())
 
     # Start the session FIRST for lowest latency - recording starts in background
     await session.start(room=ctx.room, agent=assistant)
@@ -3985,7 +6937,8 @@ AFTER-HOURS CONTEXT:
         # Check if account is locked
         if is_locked:
             logger.warning(f"⚠️ Account is locked for user {admin_user_id}")
-            await session.say("Your admin access is currently locked due to too many failed attempts. Please reset your access code via the web application.", allow_interruptions=False)
+            await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_LOCKED_MESSAGE, always=True)
+            await say_with_cache(session, ADMIN_LOCKED_MESSAGE, tts_profile, allow_interruptions=False)
             # End call by returning
             return
 
@@ -4018,10 +6971,11 @@ AFTER-HOURS CONTEXT:
 
         if not identity_confirmed:
             logger.info("Identity not confirmed - proceeding as regular call")
-            await session.say(greeting, allow_interruptions=True)
+            await say_with_cache(session, greeting, tts_profile, allow_interruptions=True)
         else:
             # Ask for access code
-            await session.say("Please say your access code, one digit at a time.", allow_interruptions=False)
+            await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_ACCESS_CODE_PROMPT, always=True)
+            await say_with_cache(session, ADMIN_ACCESS_CODE_PROMPT, tts_profile, allow_interruptions=False)
 
             # Wait for access code
             access_code_event = asyncio.Event()
@@ -4065,7 +7019,8 @@ ADMIN MODE ACTIVATED:
                     # Update agent's instructions to admin mode
                     assistant.instructions = f"{base_prompt}{ADMIN_MODE_PROMPT}"
 
-                    await session.say("Access granted. You are now in admin mode. How can I help you configure your assistant?", allow_interruptions=True)
+                    await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_ACCESS_GRANTED_MESSAGE, always=True)
+                    await say_with_cache(session, ADMIN_ACCESS_GRANTED_MESSAGE, tts_profile, allow_interruptions=True)
                 else:
                     logger.warning(f"❌ Invalid access code for user {admin_user_id}")
 
@@ -4073,15 +7028,18 @@ ADMIN MODE ACTIVATED:
                     is_locked = await check_and_lock_account(admin_user_id)
 
                     if is_locked:
-                        await session.say("Too many failed attempts. Your admin access has been locked. Please reset your access code via the web application.", allow_interruptions=False)
+                        await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_NOW_LOCKED_MESSAGE, always=True)
+                        await say_with_cache(session, ADMIN_NOW_LOCKED_MESSAGE, tts_profile, allow_interruptions=False)
                         return
                     else:
-                        await session.say("Incorrect access code. Proceeding as a regular call.", allow_interruptions=True)
-                        await session.say(greeting, allow_interruptions=True)
+                        await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_INCORRECT_CODE_MESSAGE, always=True)
+                        await say_with_cache(session, ADMIN_INCORRECT_CODE_MESSAGE, tts_profile, allow_interruptions=True)
+                        await say_with_cache(session, greeting, tts_profile, allow_interruptions=True)
             else:
                 # No access code provided - proceed as regular call
-                await session.say("No access code provided. Proceeding as a regular call.", allow_interruptions=True)
-                await session.say(greeting, allow_interruptions=True)
+                await tts_audio_cache.prepare(session.tts, tts_profile, ADMIN_NO_CODE_MESSAGE, always=True)
+                await say_with_cache(session, ADMIN_NO_CODE_MESSAGE, tts_profile, allow_interruptions=True)
+                await say_with_cache(session, greeting, tts_profile, allow_interruptions=True)
     else:
         # For inbound calls, greet immediately
         # For outbound calls, wait for user to speak first
@@ -4089,9 +7047,11 @@ ADMIN MODE ACTIVATED:
             # Say greeting immediately when participant joins - use say() for instant response
             # (don't use generate_reply() which adds LLM latency)
             if greeting:
-                await session.say(greeting, allow_interruptions=True)
+                await say_with_cache(session, greeting, tts_profile, allow_interruptions=True)
                 logger.info("📞 Inbound call - Agent greeted caller (configured greeting)")
             else:
+                if isinstance(assistant, HydratingAgent):
+                    await assistant.wait_hydrated()
                 await session.generate_reply()
                 logger.info("📞 Inbound call - Agent greeted caller (LLM-generated)")
             log_call_state(ctx.room.name, "greeting_spoken", "agent", {"direction": "inbound"})
@@ -4117,23 +7077,21 @@ ADMIN MODE ACTIVATED:
             # Poll for pstn_joined_at — written by batch-conf-status when the PSTN callee answers.
             # This lets us speak the greeting immediately on answer instead of waiting for the callee
             # to say "Hello?" (saving 2-3s of VAD + LLM latency).
-            # Uses run_in_executor to avoid blocking the event loop during each synchronous DB call.
+            # Uses db_execute to avoid blocking the event loop during each synchronous DB call.
             pstn_joined = False
             call_failed = False
             TERMINAL_STATUSES = {'completed', 'failed', 'busy', 'no-answer', 'canceled'}
             if call_record_id:
                 logger.info(f"📞 Outbound: polling for PSTN answer (call_record_id={call_record_id})")
-                loop = asyncio.get_event_loop()
                 for _ in range(300):  # 300 × 0.2s = 60s timeout
                     await asyncio.sleep(0.2)
                     try:
-                        def _fetch_call_status():
-                            return supabase.table("call_records") \
-                                .select("pstn_joined_at, status") \
-                                .eq("id", call_record_id) \
-                                .single() \
-                                .execute()
-                        result = await loop.run_in_executor(None, _fetch_call_status)
+                        result = await db_execute(
+                            supabase.table("call_records")
+                            .select("pstn_joined_at, status")
+                            .eq("id", call_record_id)
+                            .single()
+                        )
                         if result.data:
                             if result.data.get("pstn_joined_at"):
                                 pstn_joined = True
@@ -4151,9 +7109,11 @@ ADMIN MODE ACTIVATED:
 
             if pstn_joined:
                 if greeting:
-                    await session.say(greeting, allow_interruptions=True)
+                    await say_with_cache(session, greeting, tts_profile, allow_interruptions=True)
                     logger.info("📞 Outbound greeting spoken immediately on PSTN join")
                 else:
+                    if isinstance(assistant, HydratingAgent):
+                        await assistant.wait_hydrated()
                     await session.generate_reply()
                     logger.info("📞 Outbound: LLM greeting spoken on PSTN join")
             elif call_failed:
@@ -4204,11 +7164,25 @@ if __name__ == "__main__":
         logger.info("🎬 Starting LiveKit agent worker...")
         logger.info(f"   → Agent Name: {agent_worker_name}")
         logger.info("   → Agent will join rooms automatically via LiveKit Cloud dispatch rules")
+        # Warm idle processes (VAD + turn detector already loaded) take new calls with no cold
+        # start. The pool was previously disabled over DuplexClosed errors; prewarm is now
+        # synchronous (the old async one never completed init) and the init timeout leaves
+        # headroom for model loading on slow hosts. AGENT_IDLE_PROCESSES=0 restores the old
+        # on-demand process spawning.
+        num_idle_processes = int(os.getenv("AGENT_IDLE_PROCESSES", "1"))
+
+        # Post-call work queued by job processes is drained here, in the long-lived worker
+        if POST_CALL_QUEUE_ENABLED:
+            start_post_call_consumer()
+
+        initialize_process_timeout = float(os.getenv("AGENT_PROCESS_INIT_TIMEOUT", "30"))
+        logger.info(f"   → Idle processes: {num_idle_processes} (init timeout {initialize_process_timeout}s)")
         cli.run_app(WorkerOptions(
             entrypoint_fnc=entrypoint,  # Called when agent joins a room
-            prewarm_fnc=prewarm,  # Called for explicit agent dispatch
+            prewarm_fnc=prewarm,  # Called once per process before it takes a job
             agent_name=agent_worker_name,
-            num_idle_processes=0  # Disable worker pool to avoid DuplexClosed errors
+            num_idle_processes=num_idle_processes,
+            initialize_process_timeout=initialize_process_timeout,
         ))
     except KeyboardInterrupt:
         logger.info("⚠️ Agent worker stopped by user (KeyboardInterrupt)")
@@ -0,0 +1,172 @@
+"""
+Test local PII redaction and transcript chunking.
+Run: cd agents/livekit-voice-agent && python test_pii_redaction.py
+"""
+import datetime
+import sys
+import os
+
+# Add parent path for imports
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+# ---- Test luhn_valid ----
+def test_luhn_valid():
+    from agent import luhn_valid
+
+    assert luhn_valid("4111111111111111")  # Visa test number
+    assert luhn_valid("5500005555555559")  # Mastercard test number
+    assert luhn_valid("79927398713")
+    assert not luhn_valid("4111111111111112")
+    assert not luhn_valid("79927398710")
+
+    print("  [PASS] luhn_valid")
+
+
+# ---- Test _classify_number ----
+def test_classify_number():
+    from agent import _classify_number
+
+    # Phone numbers, SSNs and account numbers (7-15 digits)
+    assert _classify_number("5551234") == "redact"
+    assert _classify_number("4155551234") == "redact"
+    assert _classify_number("14155551234") == "redact"
+    assert _classify_number("123456789") == "redact"
+
+    # Card numbers longer than 15 digits only when Luhn-valid
+    assert _classify_number("4111111111111111") == "redact"
+    assert _classify_number("4111111111111112") == "unknown"
+    assert _classify_number("12345678901234567890") == "unknown"
+
+    print("  [PASS] _classify_number")
+
+
+# ---- Test redact_pii_local ----
+def test_redact_pii_local_structured():
+    from agent import redact_pii_local, PII_PLACEHOLDER
+
+    text, _ = redact_pii_local("Caller: my email is jane.doe@example.com")
+    assert "jane.doe@example.com" not in text and PII_PLACEHOLDER in text
+
+    text, _ = redact_pii_local("Caller: it's jane dot doe at example dot com")
+    assert "example dot com" not in text
+
+    text, _ = redact_pii_local("Caller: my social is 123-45-6789")
+    assert "6789" not in text
+
+    text, _ = redact_pii_local("Caller: call me back at (415) 555-1234")
+    assert "555-1234" not in text
+
+    text, _ = redact_pii_local("Caller: the card is 4111 1111 1111 1111")
+    assert "1111" not in text
+
+    text, _ = redact_pii_local("Caller: I was born on March 3, 1985")
+    assert "1985" not in text and text.startswith("Caller: I was born on ")
+
+    text, _ = redact_pii_local("Caller: my postal code is M5V 3L9")
+    assert "M5V" not in text
+
+    text, _ = redact_pii_local("Caller: four one five five five five one two three four")
+    assert "four one five" not in text
+
+    print("  [PASS] redact_pii_local structured PII")
+
+
+def test_redact_pii_local_keeps_appointment_dates():
+    from agent import redact_pii_local
+
+    year = datetime.date.today().year
+    for sentence in (
+        f"it's at 10:30 on {year}-03-15",
+        f"see you on 03/15/{year}",
+        f"the visit is on March 15, {year + 1}",
+    ):
+        text, _ = redact_pii_local(f"agent: {sentence}")
+        assert text == f"agent: {sentence}", f"date should be kept: {text!r}"
+
+    # Dates well in the past are treated as birth dates
+    text, _ = redact_pii_local("caller: it was 1980-03-15")
+    assert "1980" not in text
+
+    print("  [PASS] redact_pii_local keeps recent and upcoming dates")
+
+
+def test_redact_pii_local_residual_risk():
+    from agent import redact_pii_local
+
+    # Names and addresses can't be found by patterns; these must go to the LLM pass
+    for line in (
+        "Agent: Thanks John, I'll send that over to you.",
+        "Caller: Hi, it's Sarah Connor calling about my order.",
+        "Caller: yeah i'm john smith",
+        "Caller: I live on Main Street",
+        "Caller: it's 42 elm road",
+    ):
+        text, residual = redact_pii_local(line)
+        assert residual, f"expected residual risk for {line!r}"
+
+    # Properly cased text with no names, addresses or unknown numbers needs no LLM pass
+    text, residual = redact_pii_local("Caller: What time do you open tomorrow?")
+    assert not residual
+    text, residual = redact_pii_local("Caller: My number is 415 555 1234.")
+    assert not residual and "555" not in text
+
+    # All lower-case transcription says nothing about names
+    text, residual = redact_pii_local("Caller: what time do you open tomorrow?")
+    assert residual
+
+    # Long numbers of unknown kind are left for the LLM
+    text, residual = redact_pii_local("caller: the reference is 12345678901234567890")
+    assert residual
+
+    assert redact_pii_local("") == ("", False)
+
+    print("  [PASS] redact_pii_local residual risk")
+
+
+# ---- Test chunk_transcript ----
+def test_chunk_transcript():
+    from agent import chunk_transcript, TranscriptBuffer
+
+    sep = TranscriptBuffer.SEPARATOR
+    turns = [f"{'Agent' if i % 2 else 'Caller'}: turn number {i} " + "x" * 40 for i in range(20)]
+    text = sep.join(turns)
+
+    chunks = chunk_transcript(text, max_tokens=50)  # ~200 characters per window
+    assert len(chunks) > 1
+    # Turns are never split and nothing is lost or reordered
+    assert sep.join(chunks) == text
+    for chunk in chunks:
+        for turn in chunk.split(sep):
+            assert turn in turns
+
+    # A single turn longer than the window is a window of its own
+    long_turn = "Caller: " + "y" * 1000
+    chunks = chunk_transcript(sep.join(["Agent: hi", long_turn, "Agent: bye"]), max_tokens=50)
+    assert long_turn in chunks
+
+    # Short transcripts stay in one window
+    assert chunk_transcript("Agent: hi" + sep + "Caller: hello") == ["Agent: hi" + sep + "Caller: hello"]
+
+    print("  [PASS] chunk_transcript")
+
+
+# ---- Run all tests ----
+if __name__ == "__main__":
+    print("\n=== PII Redaction Tests ===\n")
+
+    print("1. luhn_valid:")
+    test_luhn_valid()
+
+    print("\n2. _classify_number:")
+    test_classify_number()
+
+    print("\n3. redact_pii_local:")
+    test_redact_pii_local_structured()
+    test_redact_pii_local_keeps_appointment_dates()
+    test_redact_pii_local_residual_risk()
+
+    print("\n4. chunk_transcript:")
+    test_chunk_transcript()
+
+    print("\n=== All tests passed! ===\n")
@@ -0,0 +1,91 @@
+-- Migration: agent_config_version
+-- Created: 2026-03-16
+-- Description: Monotonic config_version on agent_configs. The LiveKit voice agent caches
+-- per-agent configuration (agent row, voice, dynamic variables, custom functions, transfer
+-- numbers, SMS templates/numbers, Cal.com connection) and revalidates the cache with a
+-- single primary-key lookup of this column instead of re-reading every table per call.
+
+ALTER TABLE agent_configs ADD COLUMN IF NOT EXISTS config_version BIGINT NOT NULL DEFAULT 1;
+
+COMMENT ON COLUMN agent_configs.config_version IS 'Bumped on any change to the agent or its related config rows; used for voice agent cache invalidation';
+
+-- Bump on direct edits to the agent row
+CREATE OR REPLACE FUNCTION bump_agent_config_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.config_version := COALESCE(OLD.config_version, 0) + 1;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_on_update ON agent_configs;
+CREATE TRIGGER bump_agent_config_version_on_update
+  BEFORE UPDATE ON agent_configs
+  FOR EACH ROW
+  WHEN (OLD.* IS DISTINCT FROM NEW.*)
+  EXECUTE FUNCTION bump_agent_config_version();
+
+-- Bump every agent owned by the user when a related config row changes.
+-- TG_ARGV[0] is the column on the changed row that holds the owning user's id.
+CREATE OR REPLACE FUNCTION bump_agent_config_version_for_user()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  old_user_id UUID;
+  new_user_id UUID;
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    old_user_id := (to_jsonb(OLD) ->> TG_ARGV[0])::uuid;
+  END IF;
+  IF TG_OP <> 'DELETE' THEN
+    new_user_id := (to_jsonb(NEW) ->> TG_ARGV[0])::uuid;
+  END IF;
+
+  UPDATE agent_configs
+  SET config_version = config_version + 1
+  WHERE user_id IN (old_user_id, new_user_id);
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_voices ON voices;
+CREATE TRIGGER bump_agent_config_version_voices
+  AFTER INSERT OR UPDATE OR DELETE ON voices
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_dynamic_variables ON dynamic_variables;
+CREATE TRIGGER bump_agent_config_version_dynamic_variables
+  AFTER INSERT OR UPDATE OR DELETE ON dynamic_variables
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_custom_functions ON custom_functions;
+CREATE TRIGGER bump_agent_config_version_custom_functions
+  AFTER INSERT OR UPDATE OR DELETE ON custom_functions
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_transfer_numbers ON transfer_numbers;
+CREATE TRIGGER bump_agent_config_version_transfer_numbers
+  AFTER INSERT OR UPDATE OR DELETE ON transfer_numbers
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_sms_templates ON sms_templates;
+CREATE TRIGGER bump_agent_config_version_sms_templates
+  AFTER INSERT OR UPDATE OR DELETE ON sms_templates
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_service_numbers ON service_numbers;
+CREATE TRIGGER bump_agent_config_version_service_numbers
+  AFTER INSERT OR UPDATE OR DELETE ON service_numbers
+  FOR EACH ROW EXECUTE FUNCTION bump_agent_config_version_for_user('user_id');
+
+DROP TRIGGER IF EXISTS bump_agent_config_version_cal_com ON users;
+CREATE TRIGGER bump_agent_config_version_cal_com
+  AFTER UPDATE OF cal_com_access_token ON users
+  FOR EACH ROW
+  WHEN (OLD.cal_com_access_token IS DISTINCT FROM NEW.cal_com_access_token)
+  EXECUTE FUNCTION bump_agent_config_version_for_user('id');
@@ -0,0 +1,167 @@
+-- Migration: inbound_call_context
+-- Created: 2026-03-17
+-- Description: Single round-trip bootstrap for inbound LiveKit calls. Replaces the voice
+-- agent's serial lookup chain (service_numbers -> default/any active agent ->
+-- external_sip_numbers -> Twilio call_record insert -> early call_record_id -> recent call
+-- direction -> agent correction -> agent_configs) with one RPC returning a JSON bundle.
+
+CREATE OR REPLACE FUNCTION get_inbound_call_context(
+  p_trunk_number TEXT,
+  p_call_sid TEXT DEFAULT NULL,
+  p_room_name TEXT DEFAULT NULL,
+  p_caller_number TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_call_id TEXT := COALESCE(p_call_sid, p_room_name);
+  v_user_id UUID;
+  v_agent_id UUID;
+  v_outbound_agent_id UUID;
+  v_number_source TEXT;
+  v_call_record_id UUID;
+  v_recent_call JSONB;
+  v_corrected_agent_id UUID;
+  v_final_agent_id UUID;
+  v_agent_config JSONB;
+BEGIN
+  -- 1. Owner and agent from the dialed number (SignalWire numbers first)
+  SELECT sn.user_id, sn.agent_id, sn.outbound_agent_id
+  INTO v_user_id, v_agent_id, v_outbound_agent_id
+  FROM service_numbers sn
+  WHERE sn.phone_number = p_trunk_number
+    AND sn.is_active = TRUE
+  LIMIT 1;
+
+  IF FOUND THEN
+    v_number_source := 'service_numbers';
+
+    -- No agent assigned to the number: user's default agent, then first active agent
+    IF v_agent_id IS NULL THEN
+      SELECT ac.id INTO v_agent_id
+      FROM agent_configs ac
+      WHERE ac.user_id = v_user_id
+        AND ac.is_default = TRUE
+      LIMIT 1;
+    END IF;
+
+    IF v_agent_id IS NULL THEN
+      SELECT ac.id INTO v_agent_id
+      FROM agent_configs ac
+      WHERE ac.user_id = v_user_id
+        AND ac.is_active = TRUE
+      ORDER BY ac.created_at ASC
+      LIMIT 1;
+    END IF;
+  ELSE
+    -- 2. External trunks (Twilio, etc.)
+    SELECT esn.user_id INTO v_user_id
+    FROM external_sip_numbers esn
+    WHERE esn.phone_number = p_trunk_number
+      AND esn.is_active = TRUE
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+      RETURN jsonb_build_object('user_id', NULL);
+    END IF;
+
+    v_number_source := 'external_sip';
+
+    -- External trunk inbound calls have no call_record yet; create it from LiveKit data
+    IF v_call_id IS NOT NULL THEN
+      INSERT INTO call_records (
+        user_id, caller_number, contact_phone, service_number, call_sid, livekit_call_id,
+        direction, status, disposition, telephony_vendor, call_source, started_at
+      ) VALUES (
+        v_user_id, COALESCE(p_caller_number, 'unknown'), COALESCE(p_caller_number, 'unknown'),
+        p_trunk_number, v_call_id, v_call_id,
+        'inbound', 'in-progress', 'answered_by_pat', 'twilio', 'external_trunk', now()
+      )
+      RETURNING id INTO v_call_record_id;
+    END IF;
+  END IF;
+
+  -- 3. Early call_record_id for real-time transcript streaming
+  IF v_call_record_id IS NULL AND v_call_id IS NOT NULL THEN
+    SELECT cr.id INTO v_call_record_id
+    FROM call_records cr
+    WHERE cr.livekit_call_id = v_call_id
+    LIMIT 1;
+  END IF;
+
+  IF v_call_record_id IS NULL THEN
+    SELECT cr.id INTO v_call_record_id
+    FROM call_records cr
+    WHERE cr.user_id = v_user_id
+      AND cr.service_number = p_trunk_number
+      AND cr.created_at >= now() - INTERVAL '2 minutes'
+    ORDER BY cr.created_at DESC
+    LIMIT 1;
+  END IF;
+
+  -- 4. Most recent call (last 60s) for direction and template context.
+  -- Matching service_number first, then any number (bridged outbound, where the
+  -- LiveKit trunk number differs from the caller ID).
+  SELECT to_jsonb(r) INTO v_recent_call
+  FROM (
+    SELECT cr.direction, cr.contact_phone, cr.service_number, cr.call_purpose, cr.call_goal, cr.call_variables
+    FROM call_records cr
+    WHERE cr.service_number = p_trunk_number
+      AND cr.user_id = v_user_id
+      AND cr.created_at >= now() - INTERVAL '60 seconds'
+    ORDER BY cr.created_at DESC
+    LIMIT 1
+  ) r;
+
+  IF v_recent_call IS NULL THEN
+    SELECT to_jsonb(r) INTO v_recent_call
+    FROM (
+      SELECT cr.direction, cr.contact_phone, cr.service_number, cr.call_purpose, cr.call_goal, cr.call_variables
+      FROM call_records cr
+      WHERE cr.user_id = v_user_id
+        AND cr.created_at >= now() - INTERVAL '60 seconds'
+      ORDER BY cr.created_at DESC
+      LIMIT 1
+    ) r;
+
+    -- The dispatch rule can carry the wrong agent for bridged calls; use the one on the record's number
+    IF v_recent_call ->> 'service_number' IS NOT NULL THEN
+      SELECT sn.agent_id INTO v_corrected_agent_id
+      FROM service_numbers sn
+      WHERE sn.phone_number = v_recent_call ->> 'service_number'
+        AND sn.user_id = v_user_id
+      LIMIT 1;
+    END IF;
+  END IF;
+
+  -- 5. Agent that will handle the call (dedicated outbound agent for outbound calls)
+  v_final_agent_id := COALESCE(v_corrected_agent_id, v_agent_id);
+  IF COALESCE(v_recent_call ->> 'direction', 'inbound') = 'outbound' AND v_outbound_agent_id IS NOT NULL THEN
+    v_final_agent_id := v_outbound_agent_id;
+  END IF;
+
+  IF v_final_agent_id IS NOT NULL THEN
+    SELECT to_jsonb(ac) INTO v_agent_config
+    FROM agent_configs ac
+    WHERE ac.id = v_final_agent_id;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'user_id', v_user_id,
+    'agent_id', v_agent_id,
+    'outbound_agent_id', v_outbound_agent_id,
+    'number_source', v_number_source,
+    'call_record_id', v_call_record_id,
+    'recent_call', v_recent_call,
+    'corrected_agent_id', v_corrected_agent_id,
+    'agent_config', v_agent_config
+  );
+END;
+$$;
+
+COMMENT ON FUNCTION get_inbound_call_context IS 'Resolves user, agent, call record, direction and agent config for an inbound LiveKit SIP call in one round-trip';
+
+REVOKE EXECUTE ON FUNCTION get_inbound_call_context(TEXT, TEXT, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION get_inbound_call_context(TEXT, TEXT, TEXT, TEXT) TO service_role;
@@ -0,0 +1,48 @@
+-- Migration: append_call_transcript
+-- Created: 2026-03-18
+-- Description: Delta-only transcript streaming for the LiveKit voice agent. Instead of
+-- rewriting call_records.transcript with the full text every few seconds, the agent
+-- appends only the turns it hasn't sent yet. transcript_segment_count tracks how many
+-- turns are stored so retries and out-of-order writes can't duplicate or drop turns.
+
+ALTER TABLE call_records ADD COLUMN IF NOT EXISTS transcript_segment_count INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN call_records.transcript_segment_count IS 'Number of transcript turns appended by the voice agent during the call (append_call_transcript)';
+
+-- Append p_segments to the transcript if the stored turn count equals p_from_segment.
+-- Returns the stored turn count afterwards; a value other than
+-- p_from_segment + array_length(p_segments) means nothing was appended and the caller should resync.
+CREATE OR REPLACE FUNCTION append_call_transcript(
+  p_call_record_id UUID,
+  p_from_segment INTEGER,
+  p_segments TEXT[]
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE call_records
+  SET transcript = CASE
+        WHEN COALESCE(transcript, '') = '' THEN array_to_string(p_segments, E'\n\n')
+        ELSE transcript || E'\n\n' || array_to_string(p_segments, E'\n\n')
+      END,
+      transcript_segment_count = transcript_segment_count + COALESCE(array_length(p_segments, 1), 0)
+  WHERE id = p_call_record_id
+    AND transcript_segment_count = p_from_segment
+  RETURNING transcript_segment_count INTO v_count;
+
+  IF NOT FOUND THEN
+    SELECT transcript_segment_count INTO v_count
+    FROM call_records
+    WHERE id = p_call_record_id;
+  END IF;
+
+  RETURN v_count;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION append_call_transcript(UUID, INTEGER, TEXT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION append_call_transcript(UUID, INTEGER, TEXT[]) TO service_role;
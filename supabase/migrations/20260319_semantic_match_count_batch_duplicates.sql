@@ -0,0 +1,18 @@
+-- Migration: semantic_match_count_batch_duplicates
+-- Created: 2026-03-19
+-- Description: The LiveKit voice agent now batches semantic match counter updates from
+-- several calls into one increment_semantic_match_count_batch call, so the same memory
+-- can appear more than once in memory_ids. Count every occurrence instead of adding 1
+-- per distinct id. Callers passing distinct ids (SMS webhook) see no change.
+
+CREATE OR REPLACE FUNCTION increment_semantic_match_count_batch(memory_ids UUID[])
+RETURNS void LANGUAGE sql AS $$
+  UPDATE conversation_contexts cc
+  SET semantic_match_count = COALESCE(cc.semantic_match_count, 0) + m.matches
+  FROM (
+    SELECT id, COUNT(*) AS matches
+    FROM unnest(memory_ids) AS id
+    GROUP BY id
+  ) m
+  WHERE cc.id = m.id;
+$$;
@@ -0,0 +1,53 @@
+-- Migration: record_caller_interaction
+-- Created: 2026-03-20
+-- Description: The LiveKit voice agent updates caller memory from a durable post-call queue,
+-- possibly long after the call and alongside SMS webhook updates or another call from the
+-- same caller. Incrementing interaction_count from a value read earlier loses those
+-- concurrent updates, so the merged summary, topics, embedding, interaction_count and
+-- last_call_ids are now written in one statement. A call already listed in last_call_ids
+-- is not applied again, so retried jobs are safe.
+
+-- Apply a call's merged memory to the context row and count it as one more interaction,
+-- keeping p_call_record_id in last_call_ids (most recent first, 5 kept). Nothing is written
+-- when the call is already listed. p_embedding NULL keeps the stored embedding.
+-- Returns the interaction_count afterwards.
+CREATE OR REPLACE FUNCTION record_caller_interaction(
+  p_context_id UUID,
+  p_call_record_id UUID,
+  p_summary TEXT,
+  p_key_topics TEXT[],
+  p_embedding vector(1536) DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  UPDATE conversation_contexts
+  SET summary = p_summary,
+      key_topics = p_key_topics,
+      embedding = COALESCE(p_embedding, embedding),
+      last_updated = NOW(),
+      interaction_count = COALESCE(interaction_count, 0) + 1,
+      last_call_ids = CASE
+        WHEN p_call_record_id IS NULL THEN last_call_ids
+        ELSE (ARRAY[p_call_record_id] || COALESCE(last_call_ids, '{}'))[1:5]
+      END
+  WHERE id = p_context_id
+    AND (p_call_record_id IS NULL OR NOT (p_call_record_id = ANY(COALESCE(last_call_ids, '{}'))))
+  RETURNING interaction_count INTO v_count;
+
+  IF NOT FOUND THEN
+    SELECT interaction_count INTO v_count
+    FROM conversation_contexts
+    WHERE id = p_context_id;
+  END IF;
+
+  RETURN v_count;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION record_caller_interaction(UUID, UUID, TEXT, TEXT[], vector) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION record_caller_interaction(UUID, UUID, TEXT, TEXT[], vector) TO service_role;